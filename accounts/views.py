@@ -22,6 +22,12 @@ def test_func(self):
     return str(self.request.user.id) == self.request.get_full_path().split("/")[2]  # true or false
 
 
+# function returning the user whose details are being requested, who test_func made sure is the one making the request
+# the user was already loaded along with the request, so there is no need to query the database again
+def get_object(self):
+    return self.request.user
+
+
 class SignUpView(generic.CreateView):  # sign up view
     model = User  # User instance from models defined by Django
     form_class = UserCreationForm  # UserCreationForm instance from models defined by Django
@@ -50,6 +56,9 @@ class DetailView(LoginRequiredMixin, UserPassesTestMixin, generic.DetailView):
     # tests if  user making the request is the same one whose details are being requested
     def test_func(self): return test_func(self)
 
+    # returns the user making the request, see get_object above
+    def get_object(self, queryset=None): return get_object(self)
+
 
 # delete view of specific user
 # only logged-in users can access this view
@@ -71,6 +80,9 @@ class DeleteView(LoginRequiredMixin, UserPassesTestMixin, generic.DeleteView):
     def test_func(self):
         return test_func(self)
 
+    # returns the user making the request, see get_object above
+    def get_object(self, queryset=None): return get_object(self)
+
 
 # update email view of specific user
 # only logged-in users can access this view
@@ -89,3 +101,6 @@ class UpdateEmailView(LoginRequiredMixin, UserPassesTestMixin, generic.UpdateVie
 
     # tests if  user making the request is the same one whose details are being requested
     def test_func(self): return test_func(self)
+
+    # returns the user making the request, see get_object above
+    def get_object(self, queryset=None): return get_object(self)
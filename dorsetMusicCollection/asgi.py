@@ -1,7 +1,8 @@
 """
 ASGI config for dorsetMusicCollection project.
 
-It exposes the ASGI callable as a module-level variable named ``application``.
+It exposes the ASGI callable as a module-level variable named ``application``, which also
+serves the live results streams of the app polls (see polls/streams.py).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -13,4 +14,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dorsetMusicCollection.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once Django is set up, as it needs the apps to be ready
+from polls.streams import with_results_streams  # noqa: E402
+
+application = with_results_streams(django_application)  # live results streams are served ahead of Django
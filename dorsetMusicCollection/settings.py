@@ -119,3 +119,58 @@ SESSION_COOKIE_SECURE = True  # session cookie is only sent with an HTTPS connec
 SECURE_HSTS_SECONDS = 2592000  # browser to refuse to connect via an insecure connection for 30 days
 SECURE_HSTS_INCLUDE_SUBDOMAINS = True  # all subdomains included in the above
 SECURE_HSTS_PRELOAD = True  # domain to be submitted to browser preload list
+
+# Discogs API
+# client used to query Discogs, polls.fake_discogs offers offline stand-ins for tests and benchmarks, e.g.:
+# DISCOGS_CLIENT = 'polls.fake_discogs.ReplayClient'
+# DISCOGS_CLIENT_OPTIONS = {'directory': BASE_DIR / 'fixtures' / 'discogs'}
+DISCOGS_CLIENT = 'discogs_client.Client'
+DISCOGS_CLIENT_OPTIONS = {}  # keyword arguments passed to the client on top of the user token
+DISCOGS_FETCH_CONCURRENCY = 4  # maximum number of result pages fetched at the same time when creating a poll
+DISCOGS_SORTED_CRAWL = True  # stop crawling once the top 10 is settled, where the client can sort by popularity
+DISCOGS_RATE_LIMIT = 60  # requests per minute allowed by Discogs, shared by all threads of each process
+DISCOGS_POOL_SIZE = 10  # keep-alive connections to Discogs kept open by each process
+DISCOGS_MAX_RETRIES = 5  # times a request is tried again after Discogs answers 429 (too many requests)
+DISCOGS_CACHE_DIR = BASE_DIR / 'discogs_cache'  # where search results are cached, None disables the cache
+DISCOGS_CACHE_TTL = 60 * 60 * 24  # seconds a cached search stays valid for
+DISCOGS_CACHE_MAX_ENTRIES = 1000  # number of (genre, year) searches kept before evicting the least recently used
+
+# Poll-creation jobs
+POLLS_JOB_WORKERS = 2  # worker threads creating polls inside each web process, 0 leaves jobs to run_poll_jobs
+POLLS_JOB_TIMEOUT = 60 * 10  # seconds after which a running job is considered abandoned and queued again
+POLLS_JOBS_EAGER = False  # if True, polls are created within the request itself (useful for tests)
+POLLS_CREATE_BUDGET = 20  # seconds a new poll waits for Discogs before being built from the pages it got, None waits
+POLLS_PARTIAL_TOP_UP = True  # if True, polls built from part of the results are completed by a background job
+POLLS_LOCK_DIR = BASE_DIR / 'poll_locks'  # lock files coalescing identical creations across processes, None disables
+POLLS_LOCK_TIMEOUT = 120  # seconds a creation waits for an identical one before crawling anyway
+POLLS_AVAILABILITY_TTL = 60 * 10  # seconds the combinations without albums are cached for, see polls/availability.py
+
+# Polls index
+POLLS_PAGE_SIZE = 20  # polls listed per page of the index, further pages are loaded on demand
+
+# Rendered pages and fragments, see polls/pagecache.py
+CACHES = {
+    'default': {  # local memory of each process, a FileBasedCache would share entries between processes
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},  # entries kept before culling, pages and rankings of as many polls
+    },
+    'versions': {  # shared by every process of this host, use Memcached or Redis to share it between hosts
+        'BACKEND': 'polls.cachebackends.UnculledFileCache',
+        'LOCATION': BASE_DIR / 'poll_versions',
+    },
+}
+POLLS_PAGE_CACHE = 'default'  # cache holding the pages and fragments, each process may have its own
+POLLS_VERSION_CACHE = 'versions'  # cache holding the versions they are keyed by, which every process must share
+POLLS_PAGE_CACHE_TTL = 60 * 60  # seconds a page or fragment is cached for, unless its polls change earlier
+
+# Votes
+POLLS_VOTE_BUFFER = False  # if True, votes are added up in memory and written in batches, see polls/votes.py
+POLLS_VOTE_FLUSH_SIZE = 100  # buffered votes that trigger a write, at most this many are lost if a process dies
+POLLS_VOTE_FLUSH_INTERVAL = 1.0  # seconds a buffered vote waits before being written at the latest
+POLLS_VOTE_SHARDS = 0  # counter rows each choice's votes are spread across, 0 or 1 counts them on the choice itself
+POLLS_VOTE_TOTALS_TTL = 2  # seconds the results of polls with sharded votes are cached for
+POLLS_RANKING_TTL = 60 * 60  # seconds the results of other polls are cached for, unless a vote drops them earlier
+POLLS_VOTE_EVENTS = True  # if True, every vote is also appended to the vote log, see polls/analytics.py
+POLLS_STREAM_INTERVAL = 0.25  # seconds between pushes of new votes to the live results of a poll
+POLLS_STREAM_RESYNC = 15  # seconds between full vote counts pushed to the live results, with votes of other processes
+POLLS_ROLLUP_LAG = 5  # seconds a logged vote waits before being rolled up, so that slower commits are not skipped
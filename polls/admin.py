@@ -1,11 +1,16 @@
 from django.contrib import admin
 
-from .models import Choice, Question
+from .models import Choice, PollJob, Question
+from .results import with_total_votes
 
 
 class ChoiceInline(admin.TabularInline):
     model = Choice
     extra = 3
+    readonly_fields = ['total_votes']  # votes still in shards are not part of the votes field yet
+
+    def get_queryset(self, request):  # adds up the shards of every choice at once, rather than one query each
+        return with_total_votes(super().get_queryset(request))
 
 
 class QuestionAdmin(admin.ModelAdmin):
@@ -14,9 +19,23 @@ class QuestionAdmin(admin.ModelAdmin):
         ('Date information', {'fields': ['pub_date'], 'classes': ['collapse']}),
     ]
     inlines = [ChoiceInline]
-    list_display = ('text', 'pub_date', 'was_published_recently')
-    list_filter = ['pub_date']
+    list_display = ('text', 'pub_date', 'was_published_recently', 'partial')
+    list_filter = ['pub_date', 'partial']
     search_fields = ['text']
+    ordering = ['-pub_date', '-id']  # the order of the indexes on pub_date, which the filters can then use
+    show_full_result_count = False  # filtered lists do not count every poll as well
 
 
 admin.site.register(Question, QuestionAdmin)
+
+
+class PollJobAdmin(admin.ModelAdmin):
+    list_display = ('genre', 'year', 'status', 'question', 'created', 'updated')
+    list_filter = ['status']
+    ordering = ['-created']  # the order of the index on status and created, which the filter can then use
+    show_full_result_count = False  # filtered lists do not count every job as well
+    readonly_fields = ['question', 'error', 'created', 'updated']
+    list_select_related = ['question']  # the poll of every job listed comes with the jobs, in the same query
+
+
+admin.site.register(PollJob, PollJobAdmin)
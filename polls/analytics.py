@@ -0,0 +1,70 @@
+"""
+This file defines the vote analytics of the app polls.
+Every vote is appended to the vote log (VoteEvent), which is never updated or read by the pages.
+Instead, rollup_vote_events adds up the votes logged since it last ran into per-choice hourly and
+daily totals (VoteRollup), and records how far it got in a watermark, so each run only reads the
+new events. The pages then read those totals, whose size does not grow with the number of votes.
+
+Event ids are handed out before their transaction commits, so an event may become visible after
+one with a higher id. Only events older than POLLS_ROLLUP_LAG seconds are rolled up, which gives
+such stragglers time to commit before the watermark moves past them.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import RollupWatermark, VoteEvent, VoteRollup
+from .results import invalidate_rankings
+
+WATERMARK = 'votes'  # name of the watermark of rollup_vote_events
+TRUNCATE = {VoteRollup.HOUR: TruncHour, VoteRollup.DAY: TruncDay}  # period -> function truncating times to it
+
+
+# adds up at most "batch_size" vote events not rolled up yet, returns how many were added up
+# the watermark is locked for the whole run, so concurrent runs cannot add up the same events twice
+def rollup_vote_events(batch_size=10000):
+    settled = timezone.now() - datetime.timedelta(seconds=settings.POLLS_ROLLUP_LAG)
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+        watermark = RollupWatermark.objects.select_for_update().get(pk=watermark.pk)
+        ids = list(VoteEvent.objects.filter(pk__gt=watermark.last_event, created__lt=settled)
+                   .order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        events = VoteEvent.objects.filter(pk__gt=watermark.last_event, pk__lte=ids[-1])
+        questions = set()  # questions whose votes of the last day may have changed
+        for period, truncate in TRUNCATE.items():
+            counts = (events.annotate(start=truncate('created')).values('question_id', 'choice_id', 'start')
+                      .annotate(votes=Count('pk')).order_by())
+            new = []  # periods that have no total yet
+            for count in counts:
+                questions.add(count['question_id'])
+                updated = VoteRollup.objects.filter(choice_id=count['choice_id'], period=period,
+                                                    start=count['start']).update(votes=F('votes') + count['votes'])
+                if not updated:
+                    new.append(VoteRollup(period=period, **count))
+            VoteRollup.objects.bulk_create(new)
+        watermark.last_event = ids[-1]
+        watermark.save()
+    invalidate_rankings(*questions)  # their results show the votes of the last day
+    return len(ids)
+
+
+# returns the hourly or daily totals of a question since the given time, as (start, votes) pairs
+# with a choice, only its own votes are counted
+def vote_activity(question, period, since, choice=None):
+    rollups = VoteRollup.objects.filter(question=question, period=period, start__gte=since)
+    if choice is not None:
+        rollups = rollups.filter(choice=choice)
+    return list(rollups.values('start').annotate(votes=Sum('votes')).order_by('start').values_list('start', 'votes'))
+
+
+# returns how many vote events are waiting to be rolled up
+def rollup_backlog():
+    watermark = RollupWatermark.objects.filter(name=WATERMARK).first()
+    return VoteEvent.objects.filter(pk__gt=watermark.last_event if watermark else 0).count()
@@ -0,0 +1,90 @@
+"""
+This file defines the read-only JSON API of the app polls, for dashboards and other clients that
+would otherwise read the HTML pages: the list of polls, most recent first and paginated like the
+index (see polls/pagination.py), and the details and the results of each poll.
+
+Responses are compact: no whitespace, and fields left empty are omitted. Each carries a strong ETag,
+a digest of its path and of the versions of the polls it shows (see polls/pagecache.py), which are
+bumped whenever a poll, its albums or its votes change, and "Cache-Control: no-cache", so that clients
+revalidate it every time. The versions are shared by every process, so the tag is the same whichever
+process answers, and changes as soon as any of them handles a change. Clients sending it back in
+If-None-Match are answered 304 Not Modified from those versions alone, without a single query.
+Rendered responses are cached under the same versions, for every client, as none of them is personal.
+"""
+
+import functools
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+
+from .models import Choice, Question
+from .pagecache import get_page_cache
+from .pagination import keyset_page
+from .results import ranked_choices
+
+FIELDS = {  # kind of record -> fields it is serialized with, in this order
+    'question': ('id', 'genre', 'year', 'text', 'pub_date', 'partial'),
+    'choice': ('id', 'title', 'artist', 'year', 'country', 'genres', 'image', 'url'),
+    'result': ('id', 'title', 'artist', 'votes', 'rank'),
+}
+
+
+def compact(record, kind):  # returns the fields of a model instance or dictionary, without the empty ones
+    values = ((field, record[field] if isinstance(record, dict) else getattr(record, field)) for field in FIELDS[kind])
+    return {field: value for field, value in values if value is not None and value != ''}
+
+
+def json_response(data):  # returns data as JSON, without any whitespace
+    return JsonResponse(data, json_dumps_params={'separators': (',', ':')})
+
+
+# decorator answering GET and HEAD requests with the response of a view, tagged by the versions it was rendered from
+# pages of a single poll, whose URL names it "pk", are tagged by its version, others by that of the list of polls
+# the tag is taken before rendering, so that a response rendered while its poll changes is never newer than its tag
+def versioned(view):
+    @functools.wraps(view)
+    @require_safe
+    def wrapper(request, *args, **kwargs):
+        page_cache = get_page_cache()
+        question_ids = [kwargs['pk']] if 'pk' in kwargs else []
+        versions = page_cache.versions(*question_ids)
+        if None in versions:  # no such poll, left to the view to answer 404 without any tag
+            return view(request, *args, **kwargs)
+        key = page_cache.key('api', request.get_full_path(), versions[1:] if question_ids else versions)
+        etag = f'"{key.rsplit(":", 1)[1]}"'  # the digest of the key
+        response = get_conditional_response(request, etag=etag)  # 304 if the client has this version already
+        if response is None:
+            response = page_cache.get_page(key)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            page_cache.set_page(key, request, response)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'
+        return response
+
+    return wrapper
+
+
+@versioned
+def index(request):  # a page of polls, most recent first, and the cursor of the next page, null if it is the last
+    questions, next_cursor = keyset_page(Question.objects.all(), request.GET.get('after'), settings.POLLS_PAGE_SIZE)
+    return json_response({'polls': [compact(question, 'question') for question in questions], 'next': next_cursor})
+
+
+@versioned
+def detail(request, pk):  # a poll and its albums
+    question = get_object_or_404(Question, pk=pk)  # if question cannot be found renders 404 page
+    choices = Choice.objects.filter(question=question).order_by('pk').values(*FIELDS['choice'])
+    return json_response({**compact(question, 'question'),
+                          'choices': [compact(choice, 'choice') for choice in choices]})
+
+
+@versioned
+def results(request, pk):  # the albums of a poll, most voted first, with their votes and rank
+    question = get_object_or_404(Question, pk=pk)  # if question cannot be found renders 404 page
+    return json_response({'id': question.pk,
+                          'results': [compact(choice, 'result') for choice in ranked_choices(question)]})
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PollsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls'
+
+    def ready(self):
+        from . import pagecache  # noqa: F401, connects the receivers that bump the versions of cached pages
+        from . import search  # also connects the receivers that keep the search index up to date
+
+        post_migrate.connect(search.migrated, sender=self)  # the search table is not a model, migrate skips it
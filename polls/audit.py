@@ -0,0 +1,141 @@
+"""
+This file defines the query audit of the app polls, which requests the main pages of the app and
+of its admin against a large synthetic dataset and asks the database how it executes every query
+they make (EXPLAIN). Queries that read a whole table, or walk a whole index without a LIMIT to
+stop them, are flagged: they get slower as the polls grow, and usually mean an index is missing.
+
+It is run by the management command "audit_queries", which seeds a freshly created test database,
+so it never reads or changes the data of the configured database.
+"""
+
+import datetime
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Choice, PollJob, Question, VoteRollup
+from .pagination import encode_cursor
+
+SAMPLE = ('Grunge', 1991)  # genre and year of the poll the pages are requested for, offered by the creation form
+
+PAGES = {  # name -> function returning the (method, path, data) of a request, given the sample poll
+    'index': lambda question: ('get', reverse('polls:index'), {}),
+    'index, later page': lambda question: ('get', reverse('polls:index_page'), {'after': encode_cursor(question)}),
+    'detail': lambda question: ('get', reverse('polls:detail', args=(question.pk,)), {}),
+    'results': lambda question: ('get', reverse('polls:results', args=(question.pk,)), {}),
+    'activity': lambda question: ('get', reverse('polls:activity', args=(question.pk,)), {}),
+    'create, existing poll': lambda question: ('post', reverse('polls:create'),
+                                               {'genre': question.genre, 'year': question.year}),
+    'create, new poll': lambda question: ('post', reverse('polls:create'), {'genre': question.genre, 'year': 1992}),
+    'admin polls, published this week': lambda question: (
+        'get', reverse('admin:polls_question_changelist'),
+        {'pub_date__gte': (timezone.now() - datetime.timedelta(days=7)).isoformat()}),
+    'admin polls, partial': lambda question: ('get', reverse('admin:polls_question_changelist'),
+                                              {'partial__exact': 1}),
+    'admin poll': lambda question: ('get', reverse('admin:polls_question_change', args=(question.pk,)), {}),
+    'admin jobs, queued': lambda question: ('get', reverse('admin:polls_polljob_changelist'),
+                                            {'status__exact': PollJob.QUEUED}),
+}
+# SQLite's plan step reading a whole table, or index, rather than a subquery's few rows
+SCAN = re.compile(r'SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?$')
+
+
+# fills the database with "questions" polls of 10 albums each, a vote rollup for each album and a job for each poll
+# a tenth of the polls are partial, and the jobs are mostly done, as they would be on a long-running site
+# returns the sample poll, whose choices have votes and activity
+def seed(questions=100000, batch_size=10000):
+    now = timezone.now()
+    for first in range(0, questions, batch_size):  # in batches, so that millions of albums fit in memory
+        last = min(first + batch_size, questions)
+        polls = Question.objects.bulk_create(
+            Question(genre=f'Genre {i // 1000}', year=i % 1000, text=f'Poll {i}', partial=i % 10 == 0,
+                     pub_date=now - datetime.timedelta(minutes=i)) for i in range(first, last))
+        choices = Choice.objects.bulk_create(
+            Choice(question=poll, title=f'Album {i}.{j}', artist=f'Artist {i % 5000}', votes=(i * j) % 50)
+            for i, poll in enumerate(polls, first) for j in range(10))
+        VoteRollup.objects.bulk_create(
+            VoteRollup(question_id=choice.question_id, choice=choice, period=VoteRollup.HOUR, votes=1,
+                       start=now.replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=i % 48))
+            for i, choice in enumerate(choices))
+        PollJob.objects.bulk_create(
+            PollJob(genre=poll.genre, year=poll.year, question=poll, status=PollJob.DONE if i % 100 else PollJob.QUEUED,
+                    created=poll.pub_date) for i, poll in enumerate(polls, first))
+    genre, year = SAMPLE
+    question = Question.objects.create(genre=genre, year=year, text=f'What is the best {genre} album of {year}?')
+    Choice.objects.bulk_create(Choice(question=question, title=f'Album {j}', votes=j) for j in range(10))
+    analyze()
+    return question
+
+
+def analyze():  # refreshes the statistics the database plans queries with, as it would have on a real site
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('ANALYZE')
+        elif connection.vendor == 'mysql':
+            tables = [model._meta.db_table for model in (Question, Choice, VoteRollup, PollJob)]
+            cursor.execute(f'ANALYZE TABLE {", ".join(tables)}')
+
+
+# returns the steps of the plan the database chose for a query, as text, one per table or index read
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[3] for row in cursor.fetchall()]
+        if connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}')
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [f'{row["table"]} type={row["type"]} key={row["key"]} rows={row["rows"]}' for row in rows]
+    raise NotImplementedError(f'Query plans of the {connection.vendor} backend cannot be read.')
+
+
+def partial_indexes():  # names of the indexes of the app that only hold the rows matching a condition
+    return {index.name for model in apps.get_app_config('polls').get_models() for index in model._meta.indexes
+            if index.condition is not None}
+
+
+# returns the steps of a query's plan that read a whole table, or a whole index without a LIMIT
+# reading the whole of a partial index is fine, as it only holds the rows the query asks for
+def full_scans(sql, plan):
+    limited = re.search(r'\bLIMIT\b', sql, re.IGNORECASE) is not None
+    flagged = []
+    for step in plan:
+        if connection.vendor == 'sqlite':
+            match = SCAN.match(step)
+            if match is None:
+                continue
+            index = match.group(2)  # None if the table itself is read
+            if index is None or not limited and index not in partial_indexes():
+                flagged.append(step)
+        elif ' type=ALL ' in step or (' type=index ' in step and not limited):
+            flagged.append(step)
+    return flagged
+
+
+# requests every page of PAGES for the sample poll and explains each query they make
+# returns the rows of the audit: page, query, the steps of its plan, and those flagged as full scans
+@override_settings(POLLS_JOB_WORKERS=0, POLLS_JOBS_EAGER=False)  # new polls stay queued, Discogs is never called
+def audit(question):
+    client = Client()
+    client.force_login(User.objects.create_superuser(username='audit'))
+    results = []
+    for name, request in PAGES.items():
+        method, path, data = request(question)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(path, data, SERVER_NAME=settings.ALLOWED_HOSTS[0], secure=True)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name}: {method.upper()} {path} answered {response.status_code}')
+        for query in queries:
+            sql = query['sql']
+            if sql.lstrip().upper().startswith('SELECT'):
+                plan = query_plan(sql)
+                results.append((name, sql, plan, full_scans(sql, plan)))
+    return results
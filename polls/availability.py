@@ -0,0 +1,110 @@
+"""
+This file defines the availability index of the app polls: how many albums Discogs has for each
+combination of genre and year, so that the creation form can disable the combinations it has none
+for, and reject them without creating a job or querying Discogs.
+
+The index is built offline, in bulk, by the management command "build_availability", from whatever
+has already been fetched from Discogs: the entries of the search cache (polls/cache.py), the searches
+recorded for ReplayClient (polls/fake_discogs.py) and the existing polls. Combinations nobody has
+searched for yet are not in the index and stay available. Searches finding no album at all while
+creating a poll add their combination to the index as they happen.
+
+The combinations without albums are read from the database in a single query, through a partial
+index holding them alone, and cached for POLLS_AVAILABILITY_TTL seconds.
+"""
+
+import collections
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Availability, Question
+from .pagecache import bump_versions
+
+EMPTY_KEY = 'polls:availability:empty'  # cache key of the combinations without albums
+
+
+# returns the number of albums of every search in the search cache, as (genre, year, albums)
+# expired entries are counted too, Discogs rarely loses albums
+def cached_counts(cache_directory):
+    for path in Path(cache_directory).glob('*.jsonl'):
+        try:
+            with open(path, encoding='utf-8') as file:
+                header = json.loads(file.readline() or '{}')
+                albums = sum(1 for _ in file)
+        except FileNotFoundError:  # evicted meanwhile
+            continue
+        if 'style' in header:
+            yield header['style'], int(header['year']), albums
+
+
+# returns the number of albums of every search recorded for ReplayClient, as (genre, year, albums)
+def recorded_counts(directory):
+    for path in Path(directory).glob('*.json'):
+        with open(path, encoding='utf-8') as file:
+            recording = json.load(file)
+        yield recording['style'], int(recording['year']), recording['items']
+
+
+# returns the number of choices of every existing poll, as (genre, year, albums)
+# at least as many albums as choices, Discogs had some of them, whatever the other sources say
+def poll_counts():
+    return Question.objects.annotate(albums=Count('choice')).values_list('genre', 'year', 'albums').iterator()
+
+
+# writes the given (genre, year, albums) counts to the index, in batches of "batch_size" rows
+# combinations counted more than once keep the highest count, existing rows are overwritten
+# backends that cannot name the columns of a conflict, e.g. MySQL, update the existing rows and insert the others
+# returns the number of combinations written, and how many of them have no albums
+def build_availability(counts, batch_size=1000):
+    found = collections.defaultdict(int)
+    for genre, year, albums in counts:
+        found[genre, year] = max(found[genre, year], albums)
+    rows = [Availability(genre=genre, year=year, albums=albums) for (genre, year), albums in found.items()]
+    if connection.features.supports_update_conflicts_with_target:
+        Availability.objects.bulk_create(rows, batch_size=batch_size, update_conflicts=True,
+                                         unique_fields=['genre', 'year'], update_fields=['albums', 'updated'])
+    else:
+        now = timezone.now()  # set by hand, bulk updates leave auto_now fields alone
+        with transaction.atomic():
+            existing = Availability.objects.filter(genre__in={genre for genre, _ in found})
+            pks = {(genre, year): pk for genre, year, pk in existing.values_list('genre', 'year', 'pk')}
+            for row in rows:
+                row.pk, row.updated = pks.get((row.genre, row.year)), now
+            Availability.objects.bulk_update([row for row in rows if row.pk is not None], ['albums', 'updated'],
+                                             batch_size=batch_size)
+            Availability.objects.bulk_create([row for row in rows if row.pk is None], batch_size=batch_size)
+    changed()
+    return len(rows), sum(1 for albums in found.values() if albums == 0)
+
+
+def record_empty(genre, year):  # adds a combination Discogs has no albums for to the index
+    Availability.objects.update_or_create(genre=genre, year=year, defaults={'albums': 0})
+    changed()
+
+
+def changed():  # the cached combinations are read again, and the creation form rendered again
+    cache.delete(EMPTY_KEY)
+    bump_versions(listed=True)  # the options of the form are cached under the version of the list of polls
+
+
+# returns the years without albums of each genre, most recent first, e.g. {'Grunge': [1960, 1959, ...]}
+def empty_years():
+    years = cache.get(EMPTY_KEY)
+    if years is None:
+        years = collections.defaultdict(list)
+        empty = Availability.objects.filter(albums=0).order_by('genre', '-year')  # through the partial index
+        for genre, year in empty.values_list('genre', 'year'):
+            years[genre].append(year)
+        years = dict(years)
+        cache.set(EMPTY_KEY, years, settings.POLLS_AVAILABILITY_TTL)
+    return years
+
+
+def is_empty(genre, year):  # returns whether Discogs is known to have no albums for a genre and year
+    return year in empty_years().get(genre, ())
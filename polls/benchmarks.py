@@ -0,0 +1,540 @@
+"""
+This file defines the micro-benchmarks for the app polls.
+Each benchmark is a function that receives the options given on the command line and
+returns a list of rows, the first one being the header, to be printed as a table by the
+management command "benchmark". Benchmarks are registered by name in BENCHMARKS.
+
+Benchmarks that touch the database run against a freshly created test database, which is
+destroyed afterwards, so they never change the data of the configured database.
+"""
+
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.db import connection
+from django.test.utils import override_settings
+
+from .ranking import top_albums
+
+
+# times a single call to a function and returns its result and how long it took, in seconds
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+# creates an empty test database for the duration of the block, like the test runner does
+# SQLite test databases live in memory by default, where concurrent writers fail with "table is locked"
+# instead of waiting for each other, so a temporary file is used for them instead
+@contextmanager
+def test_database():
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}),
+                                            'NAME': os.path.join(tempfile.gettempdir(), 'polls_benchmark.sqlite3')}
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+# returns the given percentile (0-100) of a list of measurements
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+# generates "size" random album dictionaries spread across "artists" different artists
+def synthetic_albums(size, artists, seed=0):
+    rng = random.Random(seed)  # seeded, so that every run uses the same data
+    for i in range(size):
+        yield {
+            'id': i,
+            'have': rng.randrange(10000),
+            'want': rng.randrange(10000),
+            'country': 'US',
+            'image': f'https://img.discogs.com/{i}.jpg',
+            'title': f'Album {i}',
+            'artist': f'Artist {rng.randrange(artists)}',
+            'year': 1992,
+            'genres': 'Progressive Metal',
+            'url': f'https://www.discogs.com/master/{i}',
+        }
+
+
+# the ranking loop CreateView.post used before the ranking module, kept here as a baseline
+# for every album it rebuilds the lists of artists and popularity values, hence O(n^2)
+def legacy_top_albums(albums, k=10):
+    masters = {}
+    for album in albums:
+        artist = album['artist']
+        artists = [v[4] for v in masters.values()]  # list of artists being handled
+        if artist in artists:  # if current artist is already in the list, keep only their most popular release
+            artist_index = artists.index(artist)
+            if album['have'] + album['want'] > [v[0] for v in masters.values()][artist_index]:
+                artists.pop(artist_index)
+                masters.pop([master_id for master_id in masters][artist_index])
+        if artist not in artists:  # if current artist is not yet in the list, add the release
+            masters[album['id']] = [album['have'] + album['want'], None, None, None, artist, album]
+    masters = sorted(masters.items(), key=lambda x: x[1][0])  # sort all albums by popularity
+    return [v[5] for master_id, v in masters[len(masters) - k:]]  # only the k most popular
+
+
+# compares the legacy ranking loop against the streaming top-k engine
+def ranking(sizes=(1000, 10000, 100000), artists=1000, **options):
+    rows = [('releases', 'artists', 'legacy (s)', 'streaming (s)', 'speedup')]
+    for size in sizes:
+        legacy, legacy_time = timed(legacy_top_albums, synthetic_albums(size, artists))
+        streaming, streaming_time = timed(top_albums, synthetic_albums(size, artists))
+        assert legacy == streaming, 'the two rankings disagree'  # both must pick the same albums
+        rows.append((size, artists, f'{legacy_time:.4f}', f'{streaming_time:.4f}',
+                     f'{legacy_time / streaming_time:.1f}x'))
+    return rows
+
+
+# measures poll-creation throughput and tail latency against the synthetic Discogs stand-in
+# "count" polls are created by each number of "workers" threads, each search returning "size" masters
+def create(sizes=(500, 5000), count=40, workers=(1, 4), latency=0.02, **options):
+    from .services import create_poll  # imported here, as it needs the apps to be ready
+
+    rows = [('masters', 'polls', 'workers', 'polls/s', 'p50 (s)', 'p95 (s)', 'p99 (s)', 'max (s)')]
+    for size in sizes:
+        for pool_size in workers:
+            stand_in = {'DISCOGS_CLIENT': 'polls.fake_discogs.SyntheticClient', 'DISCOGS_CACHE_DIR': None,
+                        'DISCOGS_CLIENT_OPTIONS': {'size': size, 'latency': latency}}
+            with test_database(), override_settings(**stand_in):
+                def create_one(i):  # every poll gets its own (genre, year), so nothing is shared between them
+                    _, elapsed = timed(create_poll, f'Genre {i}', 2000)
+                    connection.close()  # worker threads must not keep database connections open
+                    return elapsed
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=pool_size) as executor:
+                    latencies = list(executor.map(create_one, range(count)))
+                total = time.perf_counter() - start
+
+            rows.append((size, count, pool_size, f'{count / total:.1f}', f'{statistics.median(latencies):.3f}',
+                         f'{percentile(latencies, 95):.3f}', f'{percentile(latencies, 99):.3f}',
+                         f'{max(latencies):.3f}'))
+    return rows
+
+
+# measures how the throughput of prebuild_polls scales with the number of workers
+# "count" years of one genre are pre-built against the synthetic Discogs stand-in
+def prebuild(count=24, workers=(1, 2, 4, 8), latency=0.05, **options):
+    from django.core.management import call_command  # imported here, as it needs the apps to be ready
+
+    rows = [('combinations', 'workers', 'elapsed (s)', 'combinations/s')]
+    stand_in = {'DISCOGS_CLIENT': 'polls.fake_discogs.SyntheticClient', 'DISCOGS_CACHE_DIR': None,
+                'DISCOGS_CLIENT_OPTIONS': {'size': 200, 'latency': latency}}
+    for pool_size in workers:
+        with test_database(), override_settings(**stand_in), tempfile.TemporaryDirectory() as directory:
+            _, elapsed = timed(call_command, 'prebuild_polls', genres=['Grunge'], years=range(2000 - count, 2000),
+                               workers=pool_size, rate=60000, checkpoint=os.path.join(directory, 'checkpoint.json'),
+                               stdout=io.StringIO())
+        rows.append((count, pool_size, f'{elapsed:.2f}', f'{count / elapsed:.1f}'))
+    return rows
+
+
+# measures how many Discogs crawls are saved when "count" identical creations arrive at the same time
+# the single-flight lock lets one of them crawl, while the others wait and reuse its poll
+def coalesce(count=20, workers=(4, 8, 16), latency=0.05, **options):
+    from .services import create_poll  # imported here, as it needs the apps to be ready
+    from .singleflight import get_single_flight
+
+    # "saved" requests waited for the crawl in progress, "reused" ones arrived once the poll existed already
+    rows = [('requests', 'workers', 'crawls', 'saved', 'reused', 'elapsed (s)')]
+    stand_in = {'DISCOGS_CLIENT': 'polls.fake_discogs.SyntheticClient', 'DISCOGS_CACHE_DIR': None,
+                'DISCOGS_CLIENT_OPTIONS': {'size': 500, 'latency': latency}}
+    for pool_size in workers:
+        with test_database(), override_settings(**stand_in), tempfile.TemporaryDirectory() as directory, \
+                override_settings(POLLS_LOCK_DIR=directory):
+            flights = get_single_flight()
+
+            def create_one(i):  # every request asks for the same (genre, year)
+                create_poll('Grunge', 1991)
+                connection.close()  # worker threads must not keep database connections open
+
+            with ThreadPoolExecutor(max_workers=pool_size) as executor:
+                _, elapsed = timed(lambda: list(executor.map(create_one, range(count))))
+            stats = flights.stats()
+        rows.append((count, pool_size, stats['crawls'], stats['saved'], count - stats['crawls'] - stats['saved'],
+                     f'{elapsed:.2f}'))
+    return rows
+
+
+# compares the full crawl against the popularity-sorted, early-terminating one on recorded searches
+# recordings are read from "directory", or made from synthetic catalogs of the given sizes if there is none
+def crawl(sizes=(500, 5000, 20000), latency=0.02, directory=None, **options):
+    from django.conf import settings  # imported here, as it needs the settings to be configured
+
+    from .discogs import iter_albums, iter_pages
+    from .fake_discogs import RecordingClient, ReplayClient
+    from .ranking import popularity
+
+    concurrency = settings.DISCOGS_FETCH_CONCURRENCY
+    rows = [('search', 'masters', 'full pages', 'full (s)', 'sorted pages', 'sorted (s)', 'speedup')]
+    with tempfile.TemporaryDirectory() as scratch:
+        if directory is None:  # nothing recorded was given, so synthetic catalogs are recorded first
+            directory = scratch
+            for size in sizes:
+                recorder = RecordingClient(directory=directory, client='polls.fake_discogs.SyntheticClient', size=size)
+                list(iter_pages(recorder.search(type='master', style=f'Synthetic {size}', year=2000)))
+
+        replay = ReplayClient(directory=directory, latency=latency)
+        for path in sorted(Path(directory).glob('*.json')):
+            with open(path, encoding='utf-8') as file:
+                recording = json.load(file)
+            style, year = recording['style'], recording['year']
+
+            full = replay.search(type='master', style=style, year=year)
+            full_top, full_time = timed(top_albums, iter_albums(iter_pages(full, concurrency)))
+            ordered = replay.search(type='master', style=style, year=year, sort='popularity', sort_order='desc')
+            sorted_top, sorted_time = timed(top_albums, iter_albums(iter_pages(ordered, concurrency)),
+                                            sorted_by_popularity=True)
+            # both must pick equally popular albums, which ones may differ between ties
+            assert [popularity(a) for a in full_top] == [popularity(a) for a in sorted_top], 'the crawls disagree'
+            rows.append((f'{style} {year}', len(full), full.fetched, f'{full_time:.3f}', ordered.fetched,
+                         f'{sorted_time:.3f}', f'{full_time / sorted_time:.1f}x'))
+    return rows
+
+
+# the vote counting views.vote used before the votes module, kept here as a baseline
+# it reads the choice, adds one in Python and writes every column back, so concurrent votes can be lost
+def legacy_vote(choice_id):
+    from .models import Choice  # imported here, as it needs the apps to be ready
+
+    choice = Choice.objects.get(pk=choice_id)
+    choice.votes += 1
+    choice.save()
+
+
+# measures vote throughput and lost votes for the legacy read-modify-write, the atomic increment and
+# the write-behind buffer, with "count" votes cast by each number of "workers" threads on one poll
+def vote(count=2000, workers=(1, 8), **options):
+    from .models import Choice, Question  # imported here, as they need the apps to be ready
+    from .votes import VoteBuffer, record_vote
+
+    rows = [('mode', 'votes', 'workers', 'votes/s', 'lost')]
+    for pool_size in workers:
+        for mode in ('legacy', 'atomic', 'buffered'):
+            with test_database():
+                question = Question.objects.create(genre='Grunge', year=1991,
+                                                   text='What is the best Grunge album of 1991?')
+                choice_ids = [Choice.objects.create(question=question, title=f'Album {i}').pk for i in range(10)]
+                buffer = VoteBuffer(flush_size=500, flush_interval=None)
+                cast = {'legacy': legacy_vote, 'atomic': record_vote, 'buffered': buffer.add}[mode]
+
+                def cast_share(worker):  # every worker casts an equal share of the votes, going round the choices
+                    try:
+                        for i in range(worker, count, pool_size):
+                            cast(choice_ids[i % len(choice_ids)])
+                    finally:
+                        connection.close()  # worker threads must not keep database connections open
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=pool_size) as executor:
+                    list(executor.map(cast_share, range(pool_size)))
+                buffer.flush()  # votes still buffered count as cast only once they are written
+                elapsed = time.perf_counter() - start
+                stored = sum(Choice.objects.values_list('votes', flat=True))
+            rows.append((mode, count, pool_size, f'{count / elapsed:.0f}', count - stored))
+    return rows
+
+
+# measures how vote throughput on a single hot choice scales with the number of vote shards
+# "count" votes are cast by "workers" threads for each shard count in "sizes", 1 meaning no sharding
+# SQLite locks the whole database for every write, so sharding only pays off on a server such as MySQL
+def shards(sizes=(1, 4, 16), count=2000, workers=(8,), **options):
+    from .models import Choice, Question  # imported here, as they need the apps to be ready
+    from .votes import record_vote, rollup_vote_shards
+
+    rows = [('shards', 'votes', 'workers', 'votes/s', 'lost')]
+    for pool_size in workers:
+        for size in sizes:
+            with test_database(), override_settings(POLLS_VOTE_SHARDS=size, POLLS_VOTE_BUFFER=False):
+                question = Question.objects.create(genre='Grunge', year=1991,
+                                                   text='What is the best Grunge album of 1991?')
+                choice = Choice.objects.create(question=question, title='Nevermind')
+
+                def cast_share(worker):  # every worker casts an equal share of the votes
+                    try:
+                        for _ in range(worker, count, pool_size):
+                            record_vote(choice.pk)
+                    finally:
+                        connection.close()  # worker threads must not keep database connections open
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=pool_size) as executor:
+                    list(executor.map(cast_share, range(pool_size)))
+                elapsed = time.perf_counter() - start
+                rollup_vote_shards()
+                choice.refresh_from_db()
+            rows.append((size, count, pool_size, f'{count / elapsed:.0f}', count - choice.votes))
+    return rows
+
+
+# measures the memory held by each idle subscriber of a poll's live results, and how long one push takes
+# to reach all of them, for each number of subscribers in "sizes", served by the ASGI application directly
+def stream(sizes=(1000, 10000), **options):
+    import asyncio  # imported here, as only this benchmark needs it
+    import tracemalloc
+
+    from .models import Choice, Question  # imported here, as they need the apps to be ready
+    from .streams import get_broadcaster, stream_results
+
+    async def measure(question, choice, size):
+        left = asyncio.get_running_loop().create_future()  # resolved when every subscriber goes away
+        received = [0, 0]  # snapshots and pushes received
+
+        async def receive():
+            await left
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            body = message.get('body', b'')
+            if body.startswith(b'event: snapshot'):
+                received[0] += 1
+            elif body.startswith(b'event: votes'):
+                received[1] += 1
+
+        scope = {'type': 'http', 'path': f'/polls/{question.pk}/stream/', 'method': 'GET', 'headers': []}
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tasks = [asyncio.ensure_future(stream_results(scope, receive, send, question.pk)) for _ in range(size)]
+        while received[0] < size:
+            await asyncio.sleep(0.01)
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        get_broadcaster().publish(question.pk, choice.pk)
+        start = time.perf_counter()
+        while received[1] < size:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start  # includes the wait for the next push, up to one interval
+        left.set_result(None)
+        await asyncio.gather(*tasks)
+        return held, elapsed
+
+    rows = [('subscribers', 'KB/subscriber', 'push to all (ms)')]
+    with test_database():
+        question = Question.objects.create(genre='Grunge', year=1991, text='What is the best Grunge album of 1991?')
+        choice = Choice.objects.create(question=question, title='Nevermind')
+        for size in sizes:
+            held, elapsed = asyncio.run(measure(question, choice, size))
+            rows.append((size, f'{held / size / 1024:.1f}', f'{elapsed * 1000:.0f}'))
+    return rows
+
+
+# measures the response time of the polls index for each number of questions in "sizes": its first page,
+# a page halfway through the list through its cursor, and the query alone of the same page with OFFSET as a baseline
+# each time is the median of "count" requests, rendered by the view without the middleware in front of it
+def pagination(sizes=(100, 10000, 1000000), count=20, **options):
+    import datetime  # imported here, as only this benchmark needs it
+
+    from django.conf import settings  # imported here, as it needs the settings to be configured
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+    from django.utils import timezone
+
+    from .models import Question  # imported here, as they need the apps to be ready
+    from .pagination import encode_cursor
+    from .views import IndexView
+
+    factory = RequestFactory()
+    view = IndexView.as_view()
+
+    def render(**params):  # renders the index with the given query string, returns how long it took
+        request = factory.get('/polls/', params)
+        request.user = AnonymousUser()
+        return timed(lambda: view(request).render())[1]
+
+    rows = [('questions', 'first page (ms)', 'middle page (ms)', 'middle page query alone, OFFSET (ms)')]
+    for size in sizes:
+        with test_database():
+            start = timezone.now()
+            for first in range(0, size, 10000):  # in batches, so that a million questions fit in memory
+                Question.objects.bulk_create(
+                    Question(genre=f'Genre {i // 1000}', year=i % 1000, text=f'Poll {i}',
+                             pub_date=start - datetime.timedelta(seconds=i))
+                    for i in range(first, min(first + 10000, size)))
+            middle = Question.objects.order_by('-pub_date', '-pk')[size // 2]
+            page_size = settings.POLLS_PAGE_SIZE
+            first_page = statistics.median(render() for _ in range(count))
+            middle_page = statistics.median(render(after=encode_cursor(middle)) for _ in range(count))
+            offset_page = statistics.median(
+                timed(list, Question.objects.order_by('-pub_date', '-pk')[size // 2:size // 2 + page_size])[1]
+                for _ in range(count))
+        rows.append((size, f'{first_page * 1000:.2f}', f'{middle_page * 1000:.2f}', f'{offset_page * 1000:.2f}'))
+    return rows
+
+
+# measures the latency of searches for each number of choices in "sizes", 10 albums per poll, once indexed:
+# a rare term (one artist), a common one (a genre shared by a tenth of the polls) and three terms at once,
+# and the rare term with the LIKE queries used when there is no search table, as a baseline
+# each time is the median of "count" searches for the first page
+def search(sizes=(10000, 100000, 1000000), count=20, artists=10000, **options):
+    from django.conf import settings  # imported here, as it needs the settings to be configured
+
+    from .models import Choice, Question  # imported here, as they need the apps to be ready
+    from .search import like_search, rebuild_search_index, search_backend, search_questions
+
+    rows = [('choices', 'indexing (s)', 'rare term (ms)', 'common term (ms)', 'three terms (ms)',
+             'rare term, LIKE (ms)')]
+    for size in sizes:
+        with test_database():
+            if search_backend() is None:
+                raise RuntimeError(f'The {connection.vendor} backend has no search table.')
+            polls = size // 10
+            for first in range(0, polls, 10000):  # in batches, so that a million choices fit in memory
+                questions = Question.objects.bulk_create(
+                    Question(genre=f'Genre{i % 10} {i // 10000}', year=i // 10 % 1000, text=f'Best album of poll {i}?')
+                    for i in range(first, min(first + 10000, polls)))
+                Choice.objects.bulk_create(
+                    Choice(question=question, title=f'Album{i}x{j}', artist=f'Artist{(i * 10 + j) % artists}')
+                    for i, question in enumerate(questions, first) for j in range(10))
+            _, indexing = timed(rebuild_search_index, batch_size=1000)
+
+            def median(query):  # median time of searching for the query, in milliseconds
+                return statistics.median(timed(search_questions, query, size=settings.POLLS_PAGE_SIZE)[1]
+                                         for _ in range(count)) * 1000
+
+            timings = [median('artist1234'), median('genre3'), median('best genre3 artist1234')]
+            timings.append(statistics.median(timed(like_search, ['artist1234'], 0, settings.POLLS_PAGE_SIZE + 1)[1]
+                                             for _ in range(count)) * 1000)
+        rows.append((size, f'{indexing:.1f}', *(f'{timing:.2f}' for timing in timings)))
+    return rows
+
+
+# measures the response time of the pages of the polls, with "sizes" polls of 10 albums each: rendered, with the
+# versions of every poll bumped before each request, and warm, served from the page cache or with cached fragments
+# then replays "count" requests of anonymous users for random pages of random polls, the n-th most popular poll
+# being requested 1/n as often as the first (Zipf), with a vote every "votes" requests, and reports the share
+# of them served from the cache: whole pages, except for the detail page, which only has its albums cached
+# each time is the median of 20 requests, sent through the middleware by the test client
+def pages(sizes=(1000,), count=2000, votes=10, **options):
+    from django.core.cache import cache  # imported here, as they need the apps to be ready
+    from django.test import Client
+    from django.urls import reverse
+
+    from .models import Choice, Question
+    from .pagecache import get_page_cache
+    from .votes import record_vote
+
+    names = ('index', 'detail', 'results', 'activity')
+    rows = [('polls', 'page', 'rendered (ms)', 'warm (ms)', 'hit ratio under load')]
+    for size in sizes:
+        with test_database(), override_settings(POLLS_VOTE_BUFFER=False, POLLS_VOTE_SHARDS=0):
+            cache.clear()
+            questions = Question.objects.bulk_create(
+                Question(genre=f'Genre {i // 1000}', year=i % 1000, text=f'Poll {i}') for i in range(size))
+            choices = Choice.objects.bulk_create(Choice(question=question, title=f'Album {i}.{j}', votes=j)
+                                                 for i, question in enumerate(questions) for j in range(10))
+            page_cache = get_page_cache()
+            client = Client()  # anonymous, as only they are served whole pages
+
+            def path(name, question):
+                return reverse('polls:index') if name == 'index' else reverse(f'polls:{name}', args=(question.pk,))
+
+            def request(name, question):  # returns how long the page took, and whether it was cached
+                fragments = page_cache.stats()['fragment']['hits']
+                response, duration = timed(client.get, path(name, question), SERVER_NAME='localhost', secure=True)
+                if name == 'detail':
+                    return duration, page_cache.stats()['fragment']['hits'] > fragments
+                return duration, response['X-Cache'] == 'hit'
+
+            rng = random.Random(0)  # seeded, so that every run replays the same requests
+            popularity = [1 / rank for rank in range(1, size + 1)]
+            load = {name: [] for name in names}  # whether each request was served from the cache, by page
+            for i in range(count):
+                question, = rng.choices(questions, popularity)
+                if i % votes == 0:
+                    choice = choices[questions.index(question) * 10 + rng.randrange(10)]
+                    record_vote(choice.pk, question.pk)
+                name = rng.choice(names)
+                load[name].append(request(name, question)[1])
+
+            question = questions[size // 2]
+            for name in names:
+                rendered = []
+                for _ in range(20):
+                    page_cache.bump(question.pk, listed=True)
+                    rendered.append(request(name, question)[0])
+                request(name, question)
+                warm = statistics.median(request(name, question)[0] for _ in range(20))
+                ratio = sum(load[name]) / (len(load[name]) or 1)
+                rows.append((size, name, f'{statistics.median(rendered) * 1000:.2f}', f'{warm * 1000:.2f}',
+                             f'{ratio:.0%}'))
+    return rows
+
+
+# fills a test database with "sizes" polls of 10 albums each, then requests the index, detail and results of a poll
+# "count" times as HTML pages and as JSON from the API, as an anonymous client, and reports the requests per second:
+# rendered, with the poll's version bumped before every request, cached, and, for the API, answered 304 to a
+# client sending the ETag it already has, along with the size of each response
+def api(sizes=(1000,), count=500, **options):
+    from django.core.cache import cache  # imported here, as they need the apps to be ready
+    from django.test import Client
+    from django.urls import reverse
+
+    from .models import Choice, Question
+    from .pagecache import get_page_cache
+
+    rows = [('polls', 'endpoint', 'format', 'rendered (req/s)', 'cached (req/s)', '304 (req/s)', 'bytes')]
+    for size in sizes:
+        with test_database(), override_settings(POLLS_VOTE_BUFFER=False, POLLS_VOTE_SHARDS=0):
+            cache.clear()
+            questions = Question.objects.bulk_create(
+                Question(genre=f'Genre {i // 1000}', year=i % 1000, text=f'Poll {i}') for i in range(size))
+            Choice.objects.bulk_create(Choice(question=question, title=f'Album {i}.{j}', artist=f'Artist {j}',
+                                              votes=j) for i, question in enumerate(questions) for j in range(10))
+            question = questions[size // 2]
+            page_cache = get_page_cache()
+            client = Client()
+
+            def rate(path, bump=False, **headers):  # returns the requests per second, and the last response
+                start = time.perf_counter()
+                for _ in range(count):
+                    if bump:
+                        page_cache.bump(question.pk, listed=True)
+                    response = client.get(path, SERVER_NAME='localhost', secure=True, **headers)
+                return count / (time.perf_counter() - start), response
+
+            for name in ('index', 'detail', 'results'):
+                args = () if name == 'index' else (question.pk,)
+                for kind, path in (('HTML', reverse(f'polls:{name}', args=args)),
+                                   ('JSON', reverse(f'polls:api_{name}', args=args))):
+                    rendered, response = rate(path, bump=True)
+                    cached, _ = rate(path)
+                    if 'ETag' in response:
+                        not_modified = f'{rate(path, HTTP_IF_NONE_MATCH=response["ETag"])[0]:.0f}'
+                    else:
+                        not_modified = '-'
+                    rows.append((size, name, kind, f'{rendered:.0f}', f'{cached:.0f}', not_modified,
+                                 len(response.content)))
+    return rows
+
+
+BENCHMARKS = {  # name -> benchmark function
+    'api': api,
+    'coalesce': coalesce,
+    'crawl': crawl,
+    'create': create,
+    'pages': pages,
+    'pagination': pagination,
+    'prebuild': prebuild,
+    'ranking': ranking,
+    'search': search,
+    'shards': shards,
+    'stream': stream,
+    'vote': vote,
+}
@@ -0,0 +1,131 @@
+"""
+This file defines the on-disk cache of Discogs search results used by the app polls.
+Each (style, year) search is stored as one JSON Lines file holding the normalized albums
+returned by Discogs, so that creating the same poll again does not need to query the API.
+
+Entries expire after a time-to-live, and once there are more entries than allowed the least
+recently used ones are evicted. Files are written to a temporary name and then renamed into
+place, so concurrent workers sharing the directory never read a half-written entry.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SearchCache:  # cache of Discogs search results keyed by (style, year)
+    def __init__(self, directory, ttl, max_entries):
+        self.directory = Path(directory)  # where the entries are stored
+        self.ttl = ttl  # seconds an entry stays valid for
+        self.max_entries = max_entries  # number of entries kept before evicting the least recently used
+        self.hits = 0  # number of lookups served from the cache by this process
+        self.misses = 0  # number of lookups that had to go to Discogs
+        self._lock = threading.Lock()  # protects the counters
+
+    def path(self, style, year):  # file where the entry for (style, year) lives
+        key = hashlib.sha1(f'{style}|{year}'.encode()).hexdigest()
+        return self.directory / f'{key}.jsonl'
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    # returns an iterator over the cached albums for (style, year), or None if there is no valid entry
+    def get(self, style, year):
+        path = self.path(style, year)
+        try:
+            file = open(path, encoding='utf-8')
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+
+        try:
+            header = json.loads(file.readline() or '{}')
+        except (ValueError, OSError):  # truncated or corrupt, e.g. by a crash or by hand, so it is dropped
+            file.close()
+            path.unlink(missing_ok=True)
+            logger.warning('Dropped corrupt entry %s from the Discogs search cache', path.name)
+            self._count(hit=False)
+            return None
+        if header.get('stored', 0) + self.ttl < time.time():  # entry has expired
+            file.close()
+            path.unlink(missing_ok=True)
+            self._count(hit=False)
+            return None
+
+        try:
+            os.utime(path)  # marks the entry as recently used
+        except FileNotFoundError:  # evicted by another worker meanwhile, the open file is still readable
+            pass
+        self._count(hit=True)
+        return self._read(file)
+
+    @staticmethod
+    def _read(file):
+        with file:
+            for line in file:
+                yield json.loads(line)
+
+    # passes the albums through while writing them to the cache as the entry for (style, year)
+    # the entry only becomes visible once every album has been consumed, and only if "complete",
+    # called at that point, returns True
+    def store(self, style, year, albums, complete=None):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                file.write(json.dumps({'style': style, 'year': year, 'stored': time.time()}) + '\n')
+                for album in albums:
+                    file.write(json.dumps(album) + '\n')
+                    yield album
+            if complete is None or complete():
+                os.replace(temporary, self.path(style, year))  # atomic on both POSIX and Windows
+        finally:
+            if os.path.exists(temporary):  # consumer stopped early, results were incomplete or something failed
+                os.remove(temporary)
+        self.evict()
+
+    # removes the least recently used entries until there are at most max_entries left
+    def evict(self):
+        entries = []
+        for path in self.directory.glob('*.jsonl'):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:  # removed by another worker meanwhile
+                pass
+        entries.sort()
+        for mtime, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            path.unlink(missing_ok=True)
+            logger.debug('Evicted %s from the Discogs search cache', path.name)
+
+    def clear(self):  # removes every entry
+        for path in self.directory.glob('*.jsonl'):
+            path.unlink(missing_ok=True)
+
+    def stats(self):  # hit and miss counters of this process, plus the number of entries on disk
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(list(self.directory.glob('*.jsonl')))}
+
+
+_caches = {}  # one cache per configuration, so that tests overriding the settings get their own
+
+
+# returns the search cache configured in the settings, or None if caching is disabled
+def get_search_cache():
+    if not settings.DISCOGS_CACHE_DIR:
+        return None
+    key = (str(settings.DISCOGS_CACHE_DIR), settings.DISCOGS_CACHE_TTL, settings.DISCOGS_CACHE_MAX_ENTRIES)
+    if key not in _caches:
+        _caches[key] = SearchCache(*key)
+    return _caches[key]
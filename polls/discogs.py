@@ -0,0 +1,188 @@
+"""
+This file defines the helpers used by the app polls to query the Discogs database.
+They sit between the views and the Discogs API client, so that the way results are
+retrieved can change without affecting how polls are built from them.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+import discogs_client
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .cache import get_search_cache
+from .fetchers import PooledFetcher
+from .ranking import popularity
+
+logger = logging.getLogger(__name__)
+
+
+# fetches a single page of results and measures how long the round trip took
+def fetch_page(results, index):
+    start = time.perf_counter()  # time before the request
+    page = results.page(index)  # requests the page from Discogs
+    return page, time.perf_counter() - start  # returns page and its latency in seconds
+
+
+# yields all pages of a search result, fetching at most "concurrency" of them at the same time
+# pages come out in the same order they would be fetched sequentially, and each one can be
+# discarded by the caller as soon as it has been consumed
+# pages are only requested a few ahead of the caller, so a caller that stops early saves the rest
+# if a list is passed in as "timings", one (page index, latency) tuple is appended to it per page
+# if a "deadline" (time.monotonic() value) is given, no more pages are yielded once it has passed, apart
+# from the first one, and the indexes of the pages left out are appended to "missing", if a list is passed in
+def iter_pages(results, concurrency=1, timings=None, deadline=None, missing=None):
+    indexes = range(1, results.pages + 1)  # one index for each page of results, Discogs numbers them from 1
+    # pages are fetched by threads if there is something to parallelize, or a deadline to stop waiting at
+    if deadline is not None or (concurrency > 1 and len(indexes) > 1):
+        yield from _iter_pages_ahead(results, indexes, concurrency, timings, deadline, missing)
+    else:  # sequential mode, one request after the other
+        fetched = (fetch_page(results, i) for i in indexes)
+        yield from _record_timings(indexes, fetched, timings)
+
+
+def _iter_pages_ahead(results, indexes, concurrency, timings, deadline, missing):
+    width = max(min(concurrency, len(indexes)), 1)  # number of pages requested ahead of the caller
+    executor = ThreadPoolExecutor(max_workers=width)
+    upcoming = iter(indexes)
+    ahead = collections.deque()  # futures of the pages requested but not yielded yet, in order
+
+    def arrived():  # results of the pages in order, the first one is always waited for so that a poll can be built
+        for n in range(len(indexes)):
+            while len(ahead) < width and (index := next(upcoming, None)) is not None:
+                ahead.append(executor.submit(fetch_page, results, index))
+            timeout = None if deadline is None or n == 0 else max(deadline - time.monotonic(), 0)
+            yield ahead.popleft().result(timeout=timeout)
+
+    done = 0  # number of pages yielded so far
+    try:
+        for page in _record_timings(indexes, arrived(), timings):
+            done += 1
+            yield page
+    except futures.TimeoutError:
+        logger.warning('Discogs deadline passed with %d of %d pages fetched', done, len(indexes))
+        if missing is not None:
+            missing.extend(indexes[done:])
+    finally:
+        # pages still on their way are not waited for, and those not requested yet never will be
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _record_timings(indexes, fetched, timings):
+    for i, (page, latency) in zip(indexes, fetched):
+        logger.debug('Discogs page %d fetched in %.3fs', i, latency)  # per-page latency breakdown
+        if timings is not None:
+            timings.append((i, latency))
+        yield page
+
+
+# fetches all pages of a search result, at most "concurrency" of them at the same time
+# returns the list of pages in order, along with a list of (page index, latency) tuples
+def fetch_pages(results, concurrency=1):
+    timings = []
+    pages = list(iter_pages(results, concurrency, timings))
+    return pages, timings
+
+
+# converts a master release returned by Discogs into a plain dictionary with only the data polls need
+def master_to_album(master):
+    artist, title = master.title.split(' - ')[:2]  # Discogs titles follow "<artist> - <title>"
+    return {
+        'id': master.id,  # album's id on Discogs
+        'have': master.data['community']['have'],  # number of Discogs users who own the album
+        'want': master.data['community']['want'],  # number of Discogs users who want the album
+        'country': master.data['country'],  # album's release country
+        'image': master.data['cover_image'],  # album's cover image
+        'title': title,  # album's title
+        'artist': artist,  # album's artist
+        'year': master.year,  # album's release year
+        'genres': "/".join(master.data['style']),  # album's list of genres
+        'url': "https://www.discogs.com" + master.data['uri'],  # album's url on Discogs website
+    }
+
+
+# yields one album dictionary for each master release in the given pages
+def iter_albums(pages):
+    for page in pages:
+        for master in page:
+            yield master_to_album(master)
+
+
+# creates a client of the given class, installing a pooled, rate-limited fetcher if it is a real Discogs client
+# offline stand-ins are returned as they are, as they do not send any requests
+def build_client(client_class, user_agent, user_token=None, **options):
+    client = client_class(user_agent, user_token=user_token, **options)
+    if isinstance(client, discogs_client.Client):
+        client._fetcher = PooledFetcher(user_token, rate=settings.DISCOGS_RATE_LIMIT,
+                                        pool_size=settings.DISCOGS_POOL_SIZE, max_retries=settings.DISCOGS_MAX_RETRIES)
+    return client
+
+
+_clients = {}  # one client per configuration, so that tests overriding the settings get their own
+_clients_lock = threading.Lock()
+
+
+# returns the Discogs client of this process, shared by every request and worker thread
+# so that they all reuse the same connections and stay within the same rate limit
+def get_client():
+    # Discogs API for Python, for more information access:
+    # https://www.discogs.com/developers and https://github.com/joalla/discogs_client
+    # the client class comes from the settings, so that it can be replaced by an offline stand-in
+    client_class = import_string(settings.DISCOGS_CLIENT)
+
+    # authenticated queries to Discogs API require a personal user token.
+    # here, the token is retrieved from a git-ignored file at the root of the project.
+    # even without authentication, it is still possible to query their database,
+    # but some pieces of information may be missing from the results.
+    user_token = os.getenv('DISCOGS_USER_TOKEN')
+
+    key = (client_class, user_token, repr(settings.DISCOGS_CLIENT_OPTIONS), settings.DISCOGS_RATE_LIMIT,
+           settings.DISCOGS_POOL_SIZE, settings.DISCOGS_MAX_RETRIES)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = build_client(client_class, 'dorsetMusicCollection/0.1', user_token=user_token,
+                                         **settings.DISCOGS_CLIENT_OPTIONS)
+        return _clients[key]
+
+
+# returns the request count, retries and rate-limit waits of the shared client, or None for stand-ins
+def client_stats():
+    fetcher = getattr(get_client(), '_fetcher', None)
+    return fetcher.stats() if isinstance(fetcher, PooledFetcher) else None
+
+
+# returns whether the configured client can return search results sorted by popularity
+# Discogs itself cannot sort by the number of users who own plus want an album, only some stand-ins can
+def sorts_by_popularity():
+    return settings.DISCOGS_SORTED_CRAWL and getattr(get_client(), 'sorts_by_popularity', False)
+
+
+# returns an iterator over the albums Discogs has for the given style and year
+# results are served from the search cache when possible, and stored in it otherwise
+# "deadline" and "missing" are passed on to iter_pages, results missing some pages are never cached
+# if "by_popularity" is set, which needs sorts_by_popularity(), albums come from most to least popular
+def search_albums(style, year, deadline=None, missing=None, by_popularity=False):
+    cache = get_search_cache()
+    if cache is not None:
+        cached = cache.get(style, year)
+        if cached is not None:  # cache hit, no need to query Discogs at all
+            # entries are kept in Discogs' own order, sorting them locally is cheap compared to any request
+            return iter(sorted(cached, key=popularity, reverse=True)) if by_popularity else cached
+
+    # query Discogs' database with provided style and year, through the client shared by the whole process
+    ordering = {'sort': 'popularity', 'sort_order': 'desc'} if by_popularity else {}
+    results = get_client().search(type='master', style=style, year=year, **ordering)
+
+    # streams all results' pages, fetching several pages at the same time
+    albums = iter_albums(iter_pages(results, concurrency=settings.DISCOGS_FETCH_CONCURRENCY, deadline=deadline,
+                                    missing=missing))
+    if cache is not None:
+        # writes the albums to the cache as they are consumed, a crawl stopped early is never stored
+        albums = cache.store(style, year, albums, complete=lambda: not missing)
+    return albums
@@ -0,0 +1,174 @@
+"""
+This file defines stand-ins for the Discogs API client, so that poll creation can be exercised,
+load-tested and benchmarked entirely offline. Any of them can replace discogs_client.Client by
+pointing the DISCOGS_CLIENT setting at it, with DISCOGS_CLIENT_OPTIONS as keyword arguments:
+
+- SyntheticClient generates a reproducible catalog of any size, with a simulated latency.
+- RecordingClient wraps another client and saves every page of results it fetches to disk.
+- ReplayClient serves the pages saved by RecordingClient, without any network access.
+
+Like discogs_client, search results are paginated lists whose pages are numbered from 1.
+Unlike Discogs, SyntheticClient and ReplayClient can also sort results by popularity, so that the
+early-terminating crawl of polls.discogs can be exercised against them.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.utils.module_loading import import_string
+
+from .discogs import build_client
+
+logger = logging.getLogger(__name__)
+
+
+class FakeMaster:  # stands in for discogs_client.models.Master, built from a search result item
+    def __init__(self, data):
+        self.data = data  # same dictionary Discogs returns for each search result
+        self.id = data['id']
+        self.title = data['title']  # "<artist> - <title>"
+        self.year = data['year']
+
+    def __repr__(self):
+        return f'<FakeMaster {self.id!r} {self.title!r}>'
+
+
+class FakeResults:  # stands in for discogs_client.models.MixedPaginatedList
+    def __init__(self, pages, per_page=50, latency=0.0):
+        self._pages = pages  # list of pages, each one a list of search result items
+        self.per_page = per_page
+        self.latency = latency  # seconds each page request takes
+        self.fetched = 0  # number of page requests received, for benchmarks
+
+    @property
+    def pages(self):  # Discogs reports at least one page, even when there are no results
+        return max(len(self._pages), 1)
+
+    @property
+    def count(self):
+        return sum(len(page) for page in self._pages)
+
+    def __len__(self):
+        return self.count
+
+    def page(self, index):  # like the real API, page numbers below 1 are served as page 1
+        self.fetched += 1
+        time.sleep(self.latency)
+        index = max(index, 1)
+        items = self._pages[index - 1] if index <= len(self._pages) else []
+        return [FakeMaster(item) for item in items]
+
+
+def paginate(items, per_page):  # splits a list of items into pages
+    return [items[i:i + per_page] for i in range(0, len(items), per_page)]
+
+
+# orders search result items like a provider supporting sort=popularity would, most owned and wanted first
+def sort_items(items, sort=None, sort_order='desc'):
+    if sort != 'popularity':
+        return items
+    return sorted(items, key=lambda item: item['community']['have'] + item['community']['want'],
+                  reverse=sort_order == 'desc')
+
+
+class SyntheticClient:  # generates a reproducible catalog for every (style, year) searched
+    sorts_by_popularity = True  # accepts sort='popularity' in searches
+
+    def __init__(self, user_agent=None, user_token=None, size=500, artists=None, per_page=50, latency=0.0, seed=0):
+        self.size = size  # number of masters returned by each search
+        self.artists = artists or max(size // 5, 1)  # number of distinct artists among them
+        self.per_page = per_page
+        self.latency = latency  # seconds each page request takes
+        self.seed = seed  # same seed, style and year always produce the same catalog
+
+    def items(self, style, year):  # search result items for (style, year)
+        rng = random.Random(f'{self.seed}|{style}|{year}')
+        return [{
+            'id': i,
+            'title': f'{style} Artist {rng.randrange(self.artists)} - {style} Album {i}',
+            'year': str(year),
+            'country': rng.choice(['US', 'UK', 'Germany', 'Japan', 'Brazil']),
+            'cover_image': f'https://i.discogs.com/synthetic/{i}.jpg',
+            'style': [style],
+            'uri': f'/master/{i}',
+            'community': {'have': rng.randrange(10000), 'want': rng.randrange(5000)},
+        } for i in range(1, self.size + 1)]
+
+    def search(self, *query, style=None, year=None, sort=None, sort_order='desc', **fields):
+        items = sort_items(self.items(style, year), sort, sort_order)
+        return FakeResults(paginate(items, self.per_page), self.per_page, self.latency)
+
+
+def fixture_path(directory, style, year):  # file where the recorded results of (style, year) are kept
+    slug = re.sub(r'[^a-z0-9]+', '-', style.lower()).strip('-')
+    return Path(directory) / f'{slug}-{year}.json'
+
+
+class RecordingResults:  # passes pages through from another client's results, saving each one to disk
+    def __init__(self, results, path, style, year):
+        self.results = results
+        self.path = path
+        self._lock = threading.Lock()  # pages may be fetched by several threads at the same time
+        self.recording = {'style': style, 'year': str(year), 'items': len(results), 'pages': results.pages,
+                          'per_page': getattr(results, 'per_page', 50), 'results': {}}
+
+    @property
+    def pages(self):
+        return self.results.pages
+
+    def __len__(self):
+        return len(self.results)
+
+    def page(self, index):
+        page = self.results.page(index)
+        with self._lock:
+            self.recording['results'][str(max(index, 1))] = [master.data for master in page]
+            self.save()
+        return page
+
+    def save(self):  # writes to a temporary file first, so the fixture is never left half-written
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(self.recording, file, default=str)
+        os.replace(temporary, self.path)
+
+
+class RecordingClient:  # records every search made through another client
+    def __init__(self, user_agent=None, user_token=None, directory='fixtures/discogs',
+                 client='discogs_client.Client', **client_options):
+        self.directory = directory  # where the recordings are saved
+        self.client = build_client(import_string(client), user_agent, user_token=user_token, **client_options)
+
+    def search(self, *query, style=None, year=None, **fields):
+        results = self.client.search(*query, style=style, year=year, **fields)
+        return RecordingResults(results, fixture_path(self.directory, style, year), style, year)
+
+
+class ReplayClient:  # serves searches recorded by RecordingClient
+    sorts_by_popularity = True  # accepts sort='popularity' in searches, as long as the whole search was recorded
+
+    def __init__(self, user_agent=None, user_token=None, directory='fixtures/discogs', latency=0.0):
+        self.directory = directory  # where the recordings are read from
+        self.latency = latency  # seconds each page request takes
+
+    def search(self, *query, style=None, year=None, sort=None, sort_order='desc', **fields):
+        path = fixture_path(self.directory, style, year)
+        try:
+            with open(path, encoding='utf-8') as file:
+                recording = json.load(file)
+        except FileNotFoundError:  # nothing was recorded, so replay it as a search without results
+            logger.warning('No Discogs recording for %s %s at %s', style, year, path)
+            return FakeResults([], latency=self.latency)
+        pages = [recording['results'].get(str(i), []) for i in range(1, recording['pages'] + 1)]
+        if sort is not None:  # sorted results are made from every recorded item, then split into pages again
+            pages = paginate(sort_items([item for page in pages for item in page], sort, sort_order),
+                             recording['per_page'])
+        return FakeResults(pages, recording['per_page'], self.latency)
@@ -0,0 +1,63 @@
+"""
+This file defines the HTTP fetcher the app polls installs into the Discogs API client.
+It replaces the client's default fetcher, which opens a new connection for every request, with
+one that keeps a pool of keep-alive connections and shares it, along with a rate limiter, between
+all the threads of the process. Requests are spaced out to stay within Discogs' per-minute limit,
+and when Discogs answers 429 (too many requests) every thread backs off before trying again.
+"""
+
+import json
+import logging
+import threading
+
+import requests
+from discogs_client.fetchers import Fetcher
+from requests.adapters import HTTPAdapter
+
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class PooledFetcher(Fetcher):  # fetches from the Discogs API through pooled connections, within a rate limit
+    backoff_enabled = False  # retries are handled here instead, so that they go through the rate limiter too
+
+    def __init__(self, user_token=None, rate=60, pool_size=10, max_retries=5, backoff=2.0, timeout=30):
+        self.user_token = user_token  # personal user token, requests are unauthenticated without it
+        self.bucket = TokenBucket(rate / 60, capacity=min(pool_size, max(rate / 60, 1)))  # rate is per minute
+        self.max_retries = max_retries  # attempts after a 429 before giving up
+        self.backoff = backoff  # seconds waited after the first 429, doubled after each further one
+        self.timeout = timeout  # seconds to wait for Discogs to answer
+        self.session = requests.Session()  # keeps connections alive between requests
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.rate_limit_remaining = None  # requests left in the current minute, as last reported by Discogs
+        self.requests = 0  # number of requests sent by this process
+        self.retries = 0  # number of requests sent again after a 429
+        self.waited = 0.0  # seconds spent waiting for the rate limiter
+        self._lock = threading.Lock()  # protects the counters
+
+    def fetch(self, client, method, url, data=None, headers=None, json_format=True):
+        data = json.dumps(data) if json_format and data else data
+        params = {'token': self.user_token} if self.user_token else None
+        for attempt in range(self.max_retries + 1):
+            waited = self.bucket.acquire()
+            response = self.session.request(method, url, data=data, headers=headers, params=params,
+                                            timeout=self.timeout)
+            self._count(waited, retry=attempt > 0)
+            self.rate_limit_remaining = response.headers.get('X-Discogs-Ratelimit-Remaining')
+            logger.debug('Discogs %s %s: %d after waiting %.3fs', method, url, response.status_code, waited)
+            if response.status_code != 429:
+                break
+            delay = float(response.headers.get('Retry-After') or self.backoff * 2 ** attempt)
+            logger.warning('Discogs rate limit hit, backing off for %.1fs', delay)
+            self.bucket.pause(delay)  # the next attempt, and everyone else's, waits for it
+        return response.content, response.status_code  # a final 429 is raised as an error by the client
+
+    def _count(self, waited, retry):
+        with self._lock:
+            self.requests += 1
+            self.retries += retry
+            self.waited += waited
+
+    def stats(self):  # counters of this process
+        return {'requests': self.requests, 'retries': self.retries, 'waited': round(self.waited, 3)}
@@ -0,0 +1,100 @@
+"""
+This file defines the background jobs that create new polls.
+Jobs are stored in the database as PollJob entries, so they survive restarts and no external
+broker is needed. They are executed by a pool of worker threads inside the web process, and
+the management command "run_poll_jobs" can execute them from a separate process as well.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import PollJob
+from .services import create_poll
+from .singleflight import get_single_flight
+
+logger = logging.getLogger(__name__)
+
+_executor = None  # worker pool of this process, created on first use
+_executor_lock = threading.Lock()
+
+
+def get_executor():  # returns this process' worker pool
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.POLLS_JOB_WORKERS, thread_name_prefix='poll-job')
+        return _executor
+
+
+# stores a new job in the database and hands it to the worker pool once the transaction commits
+# if a job for the same genre and year is already queued or running, that job is returned instead
+# if POLLS_JOBS_EAGER is set, the job is executed right away instead
+# if POLLS_JOB_WORKERS is 0, the job is left for "run_poll_jobs" to pick up
+def enqueue(genre, year, refresh=False):
+    recent = timezone.now() - timedelta(seconds=settings.POLLS_JOB_TIMEOUT)  # older jobs may have been abandoned
+    in_flight = (PollJob.objects.filter(genre=genre, year=year, status__in=(PollJob.QUEUED, PollJob.RUNNING),
+                                        updated__gte=recent).order_by('created').first())
+    if in_flight is not None:  # its poll will be fresh, whether or not a refresh was asked for
+        get_single_flight().record(saved=True)
+        return in_flight
+
+    job = PollJob.objects.create(genre=genre, year=year, refresh=refresh)
+    if settings.POLLS_JOBS_EAGER:
+        run_job(job.pk)
+        job.refresh_from_db()
+    elif settings.POLLS_JOB_WORKERS > 0:
+        transaction.on_commit(lambda: get_executor().submit(run_job, job.pk, close_connection=True))
+    return job
+
+
+# marks a queued job as running, returns whether this worker got it
+# the conditional update guarantees that no two workers ever run the same job
+def claim(job_id):
+    return PollJob.objects.filter(pk=job_id, status=PollJob.QUEUED).update(status=PollJob.RUNNING,
+                                                                            updated=timezone.now()) == 1
+
+
+# executes a job: creates its poll and records the outcome
+# polls built from partial results are queued again to be completed, if POLLS_PARTIAL_TOP_UP is set
+def run_job(job_id, close_connection=False):
+    try:
+        if not claim(job_id):  # already taken by another worker
+            return
+        job = PollJob.objects.get(pk=job_id)
+        # new polls are built within the creation budget, refreshes take as long as Discogs needs
+        budget = None if job.refresh else settings.POLLS_CREATE_BUDGET
+        try:
+            job.question = create_poll(job.genre, job.year, refresh=job.refresh, budget=budget)
+            job.status = PollJob.DONE
+        except Exception as e:  # any failure is recorded on the job, so the user can be told about it
+            logger.exception('Poll job %d failed', job_id)
+            job.status = PollJob.FAILED
+            job.error = str(e) or e.__class__.__name__
+        job.save()
+        if job.question is not None and job.question.partial and settings.POLLS_PARTIAL_TOP_UP:
+            enqueue(job.genre, job.year, refresh=True)  # the pages left out are fetched in the background
+    finally:
+        if close_connection:  # worker threads must not keep database connections open
+            connection.close()
+
+
+# puts jobs that have been running for longer than POLLS_JOB_TIMEOUT back in the queue
+# this recovers jobs whose worker died, e.g. because the server was restarted
+def requeue_stale_jobs():
+    deadline = timezone.now() - timedelta(seconds=settings.POLLS_JOB_TIMEOUT)
+    return PollJob.objects.filter(status=PollJob.RUNNING, updated__lt=deadline).update(status=PollJob.QUEUED)
+
+
+# executes every queued job with a pool of "workers" threads, returns the number of jobs found
+def run_queued_jobs(workers):
+    requeue_stale_jobs()
+    job_ids = list(PollJob.objects.filter(status=PollJob.QUEUED).order_by('created').values_list('pk', flat=True))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='poll-job') as executor:
+        list(executor.map(lambda job_id: run_job(job_id, close_connection=True), job_ids))
+    return len(job_ids)
@@ -0,0 +1,38 @@
+"""
+This file defines the management command "audit_queries", which requests the main pages of the app
+polls against a large synthetic dataset in a freshly created test database, and reports the queries
+whose plan reads a whole table or index. It fails if there is any, so it can be run after every
+change to the models, views or templates. For example:
+
+    python manage.py audit_queries
+    python manage.py audit_queries --questions 1000000 --verbosity 2  # also prints every plan
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.audit import audit, seed
+from polls.benchmarks import test_database
+
+
+class Command(BaseCommand):
+    help = 'Explains the queries of the main pages of the polls and flags full scans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=100000)  # polls seeded, with 10 albums each
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.stdout.write(f'Seeding {options["questions"]} polls...')
+            results = audit(seed(options['questions']))
+
+        flagged = 0
+        for page, sql, plan, scans in results:
+            if scans or options['verbosity'] > 1:
+                self.stdout.write(f'{page}: {sql}')
+                for step in plan:
+                    self.stdout.write(f'    {"FULL SCAN " if step in scans else ""}{step}')
+            flagged += bool(scans)
+        pages = len({page for page, *_ in results})
+        if flagged:
+            raise CommandError(f'{flagged} of {len(results)} queries on {pages} pages read a whole table or index.')
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} queries on {pages} pages, none reads a whole table.'))
@@ -0,0 +1,44 @@
+"""
+This file defines the management command "benchmark", which runs one of the micro-benchmarks
+of the app polls and prints its results as a table. For example:
+
+    python manage.py benchmark ranking --sizes 1000 10000 100000
+    python manage.py benchmark create --workers 1 8 --latency 0.05
+    python manage.py benchmark prebuild --workers 1 2 4 8
+    python manage.py benchmark coalesce --count 50 --workers 8 16
+    python manage.py benchmark crawl --directory fixtures/discogs
+    python manage.py benchmark vote --count 5000 --workers 1 8
+    python manage.py benchmark shards --sizes 1 4 16 --workers 8 32
+    python manage.py benchmark stream --sizes 1000 10000
+    python manage.py benchmark pagination --sizes 100 10000 1000000
+    python manage.py benchmark pages --sizes 1000 --count 2000
+    python manage.py benchmark search --sizes 10000 100000 1000000
+    python manage.py benchmark api --sizes 1000 --count 500
+"""
+
+from django.core.management.base import BaseCommand
+
+from polls.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Runs one of the micro-benchmarks of the app polls.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS))  # which benchmark to run
+        parser.add_argument('--sizes', nargs='+', type=int)  # input sizes, if the benchmark takes any
+        parser.add_argument('--artists', type=int)  # number of distinct artists in synthetic data
+        parser.add_argument('--count', type=int)  # number of operations, if the benchmark takes it
+        parser.add_argument('--workers', nargs='+', type=int)  # numbers of concurrent threads to compare
+        parser.add_argument('--latency', type=float)  # simulated Discogs latency per page, in seconds
+        parser.add_argument('--directory')  # Discogs recordings to replay, if the benchmark uses them
+
+    def handle(self, *args, **options):
+        name = options.pop('name')
+        # only pass on the options actually given, so that each benchmark keeps its own defaults
+        kwargs = {key: value for key, value in options.items() if value is not None}
+        rows = BENCHMARKS[name](**kwargs)
+
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+        for row in rows:  # prints the results as an aligned table
+            self.stdout.write('  '.join(str(cell).rjust(width) for cell, width in zip(row, widths)))
@@ -0,0 +1,37 @@
+"""
+This file defines the management command "build_availability", which builds the availability index
+of the app polls, the number of albums Discogs has for each genre and year, in bulk and without
+querying Discogs: from the entries of the search cache, the searches recorded for ReplayClient in the
+given directories, and the existing polls. The creation form then disables the combinations without
+albums. It can be run again whenever more searches have been cached or recorded. For example:
+
+    python manage.py build_availability
+    python manage.py build_availability --recordings fixtures/discogs
+"""
+
+import itertools
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.availability import build_availability, cached_counts, poll_counts, recorded_counts
+
+
+class Command(BaseCommand):
+    help = 'Builds the index of the genres and years Discogs has albums for, from cached and recorded searches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recordings', nargs='+', default=[])  # directories of RecordingClient's searches
+        parser.add_argument('--batch-size', type=int, default=1000)  # combinations written per query
+
+    def handle(self, *args, **options):
+        sources = [poll_counts()]
+        if settings.DISCOGS_CACHE_DIR:
+            sources.append(cached_counts(settings.DISCOGS_CACHE_DIR))
+        for directory in options['recordings']:
+            if not os.path.isdir(directory):
+                raise CommandError(f'No such directory: {directory}')
+            sources.append(recorded_counts(directory))
+        combinations, empty = build_availability(itertools.chain(*sources), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{combinations} combination(s) indexed, {empty} without albums.'))
@@ -0,0 +1,23 @@
+"""
+This file defines the management command "merge_duplicate_polls", which merges polls sharing the
+same genre and year into the oldest of them, adding up their votes. It must be run on existing
+databases before migrating the unique constraint on (genre, year). For example:
+
+    python manage.py merge_duplicate_polls --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+
+from polls.services import merge_duplicate_questions
+
+
+class Command(BaseCommand):
+    help = 'Merges polls that share the same genre and year, adding up their votes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')  # report what would be merged without changing anything
+
+    def handle(self, *args, **options):
+        merged = merge_duplicate_questions(dry_run=options['dry_run'])
+        verb = 'would be' if options['dry_run'] else 'were'
+        self.stdout.write(self.style.SUCCESS(f'{merged} duplicate poll(s) {verb} merged.'))
@@ -0,0 +1,109 @@
+"""
+This file defines the management command "prebuild_polls", which pre-generates polls for a grid
+of genres and years, so that users picking one of those combinations get their poll instantly.
+Combinations are crawled by a pool of worker threads, within a budget of Discogs searches per
+minute. Finished combinations are saved to a checkpoint file, so an interrupted run can be resumed
+by running the same command again. For example:
+
+    python manage.py prebuild_polls --genres Grunge Punk --from-year 1970 --to-year 1999 --workers 8
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from polls.models import Question
+from polls.ratelimit import TokenBucket
+from polls.services import create_poll
+from polls.views import get_parameters
+
+
+class Command(BaseCommand):
+    help = 'Pre-generates polls for a grid of genres and years.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--genres', nargs='+')  # genres to build, all of them by default
+        parser.add_argument('--years', nargs='+', type=int)  # years to build, all of them by default
+        parser.add_argument('--from-year', type=int)  # first year to build, if --years is not given
+        parser.add_argument('--to-year', type=int)  # last year to build, if --years is not given
+        parser.add_argument('--workers', type=int, default=4)  # number of combinations crawled at the same time
+        parser.add_argument('--rate', type=float, default=60.0)  # maximum Discogs searches per minute
+        parser.add_argument('--checkpoint', default='prebuild_polls.json')  # file recording finished combinations
+        parser.add_argument('--restart', action='store_true')  # ignore the checkpoint and start over
+
+    def handle(self, *args, **options):
+        combinations = self.grid(options)
+        checkpoint = options['checkpoint']
+        finished = set() if options['restart'] else self.load_checkpoint(checkpoint)
+        pending = [combination for combination in combinations if f'{combination[0]}|{combination[1]}' not in finished]
+        self.stdout.write(f'{len(combinations)} combinations, {len(combinations) - len(pending)} already finished, '
+                          f'{len(pending)} to go with {options["workers"]} worker(s).')
+
+        bucket = TokenBucket(options['rate'] / 60, capacity=options['workers'])  # shared by all workers
+        lock = threading.Lock()  # protects the checkpoint file
+        counts = {'created': 0, 'existing': 0, 'empty': 0, 'failed': 0}
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = [executor.submit(self.build, genre, year, bucket) for genre, year in pending]
+            for done, future in enumerate(as_completed(futures), start=1):
+                genre, year, outcome = future.result()
+                counts[outcome] += 1
+                if outcome != 'failed':  # failed combinations are tried again on the next run
+                    with lock:
+                        finished.add(f'{genre}|{year}')
+                        self.save_checkpoint(checkpoint, finished)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'[{done}/{len(pending)}] {genre} {year}: {outcome} '
+                                  f'({done / elapsed:.2f} combinations/s)')
+
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{count} {outcome}' for outcome, count in counts.items())))
+
+    # builds the poll for one combination, unless it exists already, and returns the outcome
+    def build(self, genre, year, bucket):
+        try:
+            if Question.objects.filter(genre=genre, year=year).exists():  # built already, by this or by a user
+                return genre, year, 'existing'
+            bucket.acquire()  # waits for the rate budget to allow one more search
+            question = create_poll(genre, year, prebuilt=True)
+            return genre, year, 'created' if question is not None else 'empty'
+        except Exception as e:  # one failure must not stop the whole run
+            self.stderr.write(f'{genre} {year}: {e}')
+            return genre, year, 'failed'
+        finally:
+            connection.close()  # worker threads must not keep database connections open
+
+    @staticmethod
+    def grid(options):  # list of (genre, year) combinations selected by the options
+        genres, years = get_parameters()
+        if options['genres']:
+            unknown = set(options['genres']) - set(genres)
+            if unknown:
+                raise CommandError(f'Unknown genre(s): {", ".join(sorted(unknown))}')
+            genres = options['genres']
+        if options['years']:
+            years = options['years']
+        else:
+            years = [year for year in years if (options['from_year'] or 0) <= year <= (options['to_year'] or year)]
+        return [(genre, year) for genre in genres for year in years]
+
+    @staticmethod
+    def load_checkpoint(path):  # set of "<genre>|<year>" combinations finished by previous runs
+        try:
+            with open(path, encoding='utf-8') as file:
+                return set(json.load(file)['finished'])
+        except FileNotFoundError:
+            return set()
+
+    @staticmethod
+    def save_checkpoint(path, finished):  # written to a temporary file first, so it is never left half-written
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump({'finished': sorted(finished)}, file)
+        os.replace(temporary, path)
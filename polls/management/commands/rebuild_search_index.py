@@ -0,0 +1,25 @@
+"""
+This file defines the management command "rebuild_search_index", which creates the search table
+of the app polls again and indexes every poll. It is needed once after upgrading a database that
+already has polls, and whenever the index may have missed changes, e.g. after a crash or after
+data was written without going through the models. For example:
+
+    python manage.py rebuild_search_index
+"""
+
+from django.core.management.base import BaseCommand
+
+from polls.search import rebuild_search_index, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of the polls.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)  # polls indexed per transaction
+
+    def handle(self, *args, **options):
+        if search_backend() is None:
+            self.stdout.write('This database has no search table, searches use LIKE queries instead.')
+            return
+        self.stdout.write(self.style.SUCCESS(f'{rebuild_search_index(options["batch_size"])} poll(s) indexed.'))
@@ -0,0 +1,35 @@
+"""
+This file defines the management command "rollup_vote_events", which adds up the votes appended to
+the vote log since its last run into hourly and daily totals per choice. It is meant to be run
+periodically, e.g. every minute from cron, or continuously with --interval. For example:
+
+    python manage.py rollup_vote_events
+    python manage.py rollup_vote_events --interval 30
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.analytics import rollup_backlog, rollup_vote_events
+
+
+class Command(BaseCommand):
+    help = 'Adds up the votes logged since the last run into hourly and daily totals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)  # vote events added up per transaction
+        parser.add_argument('--interval', type=float)  # seconds between runs, runs once if not given
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:  # one batch after another until the log is caught up with
+                count = rollup_vote_events(options['batch_size'])
+                total += count
+                if count < options['batch_size']:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'{total} vote event(s) rolled up, {rollup_backlog()} waiting.'))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
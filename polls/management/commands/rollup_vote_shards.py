@@ -0,0 +1,18 @@
+"""
+This file defines the management command "rollup_vote_shards", which folds the votes counted by
+vote shards back into their choices. It is meant to be run periodically, e.g. every minute from
+cron, while POLLS_VOTE_SHARDS is above 1, and once more after sharding is turned off. For example:
+
+    python manage.py rollup_vote_shards
+"""
+
+from django.core.management.base import BaseCommand
+
+from polls.votes import rollup_vote_shards
+
+
+class Command(BaseCommand):
+    help = 'Folds the votes counted by vote shards back into their choices.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'{rollup_vote_shards()} vote(s) rolled up.'))
@@ -0,0 +1,32 @@
+"""
+This file defines the management command "run_poll_jobs", which executes queued poll-creation
+jobs from a separate process. It is meant for deployments that set POLLS_JOB_WORKERS to 0, and
+for recovering jobs left behind by a restart. For example:
+
+    python manage.py run_poll_jobs --workers 4
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from polls.jobs import run_queued_jobs
+
+
+class Command(BaseCommand):
+    help = 'Executes queued poll-creation jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=max(settings.POLLS_JOB_WORKERS, 1))  # pool size
+        parser.add_argument('--interval', type=float, default=2.0)  # seconds between looks at the queue
+        parser.add_argument('--once', action='store_true')  # drain the queue once and exit
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_queued_jobs(options['workers'])
+            if count:
+                self.stdout.write(f'Executed {count} job(s).')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -18,6 +18,22 @@ class Question(models.Model):  # poll's question
     year = models.IntegerField(default=0)  # question's year
     text = models.CharField(max_length=100)  # question's text as "What is the best <genre> album of <year>?"
     pub_date = models.DateTimeField('date published', default=timezone.now)  # question's pub_date
+    prebuilt = models.BooleanField(default=False)  # whether the question was pre-generated by prebuild_polls
+    partial = models.BooleanField(default=False)  # whether the choices come from only part of Discogs' results
+
+    class Meta:
+        constraints = [  # only one poll per genre and year, which also indexes lookups by genre and year
+            models.UniqueConstraint(fields=['genre', 'year'], name='unique_question_genre_year'),
+        ]
+        indexes = [
+            # pages of the polls index, most recent first, see polls/pagination.py, and the admin's date filter
+            models.Index(fields=['-pub_date', '-id'], name='polls_question_pub_date_id'),
+            # the admin's filter of partial polls, in the same order: MySQL compares the flag with 1, which the first
+            # index serves, SQLite tests the flag as is, which only the second one, holding partial polls alone, serves
+            models.Index(fields=['partial', '-pub_date', '-id'], name='polls_question_partial'),
+            models.Index(fields=['-pub_date', '-id'], condition=models.Q(partial=True),
+                         name='polls_question_partial_only'),
+        ]
 
     def __str__(self):  # returns a string that describes the model
         return self.text  # returns "What is the best <genre> album of <year>?"
@@ -46,3 +62,118 @@ class Choice(models.Model):  # poll's choice (each one is an album)
 
     def __str__(self):  # returns a string that describes the model
         return f'{self.artist} - {self.title}'  # returns "<artist> - <title>"
+
+    @admin.display(description='Total votes')  # title of descriptive column
+    def total_votes(self):  # votes of the album, including those still spread across vote shards
+        return self.votes + (self.voteshard_set.aggregate(votes=models.Sum('votes'))['votes'] or 0)
+
+
+class VoteShard(models.Model):  # one of the counters a hot choice's votes are spread across
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)  # choice whose votes are counted
+    shard = models.SmallIntegerField()  # shard number, from 0 to POLLS_VOTE_SHARDS - 1
+    votes = models.IntegerField(default=0)  # votes counted by this shard and not yet rolled up into the choice
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'shard'], name='unique_voteshard_choice_shard'),
+        ]
+
+    def __str__(self):  # returns a string that describes the model
+        return f'{self.choice} #{self.shard}'  # returns "<artist> - <title> #<shard>"
+
+
+class VoteEvent(models.Model):  # one vote, as kept by the append-only vote log
+    id = models.BigAutoField(primary_key=True)  # grows with every vote, so it marks how far the log has been read
+    question = models.ForeignKey(Question, on_delete=models.CASCADE,
+                                 db_index=False)  # question voted on, indexed together with the time below
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)  # choice voted for
+    created = models.DateTimeField(default=timezone.now)  # when the vote was cast
+
+    class Meta:
+        indexes = [  # votes of a question over a period of time
+            models.Index(fields=['question', 'created'], name='polls_voteevent_question_time'),
+        ]
+
+    def __str__(self):  # returns a string that describes the model
+        return f'{self.choice} @ {self.created:%Y-%m-%d %H:%M:%S}'  # returns "<artist> - <title> @ <time>"
+
+
+class VoteRollup(models.Model):  # votes a choice received during one hour or one day, added up from the vote log
+    HOUR = 'hour'  # the period starts on the hour
+    DAY = 'day'  # the period starts at midnight
+    PERIOD_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE,
+                                 db_index=False)  # question of the choice, indexed together with the period below
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)  # choice whose votes are added up
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)  # length of the period
+    start = models.DateTimeField()  # when the period starts
+    votes = models.IntegerField(default=0)  # votes cast during the period
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'period', 'start'], name='unique_voterollup_choice_period'),
+        ]
+        indexes = [  # votes of a question, period by period
+            models.Index(fields=['question', 'period', 'start'], name='polls_voterollup_question'),
+        ]
+
+    def __str__(self):  # returns a string that describes the model
+        return f'{self.choice} {self.period} of {self.start:%Y-%m-%d %H:%M}'  # returns "<choice> <period> of <start>"
+
+
+class RollupWatermark(models.Model):  # how far a rollup has read the vote log
+    name = models.CharField(max_length=50, unique=True)  # rollup's name
+    last_event = models.BigIntegerField(default=0)  # id of the last vote event added up, later ones are still to do
+    updated = models.DateTimeField(auto_now=True)  # when the rollup last moved on
+
+    def __str__(self):  # returns a string that describes the model
+        return f'{self.name} at {self.last_event}'  # returns "<name> at <last event id>"
+
+
+class PollJob(models.Model):  # background job that creates a new poll
+    QUEUED = 'queued'  # waiting for a worker
+    RUNNING = 'running'  # being executed by a worker
+    DONE = 'done'  # finished, question is set unless Discogs had no albums
+    FAILED = 'failed'  # finished with an error
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    genre = models.CharField(max_length=50)  # genre of the poll to be created
+    year = models.IntegerField(default=0)  # year of the poll to be created
+    refresh = models.BooleanField(default=False)  # whether an existing poll should be crawled again
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)  # job's current status
+    question = models.ForeignKey(Question, on_delete=models.SET_NULL, default=None, blank=True,
+                                 null=True)  # poll created by the job
+    error = models.TextField(default='', blank=True)  # error message, if the job failed
+    created = models.DateTimeField(default=timezone.now)  # when the job was enqueued
+    updated = models.DateTimeField(auto_now=True)  # when the job last changed status
+
+    class Meta:
+        indexes = [
+            # jobs in flight for the poll asked for, looked up by every creation request, see polls/jobs.py
+            models.Index(fields=['genre', 'year'], name='polls_polljob_genre_year'),
+            # the queue of jobs, oldest first, as run by run_poll_jobs and filtered by the admin
+            models.Index(fields=['status', 'created'], name='polls_polljob_status_created'),
+        ]
+
+    def __str__(self):  # returns a string that describes the model
+        return f'{self.genre} {self.year} ({self.status})'  # returns "<genre> <year> (<status>)"
+
+
+class Availability(models.Model):  # number of albums Discogs has for a genre and year, as found by build_availability
+    genre = models.CharField(max_length=50)  # genre, or style in Discogs' terms
+    year = models.IntegerField()  # year
+    albums = models.IntegerField()  # number of Discogs masters for the genre and year, 0 if it has none
+    updated = models.DateTimeField(auto_now=True)  # when the number was last found
+
+    class Meta:
+        constraints = [  # one number per genre and year, which also indexes lookups by genre and year
+            models.UniqueConstraint(fields=['genre', 'year'], name='unique_availability_genre_year'),
+        ]
+        indexes = [  # the empty combinations, offered disabled by the creation form
+            models.Index(fields=['genre', 'year'], condition=models.Q(albums=0), name='polls_availability_empty'),
+        ]
+        verbose_name_plural = 'availabilities'
+
+    def __str__(self):  # returns a string that describes the model
+        return f'{self.genre} {self.year}: {self.albums}'  # returns "<genre> <year>: <albums>"
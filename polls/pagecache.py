@@ -0,0 +1,243 @@
+"""
+This file defines the cache of rendered pages and fragments of the app polls.
+
+Whatever is cached is keyed by the versions of the data it was rendered from: one version per poll,
+bumped whenever the poll, its albums or its votes change, along with its ranking (see
+polls/results.py), and one for the list of polls, bumped whenever a poll is added, changed or
+deleted. Bumping a version makes everything rendered from the previous one unreachable, so nothing
+has to be found and deleted, and what is left behind expires on its own or is evicted by the cache
+backend. A version evicted before its entries is simply handed out again as a new one.
+
+Fragments are the parts of a page that are the same for everyone, e.g. the albums of a poll, and
+are cached whoever asks for them. Whole pages are only cached for anonymous users, as logged-in
+users see their own links in the navigation bar, and never if they hold a CSRF token, which is
+personal to each browser: such pages, e.g. the voting form, only have their fragments cached.
+
+Entries go to the cache named by POLLS_PAGE_CACHE, in local memory by default, and live for at most
+POLLS_PAGE_CACHE_TTL seconds. Versions go to the cache named by POLLS_VERSION_CACHE, which every
+process must share, files by default: a vote or a new poll handled by any process, including
+"run_poll_jobs", makes the entries of every other process unreachable too. Each process may keep its
+own entries, as they are only ever reached through the shared versions. Versions are never evicted,
+but only polls that exist get one, and it is dropped along with its poll, so that requests for unknown
+polls, which are never cached, leave nothing behind. Cached pages are answered with "X-Cache: hit",
+rendered ones with "X-Cache: miss", and the counters of each process are kept by PageCache.
+
+As versions are the time their poll last changed, they also answer conditional requests: pages of a
+poll carry it as Last-Modified, along with an ETag derived from it, and clients sending either back
+get 304 Not Modified after a single cache lookup, without a query, until the poll changes again,
+whichever process answers them.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .models import Question
+from .signals import choices_changed
+
+LIST_VERSION = 'polls:version:list'  # cache key of the version of the list of polls
+CSRF_FIELD = 'csrfmiddlewaretoken'  # name of the hidden field holding the CSRF token, never cached
+HEADERS = ('Content-Type', 'X-Next-Cursor')  # headers of a page kept along with its body
+
+
+def poll_version(question_id):  # cache key of the version of a poll
+    return f'polls:version:poll:{question_id}'
+
+
+class PageCache:  # rendered pages and fragments, keyed by the versions of the polls they show
+    def __init__(self, alias, versions_alias, ttl):
+        self.cache = caches[alias]  # cache backend holding the entries
+        self.versions_cache = caches[versions_alias]  # cache backend holding the versions, shared by every process
+        self.ttl = ttl  # seconds an entry stays valid for, unless a version is bumped earlier
+        self.hits = {'page': 0, 'fragment': 0}  # number of entries served from the cache by this process
+        self.misses = {'page': 0, 'fragment': 0}  # number of entries that had to be rendered
+        self._lock = threading.Lock()  # protects the counters
+
+    def _count(self, kind, hit):
+        with self._lock:
+            (self.hits if hit else self.misses)[kind] += 1
+
+    # returns the current versions of the list of polls and of the given polls, in a single cache lookup
+    # versions missing from the cache, never set or evicted, are set to a new one, only for polls that exist:
+    # the others get None, so that requests for unknown polls, which are never cached, leave no version behind
+    def versions(self, *question_ids):
+        keys = [LIST_VERSION, *(poll_version(question_id) for question_id in question_ids)]
+        found = self.versions_cache.get_many(keys)
+        missing = [question_id for question_id in question_ids if poll_version(question_id) not in found]
+        existing = set()
+        if missing:  # a single query, until their versions are set
+            existing = {str(pk) for pk in Question.objects.filter(pk__in=missing).values_list('pk', flat=True)}
+        for key, question_id in zip(keys, [None, *question_ids]):
+            if key in found:
+                continue
+            if question_id is not None and str(question_id) not in existing:
+                found[key] = None
+                continue
+            self.versions_cache.add(key, time.time_ns(), None)  # unless another process did meanwhile
+            found[key] = self.versions_cache.get(key)
+        return [found[key] for key in keys]
+
+    # makes everything rendered from the given polls, and from the list of polls if "listed", unreachable
+    def bump(self, *question_ids, listed=False):
+        version = time.time_ns()
+        keys = [poll_version(question_id) for question_id in question_ids] + ([LIST_VERSION] if listed else [])
+        self.versions_cache.set_many(dict.fromkeys(keys, version), None)
+
+    def forget(self, *question_ids):  # drops the versions of deleted polls, which nothing is cached under any more
+        self.versions_cache.delete_many([poll_version(question_id) for question_id in question_ids])
+
+    def key(self, kind, name, versions):  # cache key of an entry, short whatever the name
+        digest = hashlib.md5(f'{name}|{versions}'.encode(), usedforsecurity=False).hexdigest()
+        return f'polls:{kind}:{digest}'
+
+    # returns the cached fragment "name" of the given polls, rendering it with "render" if it is not cached
+    def fragment(self, name, question_ids, render):
+        versions = self.versions(*question_ids)
+        if None in versions:  # a poll deleted meanwhile
+            return render()
+        key = self.key('fragment', name, versions)
+        content = self.cache.get(key)
+        self._count('fragment', hit=content is not None)
+        if content is None:
+            content = render()
+            if CSRF_FIELD not in content:
+                self.cache.set(key, content, self.ttl)
+        return content
+
+    # cache key of a page, by its full path and the versions it shows, None for the page of a poll that does not exist
+    def page_key(self, request, question_id=None):
+        versions = self.versions(*([question_id] if question_id is not None else []))
+        return self.key('page', request.get_full_path(), versions) if None not in versions else None
+
+    # returns the cached response of the page with the given key, None if there is none
+    def get_page(self, key):
+        cached = self.cache.get(key)
+        self._count('page', hit=cached is not None)
+        if cached is None:
+            return None
+        content, headers = cached
+        response = HttpResponse(content)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    # caches a rendered page under the key it was looked up with, if it is the same for every anonymous user
+    # returns whether it was cached
+    def set_page(self, key, request, response):
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return False
+        if request.META.get('CSRF_COOKIE_NEEDS_UPDATE') or CSRF_FIELD.encode() in response.content:
+            return False
+        headers = {header: response[header] for header in HEADERS if header in response}
+        self.cache.set(key, (response.content, headers), self.ttl)
+        return True
+
+    def stats(self):  # hit and miss counters of this process, and the ratio of hits, by kind of entry
+        return {kind: {'hits': self.hits[kind], 'misses': self.misses[kind],
+                       'ratio': self.hits[kind] / ((self.hits[kind] + self.misses[kind]) or 1)}
+                for kind in self.hits}
+
+
+_page_caches = {}  # one page cache per configuration, so that tests overriding the settings get their own
+
+
+# returns the page cache configured in the settings
+def get_page_cache():
+    key = (settings.POLLS_PAGE_CACHE, settings.POLLS_VERSION_CACHE, settings.POLLS_PAGE_CACHE_TTL)
+    if key not in _page_caches:
+        _page_caches[key] = PageCache(*key)
+    return _page_caches[key]
+
+
+# decorator caching the GET responses of a view for anonymous users, see PageCache.set_page for which ones
+# pages of a single poll, whose URL names it "pk" or "question_id", are keyed by its version too
+# the key is taken before rendering, so that a page rendered while its poll changes is kept under the old version
+def cached_page(view):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        page_cache = get_page_cache()
+        key = page_cache.page_key(request, kwargs.get('pk', kwargs.get('question_id')))
+        if key is None:  # no such poll, left to the view to answer 404
+            return view(request, *args, **kwargs)
+        response = page_cache.get_page(key)
+        if response is not None:
+            response['X-Cache'] = 'hit'
+            return response
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):  # template responses are rendered lazily, after the view has returned
+            response.render()
+        page_cache.set_page(key, request, response)
+        response['X-Cache'] = 'miss'
+        return response
+
+    return wrapper
+
+
+# decorator answering conditional GET requests for the page of a poll, whose URL names it "pk", from its version
+# the version is read from the shared cache, so that every process tags a page alike and tells a change from any other
+# the ETag is a digest of the version, of the path and of the session and CSRF cookies, as pages show who is logged
+# in and hold CSRF tokens valid for their browser only: a client logging in or out gets the page again
+# Last-Modified is the second of the version, left out until that second is over, as a change later in the same
+# second would not be told apart from it
+def conditional_page(view):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        _, version = get_page_cache().versions(kwargs['pk'])
+        if version is None:  # no such poll, left to the view to answer 404 without any validator
+            return view(request, *args, **kwargs)
+        cookies = [request.COOKIES.get(name, '') for name in (settings.SESSION_COOKIE_NAME, settings.CSRF_COOKIE_NAME)]
+        digest = hashlib.md5(f'{request.get_full_path()}|{version}|{cookies}'.encode(), usedforsecurity=False)
+        etag = f'"{digest.hexdigest()}"'
+        last_modified = version // 10 ** 9 if version // 10 ** 9 < int(time.time()) else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Cookie',))  # for caches between the client and the site
+        return response
+
+    return wrapper
+
+
+# bumps the versions of the given polls right away, for the rest of the transaction, and again once it commits,
+# so that pages other requests render meanwhile, from the data as it was before, are not kept either
+def bump_versions(*question_ids, listed=False):
+    page_cache = get_page_cache()
+    page_cache.bump(*question_ids, listed=listed)
+    transaction.on_commit(lambda: page_cache.bump(*question_ids, listed=listed))
+
+
+@receiver(post_save, sender=Question)
+def question_changed(sender, instance, **kwargs):  # the poll's pages, and the list of polls, show it
+    bump_versions(instance.pk, listed=True)
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):  # the list of polls shows it, and its own version is not needed
+    page_cache, question_id = get_page_cache(), instance.pk  # the instance loses its pk once deleted
+    bump_versions(listed=True)
+    page_cache.forget(question_id)
+    transaction.on_commit(lambda: page_cache.forget(question_id))
+
+
+@receiver(choices_changed)
+def choices_written(sender, questions, **kwargs):  # albums written in bulk, maybe for polls created in bulk too
+    bump_versions(*questions, listed=True)
@@ -0,0 +1,44 @@
+"""
+This file defines the keyset pagination of the polls index.
+Instead of skipping the questions of the previous pages (OFFSET), which the database has to read
+and throw away, each page starts right after the last question of the previous one, found through
+the index on (pub_date, id). Fetching any page therefore costs the same, however deep it is and
+however many polls there are.
+
+Pages are addressed by a cursor, "<pub_date in microseconds since the epoch>.<id>" of the last
+question of the previous page, which is opaque to users but short enough for a query string.
+"""
+
+import datetime
+
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def encode_cursor(question):  # returns the cursor of the page that starts after the given question
+    return f'{(question.pub_date - EPOCH) // MICROSECOND}.{question.pk}'
+
+
+def decode_cursor(cursor):  # returns the (pub_date, id) of a cursor, raises BadRequest if it is not one
+    try:
+        microseconds, pk = (int(part) for part in cursor.split('.'))
+        return EPOCH + datetime.timedelta(microseconds=microseconds), pk
+    except (ValueError, OverflowError):
+        raise BadRequest(f'Invalid cursor: {cursor!r}')
+
+
+# returns the questions of a page, most recent first, and the cursor of the next page, None if it is the last
+# the page starts after the cursor, or at the most recent question if there is no cursor
+def keyset_page(queryset, cursor=None, size=20):
+    queryset = queryset.order_by('-pub_date', '-pk')
+    if cursor:
+        pub_date, pk = decode_cursor(cursor)
+        # the first condition alone bounds the scan of the index, which the OR on its own would not do
+        queryset = queryset.filter(Q(pub_date__lte=pub_date), Q(pub_date__lt=pub_date) | Q(pk__lt=pk))
+    page = list(queryset[:size + 1])  # one more, to tell whether there is a next page without counting
+    if len(page) > size:
+        return page[:size], encode_cursor(page[size - 1])
+    return page, None
@@ -0,0 +1,39 @@
+"""
+This file defines how the albums returned by Discogs are ranked to become a poll's choices.
+Albums are consumed one at a time, so the whole set of search results never needs to be
+held in memory: only the most popular album of each artist is kept while they stream in.
+"""
+
+import heapq
+
+
+# an album's popularity is the number of Discogs users who either own it or want it
+def popularity(album):
+    return album['have'] + album['want']
+
+
+# returns the k most popular albums from an iterable of album dictionaries, one album per artist
+# the result is ordered from least to most popular, ties going to the album that was seen last
+# if the albums are known to arrive from most to least popular, consumption stops as soon as the
+# remaining ones can no longer make it into the top k, so that the rest never needs to be fetched
+def top_albums(albums, k=10, sorted_by_popularity=False):
+    best = {}  # artist -> (popularity, arrival order, album), only their most popular album
+    settled = []  # min-heap of the k highest popularities among distinct artists, only kept for sorted albums
+    for arrival, album in enumerate(albums):
+        score = popularity(album)
+        # every album still to come is at most as popular as this one, and ties go to later albums,
+        # so only once this one is strictly less popular than the k-th artist is the top k final
+        if sorted_by_popularity and len(settled) == k and score < settled[0]:
+            break
+        current = best.get(album['artist'])
+        if current is None or score > current[0]:  # new artist, or a more popular album by a known one
+            best[album['artist']] = (score, arrival, album)
+            if sorted_by_popularity and current is None:  # in sorted order, an artist's first album is their best
+                if len(settled) < k:
+                    heapq.heappush(settled, score)
+                else:
+                    heapq.heappushpop(settled, score)
+
+    # heap selection of the k largest entries, O(artists * log k) instead of sorting everything
+    top = heapq.nlargest(k, best.values(), key=lambda entry: entry[:2])
+    return [album for score, arrival, album in reversed(top)]
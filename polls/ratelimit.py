@@ -0,0 +1,42 @@
+"""
+This file defines the rate limiter used by the app polls to stay within a request budget.
+It is a token bucket: tokens are added at a constant rate up to a maximum, and every request
+takes one token, waiting for it if none is available. One bucket can be shared by many threads.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:  # thread-safe token bucket
+    def __init__(self, rate, capacity=None):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity if capacity is not None else max(rate, 1)  # tokens the bucket can hold
+        self.tokens = self.capacity  # starts full, so that the first requests go out right away
+        self.updated = time.monotonic()  # when tokens were last added
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # takes one token, waiting until there is one, and returns how long it waited in seconds
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate  # time until the next token is added
+            time.sleep(wait)
+            waited += wait
+
+    # stops handing out tokens for the given number of seconds, e.g. after the server asked to slow down
+    # every thread sharing the bucket waits, not just the one that was told
+    def pause(self, seconds):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
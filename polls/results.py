@@ -0,0 +1,101 @@
+"""
+This file defines the rankings shown by the results pages of the app polls.
+The database orders the choices of a poll by their votes, including those still in vote shards,
+and ranks them with a window function where the backend has them. The ranked choices are cached
+as one snapshot per poll, keyed by the version of the poll's cached pages (see polls/pagecache.py),
+which is bumped whenever a vote changes a count or an album is saved. The versions are shared by
+every process, so a snapshot is dropped everywhere, whichever process handled the change, and reading
+the results of a poll costs a single cache hit until its next vote.
+
+With POLLS_VOTE_SHARDS above 1, where every vote would bump the version, snapshots are not keyed by it
+and expire after POLLS_VOTE_TOTALS_TTL seconds instead: those are the hottest polls, where dropping it
+on every vote would mean ranking the choices again on almost every read. Other changes to their albums
+only drop the snapshot of the process that made them, the others catch up when theirs expire.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Sum, Window
+from django.db.models.functions import Coalesce, Rank
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Choice, VoteRollup
+from .pagecache import bump_versions, get_page_cache
+
+
+# cache key of a poll's ranked choices, under the poll's current version unless its votes are sharded
+# the key is taken before ranking, so that a ranking read while a vote commits is never newer than its key
+def ranking_key(question_id):
+    if settings.POLLS_VOTE_SHARDS > 1:
+        return f'polls:ranking:{question_id}'
+    _, version = get_page_cache().versions(question_id)
+    return f'polls:ranking:{question_id}:{version}'
+
+
+# annotates every choice of a queryset with "total_votes", its votes plus those still in its shards
+def with_total_votes(queryset):
+    return queryset.annotate(total_votes=F('votes') + Coalesce(Sum('voteshard__votes'), 0))
+
+
+# returns the votes each choice of a question received in the last day, by choice id
+# counted from the hourly totals of the vote log, so votes not rolled up yet are missing
+def recent_votes(question):
+    since = timezone.now() - datetime.timedelta(days=1)
+    rollups = VoteRollup.objects.filter(question=question, period=VoteRollup.HOUR, start__gte=since)
+    return dict(rollups.values('choice_id').annotate(votes=Sum('votes')).order_by().values_list('choice_id', 'votes'))
+
+
+def ordinal(number):  # returns "1st", "2nd", "3rd", "4th", ..., "11th", "12th", "13th", ..., "21st", ...
+    suffix = 'th' if number % 100 in (11, 12, 13) else {1: 'st', 2: 'nd', 3: 'rd'}.get(number % 10, 'th')
+    return f'{number}{suffix}'
+
+
+# returns the choices of a question ordered by their total votes, most voted first, each with its "rank"
+# choices with as many votes share a rank, the next one is ranked as if they had not (1st, 1st, 3rd, ...)
+def rank_choices(question):
+    choices = with_total_votes(Choice.objects.filter(question=question)).order_by('-total_votes', 'pk')
+    if connection.features.supports_over_clause:
+        choices = list(choices.annotate(rank=Window(Rank(), order_by=F('total_votes').desc())))
+    else:  # ranked in Python instead, from the order given by the database
+        choices = list(choices)
+        for position, choice in enumerate(choices, start=1):
+            tied = position > 1 and choice.total_votes == choices[position - 2].total_votes
+            choice.rank = choices[position - 2].rank if tied else position
+    return choices
+
+
+# returns the ranked choices of a question, from its cached snapshot if there is one
+# each choice carries its total votes as "votes", its "rank" and "ordinal", and its "recent_votes" of the last day
+def ranked_choices(question):
+    key = ranking_key(question.pk)
+    choices = cache.get(key)
+    if choices is None:
+        choices = rank_choices(question)
+        recent = recent_votes(question)
+        for choice in choices:
+            choice.votes = choice.total_votes
+            choice.ordinal = ordinal(choice.rank)
+            choice.recent_votes = recent.get(choice.pk, 0)
+        sharded = settings.POLLS_VOTE_SHARDS > 1
+        cache.set(key, choices, settings.POLLS_VOTE_TOTALS_TTL if sharded else settings.POLLS_RANKING_TTL)
+    return choices
+
+
+# drops the cached snapshots of the given questions, to be called once their counts have changed
+# bumping their versions drops them in every process, along with the pages showing the results
+# with "vote" set, those of sharded polls are kept until they expire instead, others only in this process
+def invalidate_rankings(*question_ids, vote=False):
+    bump_versions(*question_ids)
+    if settings.POLLS_VOTE_SHARDS > 1 and not vote:
+        cache.delete_many([ranking_key(question_id) for question_id in question_ids])
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance, **kwargs):  # e.g. edited in the admin, the ranking shows its album as it was
+    invalidate_rankings(instance.question_id)
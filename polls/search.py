@@ -0,0 +1,154 @@
+"""
+This file defines the full-text search of the app polls, across the text and genre of the polls
+and the titles and artists of their albums.
+
+Each poll is one document of the search table, which is kept outside of the models, as Django has
+no field for it: an FTS5 virtual table on SQLite, and an InnoDB table with a FULLTEXT index on MySQL.
+It is created after "migrate", and filled or repaired with the management command
+"rebuild_search_index". On other backends, searches fall back to unindexed LIKE queries.
+
+Documents are rewritten by the signal receivers below once the transaction that changed their poll
+commits, so a rolled back change never reaches the index. Every search term must match, either as
+a word or as the beginning of one. Note that MySQL ignores terms shorter than innodb_ft_min_token_size
+(3 by default) and its stopwords.
+"""
+
+import collections
+import re
+
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Choice, Question
+from .signals import choices_changed
+
+TABLE = 'polls_search'  # name of the search table
+KEY = {'sqlite': 'rowid', 'mysql': 'question_id'}  # backend -> column holding the id of the poll
+CREATE = {  # backend -> statement creating the search table, if it does not exist yet
+    'sqlite': f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(text, genre, albums, "
+              f"tokenize='unicode61 remove_diacritics 2')",
+    'mysql': f'CREATE TABLE IF NOT EXISTS {TABLE} (question_id BIGINT PRIMARY KEY, text VARCHAR(100), '
+             f'genre VARCHAR(50), albums LONGTEXT, FULLTEXT KEY {TABLE}_fulltext (text, genre, albums)) '
+             f'ENGINE=InnoDB',
+}
+SEARCH = {  # backend -> query returning the ids of the matching polls, best match first
+    'sqlite': f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY rank, rowid DESC LIMIT %s OFFSET %s',
+    'mysql': f'SELECT question_id FROM {TABLE} WHERE MATCH (text, genre, albums) AGAINST (%s IN BOOLEAN MODE) '
+             f'ORDER BY MATCH (text, genre, albums) AGAINST (%s IN BOOLEAN MODE) DESC, question_id DESC '
+             f'LIMIT %s OFFSET %s',
+}
+MAX_TERMS = 10  # search terms beyond this many are ignored
+
+
+def search_backend(using='default'):  # returns the backend of the search table, None if there is no table
+    vendor = connections[using].vendor
+    return vendor if vendor in CREATE else None
+
+
+def create_search_table(using='default'):  # creates the search table, if the backend has one
+    backend = search_backend(using)
+    if backend is not None:
+        with connections[using].cursor() as cursor:
+            cursor.execute(CREATE[backend])
+
+
+# rewrites the documents of the given polls, in a single transaction, dropping those of polls that no longer exist
+def index_questions(question_ids):
+    backend = search_backend()
+    question_ids = sorted(set(question_ids))
+    if backend is None or not question_ids:
+        return
+    albums = collections.defaultdict(list)  # question id -> "<artist> <title>" of each of its albums
+    for question_id, artist, title in (Choice.objects.filter(question_id__in=question_ids)
+                                       .values_list('question_id', 'artist', 'title')):
+        albums[question_id].append(f'{artist or ""} {title or ""}'.strip())
+    rows = [(pk, text, genre, '\n'.join(albums[pk]))
+            for pk, text, genre in Question.objects.filter(pk__in=question_ids).values_list('pk', 'text', 'genre')]
+    placeholders = ', '.join(['%s'] * len(question_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE {KEY[backend]} IN ({placeholders})', question_ids)
+        cursor.executemany(f'INSERT INTO {TABLE} ({KEY[backend]}, text, genre, albums) VALUES (%s, %s, %s, %s)',
+                           rows)
+
+
+# rebuilds the search table from scratch, indexing "batch_size" polls at a time, returns how many were indexed
+def rebuild_search_index(batch_size=1000):
+    backend = search_backend()
+    if backend is None:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+    create_search_table()
+    question_ids = list(Question.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(question_ids), batch_size):
+        index_questions(question_ids[start:start + batch_size])
+    return len(question_ids)
+
+
+# returns the ids of the polls containing every term in any of the indexed fields, most recent first
+# used without a search table, it reads every poll and album, as LIKE '%term%' cannot use an index
+def like_search(terms, offset, limit):
+    condition = Q()
+    for term in terms:
+        condition &= (Q(text__icontains=term) | Q(genre__icontains=term) | Q(choice__title__icontains=term) |
+                      Q(choice__artist__icontains=term))
+    return list(Question.objects.filter(condition).distinct().order_by('-pub_date', '-pk')
+                .values_list('pk', flat=True)[offset:offset + limit])
+
+
+# returns the polls matching every term of a query, best match first, as a page of "size" polls
+# also returns whether there are more polls on the next page
+def search_questions(query, page=1, size=20):
+    terms = re.findall(r'\w+', query.lower())[:MAX_TERMS]
+    if not terms:
+        return [], False
+    offset = (page - 1) * size
+    backend = search_backend()
+    if backend == 'sqlite':  # each term as a quoted prefix, so that no term is read as an FTS5 operator
+        params = [' '.join(f'"{term}"*' for term in terms), size + 1, offset]
+    elif backend == 'mysql':  # each term required, as a prefix
+        match = ' '.join(f'+{term}*' for term in terms)
+        params = [match, match, size + 1, offset]
+    if backend is not None:
+        with connection.cursor() as cursor:
+            cursor.execute(SEARCH[backend], params)
+            question_ids = [row[0] for row in cursor.fetchall()]
+    else:
+        question_ids = like_search(terms, offset, size + 1)
+    questions = Question.objects.in_bulk(question_ids[:size])
+    return [questions[pk] for pk in question_ids[:size] if pk in questions], len(question_ids) > size
+
+
+def schedule_index(question_ids):  # indexes the given polls once the current transaction commits
+    if search_backend() is not None:
+        transaction.on_commit(lambda: index_questions(question_ids))
+
+
+@receiver(post_save, sender=Question)
+def question_saved(sender, instance, update_fields=None, **kwargs):  # saves changing only other fields are skipped
+    if update_fields is None or {'text', 'genre'} & set(update_fields):
+        schedule_index([instance.pk])
+
+
+@receiver(post_save, sender=Choice)
+def choice_saved(sender, instance, update_fields=None, **kwargs):  # e.g. votes-only saves are skipped
+    if update_fields is None or {'title', 'artist', 'question'} & set(update_fields):
+        schedule_index([instance.question_id])
+
+
+# the document of a deleted poll is dropped, that of a poll losing a choice is rewritten
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Choice)
+def deleted(sender, instance, **kwargs):
+    schedule_index([instance.pk if sender is Question else instance.question_id])
+
+
+@receiver(choices_changed)
+def choices_written(sender, questions, **kwargs):
+    schedule_index(questions)
+
+
+def migrated(sender, using, **kwargs):  # creates the search table after "migrate", connected by the app's config
+    create_search_table(using)
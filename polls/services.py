@@ -0,0 +1,159 @@
+"""
+This file defines the services of the app polls.
+Services hold the work that is shared by views, background jobs and management commands,
+so that each of them only deals with its own way of receiving requests.
+"""
+
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .availability import record_empty
+from .discogs import search_albums, sorts_by_popularity
+from .models import Choice, Question, VoteEvent, VoteRollup
+from .ranking import top_albums
+from .results import invalidate_rankings
+from .signals import choices_changed
+from .singleflight import get_single_flight
+
+
+# returns the poll for the given genre and year, creating it with the 10 most popular albums if needed
+# an existing poll is only crawled again if "refresh" is set, in which case its choices are updated
+# concurrent calls for the same genre and year are coalesced: one of them crawls, the others reuse its poll
+# if a "budget" in seconds is given, the poll is built from the pages Discogs returned within it and marked partial
+# returns None if there is no poll and Discogs has no albums for that combination
+def create_poll(genre, year, prebuilt=False, refresh=False, budget=None):
+    deadline = time.monotonic() + budget if budget is not None else None
+    existing = Question.objects.filter(genre=genre, year=year).first()
+    if existing is not None and not refresh:  # one poll per genre and year, no need to query Discogs
+        return existing
+
+    flights = get_single_flight()
+    with flights.flight(f'{genre}|{year}') as waited:
+        existing = Question.objects.filter(genre=genre, year=year).first()
+        # created, or refreshed, by whoever held the lock before, so there is no need to crawl again
+        if existing is not None and (waited or not refresh):
+            flights.record(saved=True)
+            return existing
+        flights.record(saved=False)
+
+        # albums matching the provided genre and year, either from the cache or from Discogs' database,
+        # of which only the 10 most popular are kept, one per artist
+        missing = []  # indexes of the result pages that did not arrive in time
+        # where the client can sort by popularity, the crawl stops as soon as the top 10 is settled
+        by_popularity = sorts_by_popularity()
+        albums = search_albums(genre, year, deadline=deadline, missing=missing, by_popularity=by_popularity)
+        top_10 = top_albums(albums, k=10, sorted_by_popularity=by_popularity)
+        partial = len(missing) > 0
+
+        if len(top_10) == 0:  # if query returned empty
+            if not missing:  # every page arrived, so Discogs really has no albums, the form will not offer it again
+                record_empty(genre, year)
+            return existing
+
+        if existing is not None:
+            return refresh_poll(existing, top_10, partial=partial)
+        try:
+            return materialize_poll(genre, year, top_10, prebuilt=prebuilt, partial=partial)
+        except IntegrityError:  # the same poll was created by someone else meanwhile
+            return Question.objects.get(genre=genre, year=year)
+
+
+# builds the Choice entries of a question from its album dictionaries, without saving them
+def build_choices(question, albums):
+    return [Choice(
+        question=question,
+        country=album['country'],
+        image=album['image'],
+        title=album['title'],
+        artist=album['artist'],
+        year=album['year'],
+        genres=album['genres'],
+        url=album['url'],
+    ) for album in albums]
+
+
+# saves a new poll for the given genre and year with one choice for each album
+# everything is written in a single transaction with 2 queries, so a failure never leaves half a poll behind
+def materialize_poll(genre, year, albums, prebuilt=False, partial=False):
+    with transaction.atomic():
+        question = Question.objects.create(genre=genre, year=year, text=f'What is the best {genre} album of {year}?',
+                                           prebuilt=prebuilt, partial=partial)
+        Choice.objects.bulk_create(build_choices(question, albums))
+        choices_changed.send(sender=Choice, questions=[question.pk])
+    return question
+
+
+# replaces the choices of an existing poll with the given albums, in a single transaction
+# albums that were already choices keep their entries, and therefore their votes
+def refresh_poll(question, albums, partial=False):
+    with transaction.atomic():
+        if question.partial != partial:
+            question.partial = partial
+            question.save(update_fields=['partial'])
+        current = {(choice.artist, choice.title): choice for choice in question.choice_set.all()}
+        kept, added = [], []
+        for choice in build_choices(question, albums):
+            previous = current.pop((choice.artist, choice.title), None)
+            if previous is not None:
+                choice.pk, choice.votes = previous.pk, previous.votes
+                kept.append(choice)
+            else:
+                added.append(choice)
+        Choice.objects.filter(pk__in=[choice.pk for choice in current.values()]).delete()  # albums no longer in
+        Choice.objects.bulk_update(kept, ['country', 'image', 'year', 'genres', 'url'])
+        Choice.objects.bulk_create(added)
+        choices_changed.send(sender=Choice, questions=[question.pk])
+    invalidate_rankings(question.pk)  # its results list other albums now
+    return question
+
+
+# moves the vote log and the rollups of a duplicate's choice over to the same album in the poll being kept
+# rollups of the same period are added together, as a choice has only one per period
+def merge_vote_history(choice, match):
+    VoteEvent.objects.filter(choice=choice).update(choice=match)
+    for rollup in VoteRollup.objects.filter(choice=choice):
+        existing = VoteRollup.objects.filter(choice=match, period=rollup.period, start=rollup.start)
+        if existing.update(votes=F('votes') + rollup.votes):
+            rollup.delete()
+        else:
+            rollup.choice = match
+            rollup.save(update_fields=['choice'])
+
+
+# merges polls that share the same genre and year into the oldest of them, in a single transaction
+# votes for the same album are added together, and albums only found in a duplicate are moved over
+# this must run before the unique constraint on (genre, year) is migrated into an existing database
+# returns the number of duplicate questions merged away
+def merge_duplicate_questions(dry_run=False):
+    merged = 0
+    with transaction.atomic():
+        duplicated = (Question.objects.values('genre', 'year').annotate(count=Count('id'))
+                      .filter(count__gt=1).order_by('genre', 'year'))
+        for pair in duplicated:
+            keeper, *duplicates = Question.objects.filter(genre=pair['genre'], year=pair['year']).order_by('pk')
+            choices = {(choice.artist, choice.title): choice for choice in keeper.choice_set.all()}
+            for duplicate in duplicates:
+                for choice in duplicate.choice_set.all():
+                    match = choices.get((choice.artist, choice.title))
+                    if match is not None:  # same album in both polls, votes are added together
+                        match.votes += choice.total_votes()  # its shards go when it is deleted
+                        match.save(update_fields=['votes'])
+                        merge_vote_history(choice, match)
+                    else:  # album only in the duplicate, it is moved to the poll being kept
+                        choice.question = keeper
+                        choice.save(update_fields=['question'])
+                        choices[(choice.artist, choice.title)] = choice
+                keeper.prebuilt = keeper.prebuilt or duplicate.prebuilt
+                duplicate.polljob_set.update(question=keeper)  # jobs keep pointing at a poll that exists
+                # the vote history of the albums moved over, and of those merged above, follows them to the keeper
+                VoteEvent.objects.filter(question=duplicate).update(question=keeper)
+                VoteRollup.objects.filter(question=duplicate).update(question=keeper)
+                duplicate.delete()  # its remaining choices go with it
+                merged += 1
+            keeper.save(update_fields=['prebuilt'])
+            invalidate_rankings(keeper.pk)
+        if dry_run:  # nothing is kept, but the count is still reported
+            transaction.set_rollback(True)
+    return merged
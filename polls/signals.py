@@ -0,0 +1,10 @@
+"""
+This file defines the signals of the app polls, which let other modules follow changes that
+the model signals do not report, such as choices written in bulk.
+"""
+
+from django.dispatch import Signal
+
+# sent once the choices of some polls were written in bulk, which sends no post_save or post_delete
+# receivers get "questions", the ids of the polls whose choices changed
+choices_changed = Signal()
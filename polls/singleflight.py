@@ -0,0 +1,105 @@
+"""
+This file defines the single-flight locks of the app polls, which coalesce concurrent identical
+poll creations: when several requests want the same (genre, year) at the same time, the first one
+crawls Discogs while the others wait for it and then reuse the poll it created.
+
+Callers of the same process wait on an in-memory lock. Callers of different processes, such as
+several web workers or the management command "run_poll_jobs", wait on a lock file in a shared
+directory, using the advisory locks of the operating system. Where those are not available
+(e.g. Windows), only callers of the same process are coalesced.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:  # lets only one caller at a time do the work for a given key
+    def __init__(self, directory=None, timeout=120.0, poll_interval=0.05):
+        self.directory = Path(directory) if directory and fcntl else None  # where the lock files are kept
+        self.timeout = timeout  # seconds a caller waits before doing the work anyway
+        self.poll_interval = poll_interval  # seconds between attempts to take a lock file held by another process
+        self.crawls = 0  # number of times this process did the work itself
+        self.saved = 0  # number of times this process reused the work of another caller instead
+        self._flights = {}  # key -> [lock, number of callers holding or waiting for it]
+        self._lock = threading.Lock()  # protects the flights and the counters
+
+    # holds the lock for "key" for the duration of the block, waiting for its current holder if any
+    # yields whether the caller had to wait, in which case the work may have been done meanwhile
+    # if the holder takes longer than the timeout, the block is entered anyway without the lock
+    @contextmanager
+    def flight(self, key):
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            entry = self._flights.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        lock = entry[0]
+        waited = not lock.acquire(blocking=False)
+        acquired = not waited or lock.acquire(timeout=self.timeout)
+        file = None
+        try:
+            if self.directory is not None and acquired:
+                file, file_waited = self._lock_file(key, deadline)
+                waited = waited or file_waited
+            if not acquired:
+                logger.warning('Gave up waiting for %s after %.0f s', key, self.timeout)
+            yield waited
+        finally:
+            if file is not None:
+                file.close()  # also releases its lock
+            if acquired:
+                lock.release()
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:  # nobody else is waiting, so the lock can go
+                    del self._flights[key]
+
+    # opens and locks the lock file of "key", returns the file and whether another process held it
+    def _lock_file(self, key, deadline):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = hashlib.sha1(key.encode()).hexdigest()
+        file = open(self.directory / f'{name}.lock', 'a')
+        waited = False
+        while True:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return file, waited
+            except BlockingIOError:  # held by another process
+                waited = True
+                if time.monotonic() >= deadline:
+                    logger.warning('Gave up waiting for the lock file of %s', key)
+                    return file, waited
+                time.sleep(self.poll_interval)
+
+    def record(self, saved):  # counts one caller, who either did the work or reused someone else's
+        with self._lock:
+            if saved:
+                self.saved += 1
+            else:
+                self.crawls += 1
+
+    def stats(self):  # counters of this process
+        return {'crawls': self.crawls, 'saved': self.saved}
+
+
+_flights = {}  # one instance per configuration, so that tests overriding the settings get their own
+
+
+# returns the single-flight locks configured in the settings
+def get_single_flight():
+    key = (str(settings.POLLS_LOCK_DIR or ''), settings.POLLS_LOCK_TIMEOUT)
+    if key not in _flights:
+        _flights[key] = SingleFlight(*key)
+    return _flights[key]
@@ -25,3 +25,38 @@ function listSearch() {
         }
     })
 }
+
+// This function appends the next page of polls to the list, then points
+// the button at the page after it, or removes it if there is none
+
+function loadMore(button) {
+    fetch(button.dataset.url).then(response => {
+        const next = response.headers.get('X-Next-Cursor')
+        return response.text().then(html => {
+            document.getElementById('list-to-search').insertAdjacentHTML('beforeend', html)
+            if (next) {
+                button.href = button.href.replace(/after=[^&]*/, `after=${next}`)
+                button.dataset.url = button.dataset.url.replace(/after=[^&]*/, `after=${next}`)
+            } else {
+                button.remove()
+            }
+            listSearch()  // applies the current filter to the new polls too
+        })
+    })
+    return false  // the link is only followed without JavaScript
+}
+
+// This function disables the years the selected genre has no albums for,
+// as listed by the availability index, and unselects the year if it is one of them
+
+function disableEmptyYears() {
+    const empty = JSON.parse(document.getElementById('empty-years').textContent)
+    const years = new Set((empty[document.querySelector('select[name="genre"]').value] || []).map(String))
+    const select = document.querySelector('select[name="year"]')
+    Array.from(select.options).filter(option => option.hasAttribute('value')).forEach(option => {
+        option.disabled = years.has(option.value)
+    })
+    if (select.selectedOptions[0].disabled) {
+        select.selectedIndex = 0  // back to the "Year" placeholder
+    }
+}
@@ -0,0 +1,223 @@
+"""
+This file defines the live results streams of the app polls, which push vote counts to the results
+pages as server-sent events. They are served at /polls/<id>/stream/ by the ASGI entry point
+(dorsetMusicCollection/asgi.py) itself, ahead of Django, so that an idle subscriber only holds a
+coroutine instead of a thread. Under WSGI, the view "stream" answers the same URL with the current
+counts only, and browsers poll it instead.
+
+A subscriber first receives a "snapshot" event with the vote counts of the poll, then "votes" events
+with compact deltas, e.g. {"12": 3, "15": 1} for 3 more votes for choice 12 and 1 for choice 15.
+Votes are added up per poll and pushed to all of its subscribers at once, at most once every
+POLLS_STREAM_INTERVAL seconds however many came in meanwhile. Each push is encoded once and
+shared by every subscriber, which follow a chain of futures instead of having a queue each.
+
+A new subscriber reads the counts after subscribing, so it is pushed the votes published meanwhile too,
+some of which the counts may show already: each channel keeps a tally of the published votes stored in
+the database by then, read right before the counts, and the subscriber leaves those out of its first pushes.
+
+Fan-out is in-process: each process only pushes the votes it recorded itself. Every
+POLLS_STREAM_RESYNC seconds, each poll with subscribers gets a fresh snapshot instead, which brings
+in the votes recorded by other processes and keeps idle connections alive.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Question
+from .results import ranked_choices
+
+logger = logging.getLogger(__name__)
+
+HEADERS = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+           (b'x-accel-buffering', b'no')]  # tells proxies such as nginx not to hold the events back
+
+
+def encode_event(event, data, retry=None):  # returns a server-sent event, as sent over the wire
+    lines = f'retry: {retry}\n' if retry is not None else ''
+    return f'{lines}event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+def vote_counts(question):  # returns {choice id: votes} of a question, from its cached ranking
+    return {str(choice.pk): choice.votes for choice in ranked_choices(question)}
+
+
+def read_snapshot(question_id):  # returns the vote counts of a poll, or None if there is no such poll
+    question = Question.objects.filter(pk=question_id).first()
+    return vote_counts(question) if question is not None else None
+
+
+class Channel:  # subscribers of one poll, and the next push they are waiting for
+    def __init__(self, question_id, loop):
+        self.question_id = question_id  # poll whose votes are pushed
+        self.subscribers = 0  # number of subscribers
+        self.loop = loop  # event loop serving the subscribers
+        self.next = loop.create_future()  # resolves to (encoded event, votes it holds or None, future of the next push)
+        self.counted = collections.Counter()  # choice id -> votes published so far that the counts read show already
+        self.pushed = self.counted.copy()  # the same, as of the last votes pushed
+
+    def push(self, body, votes=None):  # sends an encoded event to every subscriber, with the votes it holds if any
+        future, self.next = self.next, self.loop.create_future()
+        future.set_result((body, votes, self.next))
+
+
+class ResultsBroadcaster:  # per-process fan-out of vote counts to the subscribers of each poll
+    def __init__(self, interval=0.25, resync=15.0):
+        self.interval = interval  # seconds between pushes to the subscribers of a poll
+        self.resync = resync  # seconds between snapshots pushed to the subscribers of a poll
+        self.channels = {}  # question id -> Channel, only for polls with subscribers
+        self.pending = {}  # question id -> Counter of choice id -> votes not pushed yet
+        self.pushes = 0  # number of events pushed by this process
+        self.published = 0  # number of votes published by this process
+        self._task = None  # task pushing the pending votes, running while there are subscribers
+        self._lock = threading.Lock()  # votes are published from the threads serving the views
+
+    # adds votes for a choice to the next push, if the poll has subscribers, can be called from any thread
+    # "counted" tells whether the votes are stored already, so that the counts read from now on show them
+    def publish(self, question_id, choice_id, votes=1, counted=False):
+        with self._lock:
+            if question_id not in self.channels:
+                return
+            self.pending.setdefault(question_id, collections.Counter())[str(choice_id)] += votes
+            if counted:
+                self.channels[question_id].counted[str(choice_id)] += votes
+            self.published += votes
+
+    def subscribe(self, question_id):  # returns the channel of a poll, counting one more subscriber
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            channel = self.channels.get(question_id)
+            if channel is None or channel.loop is not loop:
+                channel = self.channels[question_id] = Channel(question_id, loop)
+            channel.subscribers += 1
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+        return channel
+
+    def unsubscribe(self, channel):  # counts one subscriber less, dropping the channel after the last one
+        with self._lock:
+            channel.subscribers -= 1
+            if channel.subscribers == 0 and self.channels.get(channel.question_id) is channel:
+                del self.channels[channel.question_id]
+                self.pending.pop(channel.question_id, None)
+
+    # returns the votes published so far that the counts of a poll show already, and those counts, or None if there
+    # is no such poll, the votes are taken right before the counts are read, so that a vote published in between is
+    # pushed to the subscriber rather than left out, only one stored before the read but published after it counts twice
+    def snapshot(self, channel):
+        with self._lock:
+            counted = channel.counted.copy()
+        return counted, read_snapshot(channel.question_id)
+
+    # pushes the pending votes every interval, and snapshots every resync, until there are no subscribers left
+    # pushes happen under the lock, so that the votes tallied by a channel always match the pushes it has made
+    async def _run(self):
+        resynced = time.monotonic()
+        while self.channels:
+            await asyncio.sleep(self.interval)
+            with self._lock:
+                pending, self.pending = self.pending, {}
+                channels = dict(self.channels)
+                for question_id, votes in pending.items():
+                    if question_id in channels:
+                        channels[question_id].push(encode_event('votes', votes), votes)
+                        channels[question_id].pushed = channels[question_id].counted.copy()
+                        self.pushes += 1
+            if time.monotonic() - resynced >= self.resync:
+                resynced = time.monotonic()
+                for channel in channels.values():
+                    try:
+                        counts = await sync_to_async(read_snapshot)(channel.question_id)
+                    except Exception:  # the next resync tries again
+                        logger.exception('Could not read the vote counts of poll %s', channel.question_id)
+                        continue
+                    if counts is not None:  # unless the poll was deleted meanwhile
+                        with self._lock:
+                            channel.push(encode_event('snapshot', counts))
+                    self.pushes += 1
+
+    def stats(self):  # counters of this process
+        return {'subscribers': sum(channel.subscribers for channel in self.channels.values()),
+                'pushes': self.pushes, 'published': self.published}
+
+
+_broadcasters = {}  # one broadcaster per configuration, so that tests overriding the settings get their own
+
+
+# returns the broadcaster configured in the settings
+def get_broadcaster():
+    key = (settings.POLLS_STREAM_INTERVAL, settings.POLLS_STREAM_RESYNC)
+    if key not in _broadcasters:
+        _broadcasters[key] = ResultsBroadcaster(*key)
+    return _broadcasters[key]
+
+
+async def wait_for_disconnect(receive):  # returns once the client has gone away
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+# serves the live results of a poll to one subscriber, as an ASGI application, until they disconnect
+async def stream_results(scope, receive, send, question_id):
+    broadcaster = get_broadcaster()
+    channel = broadcaster.subscribe(question_id)  # before reading the counts, so that no vote is missed in between
+    future, pushed = channel.next, channel.pushed  # pushes from the votes not pushed yet on, no await in between
+    try:
+        counted, counts = await sync_to_async(broadcaster.snapshot)(channel)
+        counted -= pushed  # votes about to be pushed to the subscriber which the counts show already
+        if counts is None:
+            await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Not Found'})
+            return
+        await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+        await send({'type': 'http.response.body', 'body': encode_event('snapshot', counts), 'more_body': True})
+
+        # the subscriber waits for the next push only, and is cancelled by a watcher when the client goes away
+        listener = asyncio.current_task()
+
+        def stop(_):
+            listener.cancel()
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        disconnected.add_done_callback(stop)
+        try:
+            while True:
+                # shielded, as cancelling the subscriber must not cancel a push shared with the others
+                body, votes, future = await asyncio.shield(future)
+                if votes is None:  # a snapshot, which every later push adds to
+                    counted.clear()
+                elif counted:  # votes the counts sent showed already are left out, this subscriber only
+                    left, counted = votes - counted, counted - votes
+                    if not left:
+                        continue
+                    body = encode_event('votes', left)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        except asyncio.CancelledError:
+            if not disconnected.done():  # cancelled by the server rather than by the client
+                raise
+        finally:
+            disconnected.remove_done_callback(stop)
+            disconnected.cancel()
+    finally:
+        broadcaster.unsubscribe(channel)
+
+
+# wraps an ASGI application, usually Django's, so that the live results streams are served ahead of it
+def with_results_streams(application):
+    prefix, suffix = '/polls/', '/stream/'
+
+    async def router(scope, receive, send):
+        path = scope.get('path', '')
+        if scope['type'] == 'http' and path.startswith(prefix) and path.endswith(suffix):
+            question_id = path[len(prefix):-len(suffix)]
+            if question_id.isdigit():
+                return await stream_results(scope, receive, send, int(question_id))
+        return await application(scope, receive, send)
+
+    return router
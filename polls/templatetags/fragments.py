@@ -0,0 +1,38 @@
+"""
+This file defines the template tag "fragment", which caches the part of a template it encloses
+with the page cache of the app polls (polls/pagecache.py), keyed by the versions of the given polls.
+For example, to cache the albums of a poll until the poll, its albums or its votes change:
+
+    {% load fragments %}
+    {% fragment 'choices' question.id %} ... {% endfragment %}
+
+A fragment must be the same for everyone who sees it, and is never cached if it holds a CSRF token.
+"""
+
+from django import template
+
+from polls.pagecache import get_page_cache
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):  # part of a template, rendered once per version of the polls it shows
+    def __init__(self, nodelist, name, question_ids):
+        self.nodelist = nodelist  # enclosed part of the template
+        self.name = name  # name of the fragment, unique within the app
+        self.question_ids = question_ids  # expressions giving the ids of the polls shown
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        question_ids = [question_id.resolve(context) for question_id in self.question_ids]
+        return get_page_cache().fragment(name, question_ids, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def fragment(parser, token):  # {% fragment name [question id ...] %} ... {% endfragment %}
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f'"{bits[0]}" tag requires at least the name of the fragment.')
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(bit) for bit in bits[2:]])
@@ -0,0 +1,118 @@
+"""
+This file defines all the tests for the vote log and its rollups of the internal app polls.
+Each test is a function that logs votes, rolls them up and evaluates the stored totals
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+"""
+
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.analytics import rollup_backlog, rollup_vote_events, vote_activity
+from polls.models import Choice, Question, RollupWatermark, VoteEvent, VoteRollup
+from polls.votes import VoteBuffer, record_vote
+
+
+@override_settings(POLLS_ROLLUP_LAG=0)  # events can be rolled up as soon as they are logged
+class VoteLogTest(TestCase):  # vote log and rollup_vote_events test suite
+    def setUp(self):  # creates a mock poll with two choices
+        self.question = Question.objects.create(genre='Grunge', year=1991,
+                                                text='What is the best Grunge album of 1991?')
+        self.first, self.second = [Choice.objects.create(question=self.question, title=title)
+                                   for title in ('Nevermind', 'Ten')]
+
+    def log(self, choice, hours_ago, votes=1):  # logs votes cast some hours ago
+        created = timezone.now() - datetime.timedelta(hours=hours_ago)
+        VoteEvent.objects.bulk_create(VoteEvent(question=self.question, choice=choice, created=created)
+                                      for _ in range(votes))
+
+    def rollups(self, period):  # {(choice id, start): votes} of the given period
+        return {(rollup.choice_id, rollup.start): rollup.votes for rollup in VoteRollup.objects.filter(period=period)}
+
+    def test_vote_is_logged(self):  # a vote should be both counted and appended to the log
+        record_vote(self.first.pk, self.question.pk)
+        self.first.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertEqual(self.first.votes, 1)
+        event = VoteEvent.objects.get()
+        self.assertEqual((event.question, event.choice), (self.question, self.first))  # expects who got the vote
+
+    @override_settings(POLLS_VOTE_EVENTS=False)
+    def test_log_can_be_turned_off(self):  # votes should then only be counted
+        record_vote(self.first.pk, self.question.pk)
+        self.assertFalse(VoteEvent.objects.exists())
+
+    def test_buffered_votes_are_logged_on_flush(self):  # buffered votes should be logged when written
+        buffer = VoteBuffer(flush_size=10, flush_interval=None)
+        for _ in range(3):
+            buffer.add(self.first.pk, question_id=self.question.pk)
+        self.assertFalse(VoteEvent.objects.exists())  # expects nothing logged before the flush
+        buffer.flush()
+        self.assertEqual(VoteEvent.objects.filter(choice=self.first).count(), 3)  # expects one event per vote
+
+    def test_rollup_adds_up_hours_and_days(self):  # each choice should get one total per hour and per day
+        self.log(self.first, 0, votes=3)
+        self.log(self.second, 0)
+        self.assertEqual(rollup_vote_events(), 4)  # expects every event added up
+        hour = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+        self.assertEqual(self.rollups(VoteRollup.HOUR), {(self.first.pk, hour): 3, (self.second.pk, hour): 1})
+        day = hour.replace(hour=0)
+        self.assertEqual(self.rollups(VoteRollup.DAY), {(self.first.pk, day): 3, (self.second.pk, day): 1})
+
+    def test_rollup_only_reads_new_events(self):  # events before the watermark should not be added up again
+        self.log(self.first, 0, votes=2)
+        rollup_vote_events()
+        self.log(self.first, 0)
+        with self.assertNumQueries(2 + 1 + 2 * 2 + 1 + 2):  # watermark, ids, per period a count and an update, save
+            self.assertEqual(rollup_vote_events(), 1)  # expects only the new event read
+        self.assertEqual(sum(self.rollups(VoteRollup.HOUR).values()), 3)  # expects it added to the existing total
+        self.assertEqual(RollupWatermark.objects.get().last_event, VoteEvent.objects.latest('pk').pk)
+        self.assertEqual(rollup_vote_events(), 0)  # expects nothing left
+
+    def test_rollup_works_in_batches(self):  # a long backlog should be caught up with a batch at a time
+        self.log(self.first, 0, votes=5)
+        self.assertEqual(rollup_vote_events(batch_size=3), 3)
+        self.assertEqual(rollup_backlog(), 2)  # expects the rest waiting
+        self.assertEqual(rollup_vote_events(batch_size=3), 2)
+        self.assertEqual(sum(self.rollups(VoteRollup.DAY).values()), 5)  # expects no event lost or counted twice
+
+    @override_settings(POLLS_ROLLUP_LAG=60)
+    def test_recent_events_are_left_for_later(self):  # events that may have slower siblings should wait
+        self.log(self.first, 0)
+        self.assertEqual(rollup_vote_events(), 0)
+        self.assertEqual(rollup_backlog(), 1)
+
+    def test_command_catches_up(self):  # the management command should roll up the whole backlog
+        self.log(self.first, 0, votes=5)
+        out = StringIO()
+        call_command('rollup_vote_events', '--batch-size', '2', stdout=out)
+        self.assertIn('5 vote event(s) rolled up, 0 waiting', out.getvalue())
+
+    def test_activity_reads_totals(self):  # the analytics should come from the totals, not the log
+        self.log(self.first, 0, votes=2)
+        self.log(self.second, 0)
+        self.log(self.first, 30)
+        rollup_vote_events()
+        VoteEvent.objects.all().delete()  # the log is not needed any more
+        since = timezone.now() - datetime.timedelta(days=2)
+        self.assertEqual([votes for _, votes in vote_activity(self.question, VoteRollup.HOUR, since)], [1, 3])
+        self.assertEqual([votes for _, votes in vote_activity(self.question, VoteRollup.HOUR, since, self.first)],
+                         [1, 2])  # expects only the first choice's votes
+
+    def test_pages_show_totals(self):  # the results and activity pages should show the rolled-up votes
+        self.log(self.first, 0, votes=2)
+        rollup_vote_events()
+        User.objects.create_user(username='user', password='password')
+        self.client.login(username='user', password='password')
+        response = self.client.get(reverse('polls:results', args=(self.question.pk,)), SERVER_NAME='localhost',
+                                   secure=True)
+        self.assertContains(response, '2 in the last 24 hours')
+        response = self.client.get(reverse('polls:activity', args=(self.question.pk,)), SERVER_NAME='localhost',
+                                   secure=True)
+        self.assertTemplateUsed(response, 'polls/activity.html')
+        self.assertEqual(response.context['daily'][0][1], 2)  # expects today's total
@@ -0,0 +1,104 @@
+"""
+This file defines all the tests for the read-only JSON API of the internal app polls.
+Each test is a function that requests the API, sometimes with the ETag of a previous response,
+and evaluates what is returned against a pre-defined assertion. If the assertion is correct,
+the test has passed. If the assertion is incorrect, the test has failed.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from polls.models import Choice, Question
+from polls.pagecache import get_page_cache, poll_version
+from polls.votes import record_vote
+
+
+@override_settings(POLLS_VOTE_BUFFER=False, POLLS_VOTE_SHARDS=0, POLLS_PAGE_SIZE=2)
+class ApiTest(TestCase):  # index, detail and results endpoints, and their ETags, test suite
+    def setUp(self):  # creates three mock polls, the last one with two choices
+        cache.clear()  # responses cached by other tests must not leak in
+        self.questions = [Question.objects.create(genre='Grunge', year=year,
+                                                  text=f'What is the best Grunge album of {year}?')
+                          for year in (1990, 1991, 1992)]
+        self.question = self.questions[-1]
+        albums = (('Dirt', 'Alice in Chains', 2), ('Ten', None, 4))
+        self.first, self.second = [Choice.objects.create(question=self.question, title=title,
+                                                         artist=artist, votes=votes)
+                                   for title, artist, votes in albums]
+
+    def get(self, name, *args, etag=None, **params):  # sends GET request to endpoint, with an ETag if given
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse(name, args=args), params, SERVER_NAME='localhost', secure=True, **headers)
+
+    def test_index(self):  # polls should be listed most recent first, a page at a time
+        Question.objects.filter(pk=self.questions[0].pk).update(pub_date='2023-01-01T12:00:00Z')
+        response = self.get('polls:api_index')
+        self.assertEqual([poll['year'] for poll in response.json()['polls']], [1992, 1991])  # expects the newest
+        self.assertEqual(self.get('polls:api_index', after=response.json()['next']).json(),
+                         {'polls': [{'id': self.questions[0].pk, 'genre': 'Grunge', 'year': 1990,
+                                     'text': 'What is the best Grunge album of 1990?',
+                                     'pub_date': '2023-01-01T12:00:00Z',
+                                     'partial': False}],
+                          'next': None})  # expects the oldest poll, and no further page
+
+    def test_detail(self):  # a poll should come with its albums, without their empty fields or any whitespace
+        response = self.get('polls:api_detail', self.question.pk)
+        self.assertEqual(response.json()['choices'], [
+            {'id': self.first.pk, 'title': 'Dirt', 'artist': 'Alice in Chains'},
+            {'id': self.second.pk, 'title': 'Ten'},
+        ])  # expects no votes, and no artist for the album without one
+        self.assertNotIn(b' "', response.content)  # expects no whitespace between fields
+        self.assertEqual(self.get('polls:api_detail', 0).status_code, 404)  # expects unknown polls not found
+
+    def test_results(self):  # albums should be ranked by their votes
+        response = self.get('polls:api_results', self.question.pk)
+        self.assertEqual(response.json(), {'id': self.question.pk, 'results': [
+            {'id': self.second.pk, 'title': 'Ten', 'votes': 4, 'rank': 1},
+            {'id': self.first.pk, 'title': 'Dirt', 'artist': 'Alice in Chains', 'votes': 2, 'rank': 2},
+        ]})  # expects the most voted album first
+
+    def test_not_modified(self):  # clients with the current version should get a 304, without any query
+        for name, args in (('polls:api_index', ()), ('polls:api_detail', (self.question.pk,)),
+                           ('polls:api_results', (self.question.pk,))):
+            etag = self.get(name, *args)['ETag']
+            with self.subTest(name), self.assertNumQueries(0):  # expects neither the poll nor its albums read
+                response = self.get(name, *args, etag=etag)
+            self.assertEqual((response.status_code, response['ETag'], response.content), (304, etag, b''))
+
+    def test_changes_change_etags(self):  # a vote should only change the tags of its own poll
+        tags = {(name, pk): self.get(name, pk)['ETag'] for name in ('polls:api_detail', 'polls:api_results')
+                for pk in (self.questions[0].pk, self.question.pk)}
+        record_vote(self.first.pk, self.question.pk)
+        for (name, pk), etag in tags.items():
+            response = self.get(name, pk, etag=etag)
+            self.assertEqual(response.status_code, 200 if pk == self.question.pk else 304)  # expects the new votes
+        self.assertEqual(self.get('polls:api_results', self.question.pk).json()['results'][1]['votes'], 3)
+
+    def test_etags_are_shared_between_processes(self):  # any process should honour the tags of the others
+        caches = {**settings.CACHES, 'other': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                               'LOCATION': 'other'}}
+        etag = self.get('polls:api_results', self.question.pk)['ETag']
+        with override_settings(CACHES=caches, POLLS_PAGE_CACHE='other'):  # another process, with its own pages
+            self.assertEqual(self.get('polls:api_results', self.question.pk, etag=etag).status_code, 304)
+            record_vote(self.first.pk, self.question.pk)  # handled by the other process
+        response = self.get('polls:api_results', self.question.pk, etag=etag)
+        self.assertEqual(response.json()['results'][1]['votes'], 3)  # expects the vote, not a 304 or a stale page
+
+    def test_unknown_polls_are_not_tagged(self):  # a poll that does not exist should neither be tagged nor stored
+        for name in ('polls:api_detail', 'polls:api_results'):
+            response = self.get(name, 0, etag='*')
+            self.assertEqual((response.status_code, response.get('ETag')), (404, None))  # expects no 304
+        self.assertIsNone(get_page_cache().versions_cache.get(poll_version(0)))  # expects no version set for it
+
+    def test_new_polls_change_the_index(self):  # a new poll should show up in the list straight away
+        etag = self.get('polls:api_index')['ETag']
+        Question.objects.create(genre='Grunge', year=1993, text='What is the best Grunge album of 1993?')
+        response = self.get('polls:api_index', etag=etag)
+        self.assertEqual(response.json()['polls'][0]['year'], 1993)  # expects the new poll first
+
+    def test_read_only(self):  # the API should only answer GET and HEAD requests
+        path = reverse('polls:api_detail', args=(self.question.pk,))
+        self.assertEqual(self.client.post(path, SERVER_NAME='localhost', secure=True).status_code, 405)
+        self.assertEqual(self.client.head(path, SERVER_NAME='localhost', secure=True).status_code, 200)
@@ -0,0 +1,26 @@
+"""
+This file defines all the tests for the query audit of the internal app polls.
+Each test is a function that seeds polls, explains the queries of the main pages and evaluates
+their plans against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+"""
+
+from django.test import TestCase
+
+from polls.audit import PAGES, audit, full_scans, query_plan, seed
+from polls.models import Choice
+
+
+class AuditTest(TestCase):  # audit, query_plan and full_scans test suite
+    def test_main_pages_use_indexes(self):  # no query of the main pages should read a whole table
+        results = audit(seed(questions=2000, batch_size=1000))
+        self.assertEqual({page for page, *_ in results}, set(PAGES))  # expects every page to have been audited
+        self.assertEqual([(page, sql) for page, sql, plan, scans in results if scans], [])  # expects no full scans
+
+    def test_full_scans_are_flagged(self):  # a query on an unindexed column should be flagged
+        seed(questions=100)
+        for queryset in (Choice.objects.filter(year=1991), Choice.objects.order_by('artist')):
+            sql = str(queryset.query)
+            self.assertEqual(len(full_scans(sql, query_plan(sql))), 1, sql)  # expects the scan of polls_choice
+        sql = str(Choice.objects.filter(question_id=1).query)
+        self.assertEqual(full_scans(sql, query_plan(sql)), [])  # expects the index on the question to be used
@@ -0,0 +1,100 @@
+"""
+This file defines all the tests for the availability index of the internal app polls.
+Each test is a function that builds the index from mock searches, or uses it through the creation
+form, and evaluates the outcome against a pre-defined assertion. If the assertion is correct,
+the test has passed. If the assertion is incorrect, the test has failed.
+"""
+
+import io
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from polls.availability import build_availability, empty_years, is_empty
+from polls.cache import SearchCache
+from polls.models import Availability, Choice, PollJob, Question
+from polls.services import create_poll
+
+
+# polls are created within the request, from an offline Discogs stand-in without any album
+@override_settings(POLLS_JOBS_EAGER=True, DISCOGS_CLIENT='polls.fake_discogs.SyntheticClient',
+                   DISCOGS_CLIENT_OPTIONS={'size': 0}, DISCOGS_CACHE_DIR=None)
+class AvailabilityTest(TestCase):  # build_availability, the creation form and the POST handler test suite
+    def setUp(self):  # each test case gets an empty directory and no cached combinations
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def post(self, genre, year):  # sends POST request to the creation form, as a logged-in user
+        self.client.force_login(User.objects.get_or_create(username='username')[0])
+        return self.client.post(reverse('polls:create_selected'), data={'genre': genre, 'year': year},
+                                SERVER_NAME='localhost', secure=True)
+
+    def test_build_from_cache_recordings_and_polls(self):  # every source should be counted, the highest count kept
+        search_cache = SearchCache(Path(self.directory.name) / 'cache', ttl=60, max_entries=10)
+        list(search_cache.store('Grunge', 1991, iter([{'id': 1}, {'id': 2}])))
+        list(search_cache.store('Grunge', 1950, iter([])))
+        recordings = Path(self.directory.name) / 'recordings'
+        recordings.mkdir()
+        for style, year, items in (('Bebop', 1950, 40), ('Grunge', 1960, 0), ('Grunge', 1991, 0)):
+            (recordings / f'{style}-{year}.json').write_text(json.dumps({'style': style, 'year': str(year),
+                                                                         'items': items}))
+        question = Question.objects.create(genre='Punk', year=1977, text='What is the best Punk album of 1977?')
+        Choice.objects.create(question=question, title='Never Mind the Bollocks')
+
+        with override_settings(DISCOGS_CACHE_DIR=search_cache.directory):
+            call_command('build_availability', recordings=[str(recordings)], stdout=io.StringIO())
+        self.assertEqual(dict(((row.genre, row.year), row.albums) for row in Availability.objects.all()),
+                         {('Grunge', 1991): 2, ('Grunge', 1950): 0, ('Bebop', 1950): 40, ('Grunge', 1960): 0,
+                          ('Punk', 1977): 1})  # expects the cached count to win over the recorded one
+        self.assertEqual(empty_years(), {'Grunge': [1960, 1950]})  # expects the empty years, most recent first
+
+    def test_rebuild_overwrites_counts(self):  # counts found again should replace the old ones
+        build_availability([('Grunge', 1991, 0)])
+        self.assertTrue(is_empty('Grunge', 1991))
+        build_availability([('Grunge', 1991, 5)])
+        self.assertFalse(is_empty('Grunge', 1991))  # expects the new count, not the one cached before
+        self.assertEqual(Availability.objects.get().albums, 5)
+
+    def test_rebuild_without_conflict_target(self):  # backends such as MySQL should overwrite counts too
+        build_availability([('Grunge', 1991, 0)])
+        updated = Availability.objects.get().updated
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            self.assertEqual(build_availability([('Grunge', 1991, 5), ('Grunge', 1960, 0)]), (2, 1))
+        self.assertEqual(dict(((row.genre, row.year), row.albums) for row in Availability.objects.all()),
+                         {('Grunge', 1991): 5, ('Grunge', 1960): 0})  # expects the old row updated, the new one added
+        self.assertGreater(Availability.objects.get(year=1991).updated, updated)
+        self.assertEqual(empty_years(), {'Grunge': [1960]})
+
+    def test_form_lists_empty_years(self):  # the form should know which years to disable for each genre
+        build_availability([('Grunge', 1960, 0), ('Grunge', 1991, 3)])
+        self.client.force_login(User.objects.create_user(username='username'))
+        response = self.client.get(reverse('polls:create'), SERVER_NAME='localhost', secure=True)
+        self.assertContains(response, '<script id="empty-years" type="application/json">{"Grunge": [1960]}</script>',
+                            html=True)  # expects only the empty combination
+
+    def test_empty_combinations_are_rejected(self):  # neither a job nor Discogs should be needed to say no
+        build_availability([('Grunge', 1960, 0)])
+        self.assertTemplateUsed(self.post('Grunge', 1960), 'polls/no_matches.html')
+        self.assertFalse(PollJob.objects.exists())  # expects no job created
+        self.assertEqual(self.post('Grunge', 1961).status_code, 302)  # expects other years to be created as usual
+
+    def test_existing_polls_are_never_rejected(self):  # a poll should be reachable even if the index disagrees
+        question = Question.objects.create(genre='Grunge', year=1960, text='What is the best Grunge album of 1960?')
+        build_availability([('Grunge', 1960, 0)])
+        self.assertRedirects(self.post('Grunge', 1960), reverse('polls:detail', args=(question.pk,)),
+                             fetch_redirect_response=False)  # expects the existing poll
+
+    def test_empty_searches_are_recorded(self):  # Discogs should only be asked once for a combination it lacks
+        self.assertIsNone(create_poll('Grunge', 1960))
+        self.assertTrue(is_empty('Grunge', 1960))  # expects the combination disabled from then on
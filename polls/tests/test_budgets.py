@@ -0,0 +1,115 @@
+"""
+This file defines the query and render time budgets of the pages of the project.
+Each test is a function that requests every page against a large seeded dataset and evaluates
+the number of queries and the time it took against a pre-defined budget. If the budget is kept,
+the test has passed. If the budget is exceeded, the test has failed.
+A page making one more query for every row it shows (N+1) would blow its budget, as would a
+template change that quietly adds a query.
+"""
+
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from polls.audit import seed
+from polls.models import Choice, PollJob, VoteShard
+from polls.pagination import encode_cursor
+from polls.search import rebuild_search_index
+
+RENDER_BUDGET = 0.25  # seconds any page may take to render, median of a few requests, with nothing cached
+
+# page -> (URL name, function returning its arguments and query string, given the sample poll, job and user,
+#          queries when anonymous, None if it is only for logged-in users, and queries when logged in)
+# logged-in users always cost two more queries, for their session and themselves
+BUDGETS = {
+    'index': ('polls:index', lambda question, job, user: ((), {}), 1, 3),
+    'index, later page': ('polls:index_page', lambda question, job, user: ((), {'after': encode_cursor(question)}),
+                          1, 3),
+    'search': ('polls:search', lambda question, job, user: ((), {'q': 'grunge'}), 2, 4),
+    'detail': ('polls:detail', lambda question, job, user: ((question.pk,), {}), 2, 4),
+    'results': ('polls:results', lambda question, job, user: ((question.pk,), {}), 3, 5),
+    'activity': ('polls:activity', lambda question, job, user: ((question.pk,), {}), 3, 5),
+    # the years without albums too, see polls/availability.py, only while the form's options are not cached
+    'create': ('polls:create', lambda question, job, user: ((), {}), None, 3),
+    'job': ('polls:job', lambda question, job, user: ((job.pk,), {}), 1, 3),
+    'account': ('accounts:detail', lambda question, job, user: ((user.pk,), {}), None, 2),
+    'account email': ('accounts:update_email', lambda question, job, user: ((user.pk,), {}), None, 2),
+    'account deletion': ('accounts:delete', lambda question, job, user: ((user.pk,), {}), None, 2),
+    'admin polls': ('admin:polls_question_changelist', lambda question, job, user: ((), {}), None, 4),
+    'admin poll': ('admin:polls_question_change', lambda question, job, user: ((question.pk,), {}), None, 7),
+    'admin jobs': ('admin:polls_polljob_changelist', lambda question, job, user: ((), {}), None, 4),
+}
+
+
+class BudgetTest(TestCase):  # query and render time budgets test suite
+    @classmethod
+    def setUpTestData(cls):  # seeds thousands of polls, with albums, vote rollups and jobs, and an administrator
+        cls.question = seed(questions=2000, batch_size=1000)
+        rebuild_search_index()
+        cls.job = PollJob.objects.filter(question=cls.question).first() or PollJob.objects.create(
+            genre=cls.question.genre, year=cls.question.year, question=cls.question)
+        cls.user = User.objects.create_superuser(username='username')
+
+    def setUp(self):
+        self.clear()
+
+    def clear(self):  # nothing is cached, not even the content types of the admin, so that every page is rendered
+        cache.clear()
+        ContentType.objects.clear_cache()
+
+    def get(self, page):  # sends GET request to a page, for the sample poll, job and user
+        name, arguments, _, _ = BUDGETS[page]
+        args, params = arguments(self.question, self.job, self.user)
+        return self.client.get(reverse(name, args=args), params, SERVER_NAME='localhost', secure=True)
+
+    def test_anonymous_query_budgets(self):  # pages should make a fixed number of queries, whatever they show
+        for page, (_, _, queries, _) in BUDGETS.items():
+            if queries is not None:
+                self.clear()
+                with self.subTest(page), self.assertNumQueries(queries):  # expects the page within its budget
+                    self.assertEqual(self.get(page).status_code, 200)
+
+    def test_logged_in_query_budgets(self):  # the same, with the two queries of the logged-in user on top
+        self.client.force_login(self.user)
+        for page, (_, _, _, queries) in BUDGETS.items():
+            self.clear()
+            with self.subTest(page), self.assertNumQueries(queries):  # expects the page within its budget
+                self.assertEqual(self.get(page).status_code, 200)
+
+    def test_cached_query_budgets(self):  # pages served again should need nothing, or only what is personal
+        for page in ('index', 'results', 'activity'):
+            self.clear()
+            self.get(page)
+            with self.subTest(page), self.assertNumQueries(0):  # expects the whole page from the cache
+                self.get(page)
+        self.client.force_login(self.user)
+        self.get('detail')
+        with self.assertNumQueries(3):  # expects the user, their session and the poll, the albums from the cache
+            self.get('detail')
+
+    def test_budgets_do_not_grow_with_albums(self):  # more albums and vote shards should not mean more queries
+        self.client.force_login(self.user)
+        for number in range(10):
+            choice = Choice.objects.create(question=self.question, title=f'Extra {number}')
+            VoteShard.objects.create(choice=choice, shard=0, votes=number)
+        for page in ('detail', 'results', 'admin poll'):
+            self.clear()
+            with self.subTest(page), self.assertNumQueries(BUDGETS[page][3]):  # expects the same budget
+                self.get(page)
+
+    def test_render_time_budgets(self):  # pages should render quickly, even with thousands of polls around them
+        self.client.force_login(self.user)
+        for page in BUDGETS:
+            durations = []
+            for _ in range(3):
+                self.clear()
+                start = time.perf_counter()
+                self.get(page)
+                durations.append(time.perf_counter() - start)
+            with self.subTest(page):
+                self.assertLess(statistics.median(durations), RENDER_BUDGET)  # expects the page within its budget
@@ -0,0 +1,92 @@
+"""
+This file defines all the tests for the Discogs search cache of the internal app polls.
+Each test is a function that interacts with the cache and evaluates its behaviour
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+Every test case works on its own temporary directory, which is removed afterwards.
+"""
+
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from polls.cache import SearchCache, get_search_cache
+from polls.models import Question
+from polls.tests.test_discogs import FakeClient
+
+
+class SearchCacheTest(SimpleTestCase):  # SearchCache class test suite
+    albums = [{'id': i, 'artist': f'Artist {i}', 'have': i, 'want': 0} for i in range(3)]  # mock albums
+
+    def setUp(self):  # each test case gets an empty cache
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SearchCache(self.directory.name, ttl=60, max_entries=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fill(self, style, year):  # stores the mock albums as the entry for (style, year)
+        return list(self.cache.store(style, year, iter(self.albums)))
+
+    def test_store_passes_albums_through(self):  # storing should not alter what the consumer sees
+        self.assertEqual(self.fill('Hard Bop', 1959), self.albums)
+
+    def test_get_after_store_is_a_hit(self):  # stored entries should be served back
+        self.assertIsNone(self.cache.get('Hard Bop', 1959))  # expects a miss before storing
+        self.fill('Hard Bop', 1959)
+        self.assertEqual(list(self.cache.get('Hard Bop', 1959)), self.albums)  # expects the same albums back
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))  # expects counters to reflect both
+
+    def test_entry_expires_after_ttl(self):  # entries older than the time-to-live should be ignored
+        self.fill('Hard Bop', 1959)
+        with mock.patch('polls.cache.time.time', return_value=time.time() + 61):
+            self.assertIsNone(self.cache.get('Hard Bop', 1959))  # expects a miss
+        self.assertFalse(self.cache.path('Hard Bop', 1959).exists())  # expects the expired entry to be deleted
+
+    def test_corrupt_entry_is_a_miss(self):  # a damaged file should not fail the creation of a poll
+        self.fill('Hard Bop', 1959)
+        self.cache.path('Hard Bop', 1959).write_text('{"style": "Hard B')  # truncated header
+        with self.assertLogs('polls.cache', level='WARNING'):
+            self.assertIsNone(self.cache.get('Hard Bop', 1959))  # expects a miss
+        self.assertFalse(self.cache.path('Hard Bop', 1959).exists())  # expects the damaged entry to be deleted
+
+    def test_least_recently_used_entry_is_evicted(self):  # cache should not grow past max_entries
+        self.fill('Hard Bop', 1959)
+        self.fill('Punk', 1977)
+        os.utime(self.cache.path('Hard Bop', 1959), (1, 1))  # makes Jazz the least recently used entry
+        self.fill('Grunge', 1991)
+        self.assertEqual(self.cache.stats()['entries'], 2)  # expects the cache to be capped
+        self.assertIsNone(self.cache.get('Hard Bop', 1959))  # expects the least recently used to be gone
+        self.assertIsNotNone(self.cache.get('Punk', 1977))  # expects the others to remain
+
+    def test_partial_store_leaves_no_entry(self):  # an interrupted store should not publish an entry
+        stream = self.cache.store('Hard Bop', 1959, iter(self.albums))
+        next(stream)  # consumes only the first album
+        stream.close()
+        self.assertIsNone(self.cache.get('Hard Bop', 1959))  # expects no entry
+        self.assertEqual(os.listdir(self.directory.name), [])  # expects no leftover temporary file
+
+
+@override_settings(POLLS_JOBS_EAGER=True)  # polls are created within the request, not in the background
+@mock.patch('discogs_client.Client', FakeClient)
+class CreateViewCacheTest(TestCase):  # create view with search cache test suite
+    @classmethod
+    def setUpTestData(cls):  # prepares parameters that will be shared by the test cases
+        cls.user = User.objects.create_user(username='username')  # creates mock user
+
+    def test_repeat_creation_skips_discogs(self):  # creating the same poll twice should only query Discogs once
+        self.client.force_login(self.user)  # logs-in in mock user ignoring credentials
+        with tempfile.TemporaryDirectory() as directory, override_settings(DISCOGS_CACHE_DIR=directory):
+            with mock.patch.object(FakeClient, 'search', wraps=FakeClient().search) as search:
+                for refresh in ('', '1'):  # the second creation asks for the existing poll to be refreshed
+                    self.client.post(reverse('polls:create_selected'),
+                                     data={'genre': 'Hard Bop', 'year': 1959, 'refresh': refresh},
+                                     SERVER_NAME='localhost', secure=True)
+                self.assertEqual(search.call_count, 1)  # expects only the first creation to reach Discogs
+            self.assertEqual(get_search_cache().stats()['hits'], 1)  # expects the second one to be a hit
+        self.assertEqual(Question.objects.count(), 1)  # expects the poll to be refreshed rather than duplicated
@@ -0,0 +1,149 @@
+"""
+This file defines all the tests for the Discogs helpers of the internal app polls.
+Each test is a function that interacts with a certain helper and evaluates its output
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+The Discogs API is replaced by a fake client, so that no requests leave the machine.
+"""
+
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from polls.discogs import fetch_pages, iter_pages
+from polls.models import Choice, Question
+
+
+class FakeMaster:  # stands in for discogs_client.models.Master
+    def __init__(self, master_id, artist, title, popularity):
+        self.id = master_id
+        self.title = f'{artist} - {title}'
+        self.year = 1992
+        self.data = {
+            'community': {'have': popularity, 'want': master_id % 7},
+            'country': 'US',
+            'cover_image': f'https://img.discogs.com/{master_id}.jpg',
+            'style': ['Progressive Metal'],
+            'uri': f'/master/{master_id}',
+        }
+
+
+class FakeResults:  # stands in for discogs_client.models.MixedPaginatedList
+    def __init__(self, number_of_pages, per_page=5, delay=0.0):
+        self.pages = number_of_pages
+        self.delay = delay  # simulated round trip of each page request
+        self._pages = [
+            [FakeMaster(p * per_page + i, f'Artist {(p * per_page + i) % 12}', f'Album {p * per_page + i}',
+                        (p * per_page + i) * 13 % 101) for i in range(per_page)]
+            for p in range(number_of_pages)
+        ]
+
+    def __len__(self):
+        return self.pages * len(self._pages[0]) if self.pages else 0
+
+    def page(self, index):  # pages are numbered from 1, like Discogs does
+        time.sleep(self.delay)
+        return self._pages[index - 1]
+
+
+class FakeClient:  # stands in for discogs_client.Client
+    results = FakeResults(8, delay=0.05)
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def search(self, *args, **kwargs):
+        return self.results
+
+
+class FetchPagesTest(TestCase):  # fetch_pages helper test suite
+    def test_pages_keep_sequential_order(self):  # concurrent fetching should not shuffle the pages
+        results = FakeResults(6)
+        sequential, _ = fetch_pages(results, concurrency=1)
+        concurrent, _ = fetch_pages(results, concurrency=4)
+        self.assertEqual(sequential, concurrent)  # expects the same pages in the same order
+
+    def test_timings_report_every_page(self):  # there should be one latency entry for each page, in order
+        pages, timings = fetch_pages(FakeResults(5), concurrency=3)
+        self.assertEqual([i for i, latency in timings], list(range(1, 6)))  # expects one entry per page index
+        self.assertTrue(all(latency >= 0 for i, latency in timings))  # expects latencies to be measured
+
+    def test_concurrency_reduces_wall_clock(self):  # fetching in parallel should be faster than one by one
+        results = FakeResults(8, delay=0.05)
+
+        start = time.perf_counter()
+        fetch_pages(results, concurrency=1)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fetch_pages(results, concurrency=4)
+        concurrent = time.perf_counter() - start
+
+        self.assertLess(concurrent, sequential / 2)  # expects at least twice as fast with 4 workers
+
+
+class LookAheadTest(TestCase):  # iter_pages page requests test suite
+    def test_every_page_is_requested_once(self):  # pages are numbered from 1, none should be skipped or repeated
+        results = FakeResults(5)
+        with mock.patch.object(results, 'page', wraps=results.page) as page:
+            list(iter_pages(results, concurrency=2))
+        self.assertEqual(sorted(call.args[0] for call in page.call_args_list), [1, 2, 3, 4, 5])
+
+    def test_consumer_stopping_early_saves_requests(self):  # only a few pages should be requested ahead
+        results = FakeResults(20, delay=0.01)
+        with mock.patch.object(results, 'page', wraps=results.page) as page:
+            pages = iter_pages(results, concurrency=3)
+            next(pages)
+            pages.close()
+        self.assertLessEqual(page.call_count, 4)  # expects the page consumed plus at most 3 ahead
+
+
+class DeadlineTest(TestCase):  # iter_pages with a deadline test suite
+    def test_pages_after_deadline_are_left_out(self):  # a slow Discogs should not hold up the poll
+        missing = []
+        start = time.perf_counter()
+        with self.assertLogs('polls.discogs', level='WARNING'):  # expects the cut-off to be logged
+            pages = list(iter_pages(FakeResults(8, delay=0.1), concurrency=2, deadline=time.monotonic() + 0.15,
+                                    missing=missing))
+        self.assertLess(time.perf_counter() - start, 0.3)  # expects not to wait for all 8 pages (0.4s)
+        self.assertEqual(len(pages) + len(missing), 8)  # expects every page to be either fetched or missing
+        self.assertEqual(missing, list(range(len(pages) + 1, 9)))  # expects the missing ones to be the last
+
+    def test_first_page_is_always_waited_for(self):  # there should be something to build the poll from
+        missing = []
+        with self.assertLogs('polls.discogs', level='WARNING'):
+            pages = list(iter_pages(FakeResults(3, delay=0.05), deadline=time.monotonic(), missing=missing))
+        self.assertEqual((len(pages), missing), (1, [2, 3]))  # expects only the first page
+
+    def test_deadline_in_time_fetches_everything(self):  # a fast Discogs should not be cut off
+        missing = []
+        pages = list(iter_pages(FakeResults(4), concurrency=2, deadline=time.monotonic() + 5, missing=missing))
+        self.assertEqual((len(pages), missing), (4, []))  # expects all pages and nothing missing
+
+
+@override_settings(DISCOGS_CACHE_DIR=None, POLLS_JOBS_EAGER=True)  # every poll creation must reach the fake client
+@mock.patch('discogs_client.Client', FakeClient)
+class CreateViewFetchTest(TestCase):  # create view with fake Discogs client test suite
+    user = User  # user model to be available to all test cases
+
+    @classmethod
+    def setUpTestData(cls):  # prepares parameters that will be shared by the test cases
+        cls.user = User.objects.create_user(username='username')  # creates mock user
+
+    def create_poll(self):  # posts the creation form and returns the new poll's choices
+        self.client.force_login(self.user)  # logs-in in mock user ignoring credentials
+        Question.objects.all().delete()  # existing polls are reused, so the previous one must go first
+        self.client.post(reverse('polls:create_selected'), data={'genre': 'Progressive Metal', 'year': 1992},
+                         SERVER_NAME='localhost', secure=True)
+        return list(Choice.objects.order_by('-id').values_list('title', 'artist', 'url')[:10])
+
+    def test_concurrent_fetch_creates_same_choices(self):  # concurrent mode should not change the poll
+        with override_settings(DISCOGS_FETCH_CONCURRENCY=1):
+            sequential = self.create_poll()
+        with override_settings(DISCOGS_FETCH_CONCURRENCY=4):
+            concurrent = self.create_poll()
+        self.assertEqual(len(sequential), 10)  # expects a full top 10
+        self.assertEqual(sequential, concurrent)  # expects exactly the same choices
@@ -0,0 +1,76 @@
+"""
+This file defines all the tests for the offline Discogs stand-ins of the internal app polls.
+Each test is a function that queries a stand-in client and evaluates its results
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+"""
+
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from polls.discogs import iter_pages, search_albums
+from polls.fake_discogs import RecordingClient, ReplayClient, SyntheticClient, fixture_path
+
+
+@override_settings(DISCOGS_CACHE_DIR=None)  # every search must reach the stand-in
+class FakeDiscogsTest(SimpleTestCase):  # Discogs stand-ins test suite
+    def setUp(self):  # each test case gets an empty fixture directory
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_synthetic_catalog_is_reproducible(self):  # same seed, style and year should give the same results
+        first = SyntheticClient(size=120).search(type='master', style='Grunge', year=1991)
+        second = SyntheticClient(size=120).search(type='master', style='Grunge', year=1991)
+        self.assertEqual((len(first), first.pages), (120, 3))  # expects 120 masters in pages of 50
+        self.assertEqual([m.data for m in first.page(3)], [m.data for m in second.page(3)])  # expects same data
+
+    def test_synthetic_catalog_can_be_empty(self):  # an empty catalog should behave like Discogs without matches
+        results = SyntheticClient(size=0).search(type='master', style='Grunge', year=1991)
+        self.assertEqual((len(results), results.pages, results.page(1)), (0, 1, []))
+
+    def test_pages_start_at_one(self):  # like the real API, page 0 should be served as page 1
+        results = SyntheticClient(size=120).search(type='master', style='Grunge', year=1991)
+        self.assertEqual([m.data for m in results.page(0)], [m.data for m in results.page(1)])
+
+    def test_client_is_chosen_by_settings(self):  # search_albums should use the client from the settings
+        with override_settings(DISCOGS_CLIENT='polls.fake_discogs.SyntheticClient',
+                               DISCOGS_CLIENT_OPTIONS={'size': 30}):
+            albums = list(search_albums('Grunge', 1991))
+        self.assertEqual(len(albums), 30)  # expects every synthetic master
+        self.assertTrue(all(album['genres'] == 'Grunge' for album in albums))  # expects normalized albums
+
+    def test_replay_serves_what_was_recorded(self):  # recording then replaying should give the same albums
+        recording = {'DISCOGS_CLIENT': 'polls.fake_discogs.RecordingClient',
+                     'DISCOGS_CLIENT_OPTIONS': {'directory': self.directory.name,
+                                                'client': 'polls.fake_discogs.SyntheticClient', 'size': 130}}
+        replay = {'DISCOGS_CLIENT': 'polls.fake_discogs.ReplayClient',
+                  'DISCOGS_CLIENT_OPTIONS': {'directory': self.directory.name}}
+        with override_settings(**recording):
+            recorded = list(search_albums('Rock & Roll', 1956))
+        self.assertTrue(fixture_path(self.directory.name, 'Rock & Roll', 1956).exists())  # expects a fixture file
+        with override_settings(**replay):
+            replayed = list(search_albums('Rock & Roll', 1956))
+        self.assertEqual(replayed, recorded)
+
+    def test_replay_can_sort_by_popularity(self):  # sorted replays should hold every recorded item, most popular first
+        client = RecordingClient(directory=self.directory.name, client='polls.fake_discogs.SyntheticClient', size=130)
+        list(iter_pages(client.search(type='master', style='Grunge', year=1991)))  # records every page
+        results = ReplayClient(directory=self.directory.name).search(type='master', style='Grunge', year=1991,
+                                                                     sort='popularity', sort_order='desc')
+        items = [m.data for i in range(1, results.pages + 1) for m in results.page(i)]
+        scores = [item['community']['have'] + item['community']['want'] for item in items]
+        self.assertEqual((len(items), scores), (130, sorted(scores, reverse=True)))  # expects all of them, sorted
+
+    def test_replay_without_recording_is_empty(self):  # missing recordings should look like no matches
+        with self.assertLogs('polls.fake_discogs', level='WARNING'):  # expects the missing recording to be logged
+            results = ReplayClient(directory=self.directory.name).search(type='master', style='Grunge', year=1991)
+        self.assertEqual(len(results), 0)
+
+    def test_recording_client_passes_results_through(self):  # recording should not alter the results
+        client = RecordingClient(directory=self.directory.name, client='polls.fake_discogs.SyntheticClient', size=60)
+        recorded = client.search(type='master', style='Grunge', year=1991)
+        original = SyntheticClient(size=60).search(type='master', style='Grunge', year=1991)
+        self.assertEqual([m.data for m in recorded.page(2)], [m.data for m in original.page(2)])
@@ -0,0 +1,88 @@
+"""
+This file defines all the tests for the pooled Discogs fetcher of the internal app polls.
+Each test is a function that sends requests through the fetcher and evaluates its behaviour
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+HTTP requests are replaced by canned responses, so that no requests leave the machine.
+"""
+
+import time
+from unittest import mock
+
+import discogs_client
+from django.test import SimpleTestCase, override_settings
+
+from polls.discogs import build_client, client_stats, get_client
+from polls.fake_discogs import SyntheticClient
+from polls.fetchers import PooledFetcher
+
+
+def response(status_code, body=b'{}', **headers):  # stands in for requests.Response
+    return mock.Mock(status_code=status_code, content=body, headers=headers)
+
+
+class PooledFetcherTest(SimpleTestCase):  # PooledFetcher test suite
+    def fetch(self, fetcher, responses):  # sends one request, answered by the given responses in turn
+        with mock.patch.object(fetcher.session, 'request', side_effect=responses) as request:
+            result = fetcher.fetch(None, 'GET', 'https://api.discogs.com/database/search')
+        return result, request
+
+    def test_connections_are_pooled(self):  # every request should go through the same keep-alive session
+        fetcher = PooledFetcher(pool_size=8, rate=6000)
+        adapter = fetcher.session.get_adapter('https://api.discogs.com/')
+        self.assertEqual(adapter._pool_maxsize, 8)  # expects the pool to hold the configured connections
+        with mock.patch.object(fetcher.session, 'request', return_value=response(200)) as request:
+            for _ in range(2):
+                fetcher.fetch(None, 'GET', 'https://api.discogs.com/database/search')
+        self.assertEqual(request.call_count, 2)  # expects both requests to use the session
+        self.assertEqual(fetcher.stats()['requests'], 2)  # expects both requests to be counted
+
+    def test_user_token_is_sent(self):  # authenticated requests should carry the token
+        _, request = self.fetch(PooledFetcher('secret'), [response(200)])
+        self.assertEqual(request.call_args.kwargs['params'], {'token': 'secret'})
+
+    def test_429_is_retried_after_backing_off(self):  # too many requests should be tried again later
+        fetcher = PooledFetcher(rate=6000, backoff=0.1)
+        with self.assertLogs('polls.fetchers', level='WARNING'):  # expects the back-off to be logged
+            (content, status_code), _ = self.fetch(fetcher, [response(429), response(200, b'{"ok": 1}')])
+        self.assertEqual((content, status_code), (b'{"ok": 1}', 200))  # expects the successful answer
+        stats = fetcher.stats()
+        self.assertEqual((stats['requests'], stats['retries']), (2, 1))  # expects one retry
+        self.assertGreaterEqual(stats['waited'], 0.09)  # expects the back-off to be waited out
+
+    def test_retry_after_header_is_honoured(self):  # Discogs' own wait should take precedence
+        fetcher = PooledFetcher(rate=6000, backoff=10)
+        with self.assertLogs('polls.fetchers', level='WARNING'):
+            self.fetch(fetcher, [response(429, **{'Retry-After': '0.1'}), response(200)])
+        self.assertLess(fetcher.stats()['waited'], 1)  # expects the 0.1s from the header, not the 10s default
+
+    def test_gives_up_after_max_retries(self):  # a persistent 429 should eventually reach the client
+        fetcher = PooledFetcher(rate=6000, max_retries=2, backoff=0.01)
+        with self.assertLogs('polls.fetchers', level='WARNING'):
+            (_, status_code), request = self.fetch(fetcher, [response(429)] * 3)
+        self.assertEqual((status_code, request.call_count), (429, 3))  # expects the first try plus 2 retries
+
+    def test_requests_are_spaced_by_rate_limit(self):  # requests should not exceed the rate per minute
+        fetcher = PooledFetcher(rate=600, pool_size=1)  # 10 requests per second, no bursts
+        with mock.patch.object(fetcher.session, 'request', return_value=response(200)):
+            start = time.perf_counter()
+            for _ in range(4):
+                fetcher.fetch(None, 'GET', 'https://api.discogs.com/database/search')
+        self.assertGreaterEqual(time.perf_counter() - start, 0.25)  # expects 3 waits of about 0.1s each
+
+
+class ClientFactoryTest(SimpleTestCase):  # build_client and get_client test suite
+    def test_real_client_gets_pooled_fetcher(self):  # the Discogs client should use the shared pool
+        client = build_client(discogs_client.Client, 'test/0.1', user_token='secret')
+        self.assertIsInstance(client._fetcher, PooledFetcher)
+        with mock.patch.object(client._fetcher.session, 'request', return_value=response(200, b'{"id": 1}')):
+            self.assertEqual(client._get('https://api.discogs.com/masters/1'), {'id': 1})  # expects body parsed
+
+    def test_stand_in_is_left_alone(self):  # offline stand-ins do not send requests
+        client = build_client(SyntheticClient, 'test/0.1')
+        self.assertFalse(hasattr(client, '_fetcher'))
+
+    @override_settings(DISCOGS_CLIENT='discogs_client.Client', DISCOGS_CLIENT_OPTIONS={})
+    def test_client_is_shared(self):  # every call should get the same client, and so the same pool
+        self.assertIs(get_client(), get_client())
+        self.assertEqual(client_stats()['requests'], 0)  # expects instrumentation to be available
@@ -0,0 +1,116 @@
+"""
+This file defines all the tests for the poll-creation jobs of the internal app polls.
+Each test is a function that enqueues or executes jobs and evaluates their outcome
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+The Discogs API is replaced by a fake client, so that no requests leave the machine.
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.jobs import claim, enqueue, requeue_stale_jobs, run_job
+from polls.models import PollJob, Question
+from polls.tests.test_discogs import FakeClient, FakeResults
+
+
+@override_settings(DISCOGS_CACHE_DIR=None, POLLS_JOB_WORKERS=0)  # jobs stay queued until run explicitly
+@mock.patch('discogs_client.Client', FakeClient)
+class JobTest(TestCase):  # job functions test suite
+    def test_enqueue_stores_queued_job(self):  # enqueued jobs should wait in the database
+        job = enqueue('Hard Bop', 1959)
+        self.assertEqual(PollJob.objects.get(pk=job.pk).status, PollJob.QUEUED)  # expects job to be queued
+        self.assertFalse(Question.objects.exists())  # expects no poll yet
+
+    def test_run_job_creates_poll(self):  # executing a job should create its poll
+        job = enqueue('Hard Bop', 1959)
+        run_job(job.pk)
+        job.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertEqual(job.status, PollJob.DONE)  # expects job to be done
+        self.assertEqual(job.question.text, 'What is the best Hard Bop album of 1959?')  # expects poll to be linked
+        self.assertEqual(job.question.choice_set.count(), 10)  # expects a full top 10
+
+    def test_job_is_claimed_only_once(self):  # two workers should never run the same job
+        job = enqueue('Hard Bop', 1959)
+        self.assertTrue(claim(job.pk))  # expects first worker to get it
+        self.assertFalse(claim(job.pk))  # expects second worker to be turned away
+
+    def test_run_job_without_matches_is_done_without_poll(self):  # no albums is a valid outcome
+        job = enqueue('Hard Bop', 1959)
+        with mock.patch.object(FakeClient, 'results', FakeResults(0)):
+            run_job(job.pk)
+        job.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertEqual((job.status, job.question), (PollJob.DONE, None))  # expects done, but no poll
+
+    def test_run_job_records_failure(self):  # errors should be stored on the job
+        job = enqueue('Hard Bop', 1959)
+        with mock.patch.object(FakeClient, 'search', side_effect=RuntimeError('Discogs is down')), \
+                self.assertLogs('polls.jobs', level='ERROR'):  # expects the failure to be logged
+            run_job(job.pk)
+        job.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertEqual((job.status, job.error), (PollJob.FAILED, 'Discogs is down'))  # expects failure recorded
+
+    def test_partial_poll_is_topped_up(self):  # a poll built from part of the results should be completed later
+        job = enqueue('Hard Bop', 1959)
+        with override_settings(POLLS_CREATE_BUDGET=0.01), self.assertLogs('polls.discogs', level='WARNING'):
+            run_job(job.pk)
+        job.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertTrue(job.question.partial)  # expects the poll to be marked partial
+        top_up = PollJob.objects.exclude(pk=job.pk).get()
+        self.assertEqual((top_up.status, top_up.refresh), (PollJob.QUEUED, True))  # expects a refresh queued
+        run_job(top_up.pk)
+        job.question.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertFalse(job.question.partial)  # expects the poll to be complete
+
+    def test_stale_running_job_is_requeued(self):  # jobs abandoned by a dead worker should run again
+        job = enqueue('Hard Bop', 1959)
+        claim(job.pk)
+        PollJob.objects.filter(pk=job.pk).update(updated=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 1)  # expects the job to be put back in the queue
+        self.assertTrue(claim(job.pk))  # expects it to be claimable again
+
+
+class JobViewTest(TestCase):  # job view test suite
+    def test_queued_job_renders_status(self):  # unfinished jobs should show their status
+        job = PollJob.objects.create(genre='Hard Bop', year=1959)
+        response = self.client.get(reverse('polls:job', args=[job.pk]), SERVER_NAME='localhost', secure=True)
+        self.assertTemplateUsed(response, 'polls/job.html')  # expects response to return adequate template
+        self.assertContains(response, 'Queued')  # expects status to be displayed
+
+    def test_done_job_redirects_to_poll(self):  # finished jobs should lead to the new poll
+        question = Question.objects.create(genre='Hard Bop', year=1959,
+                                           text='What is the best Hard Bop album of 1959?')
+        job = PollJob.objects.create(genre='Hard Bop', year=1959, status=PollJob.DONE, question=question)
+        response = self.client.get(reverse('polls:job', args=[job.pk]), SERVER_NAME='localhost', secure=True)
+        self.assertRedirects(response, reverse('polls:detail', args=[question.pk]), fetch_redirect_response=False)
+
+    def test_done_job_without_poll_renders_no_matches(self):  # empty searches should say so
+        job = PollJob.objects.create(genre='Hard Bop', year=1959, status=PollJob.DONE)
+        response = self.client.get(reverse('polls:job', args=[job.pk]), SERVER_NAME='localhost', secure=True)
+        self.assertTemplateUsed(response, 'polls/no_matches.html')  # expects response to return adequate template
+
+    def test_create_view_post_redirects_to_job(self):  # creating a poll should return at once with a job
+        user = User.objects.create_user(username='username')  # creates mock user
+        self.client.force_login(user)  # logs-in in mock user ignoring credentials
+        with override_settings(POLLS_JOB_WORKERS=0):
+            response = self.client.post(reverse('polls:create_selected'), data={'genre': 'Hard Bop', 'year': 1959},
+                                        SERVER_NAME='localhost', secure=True)
+        job = PollJob.objects.get()
+        self.assertRedirects(response, reverse('polls:job', args=[job.pk]), fetch_redirect_response=False)
+
+
+@override_settings(DISCOGS_CACHE_DIR=None, POLLS_JOB_WORKERS=0)  # jobs stay queued until run explicitly
+@mock.patch('discogs_client.Client', FakeClient)
+class RunPollJobsCommandTest(TransactionTestCase):  # run_poll_jobs management command test suite
+    def test_command_drains_queue(self):  # the worker pool should execute every queued job
+        jobs = [enqueue(genre, 1992) for genre in ('Grunge', 'Hard Bop', 'Punk')]
+        # a single worker, as SQLite's in-memory test database rejects concurrent writers instead of queueing them
+        call_command('run_poll_jobs', workers=1, once=True, stdout=mock.MagicMock())
+        self.assertEqual(PollJob.objects.filter(status=PollJob.DONE).count(), len(jobs))  # expects all done
+        self.assertEqual(Question.objects.count(), len(jobs))  # expects one poll per job
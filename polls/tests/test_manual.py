@@ -14,11 +14,11 @@ should be used to exclude these tests when automating.
 """
 
 from django.contrib.auth.models import User
-from django.test import TestCase, tag
+from django.test import TestCase, override_settings, tag
 from django.urls import reverse
 
 import polls.views
-from polls.models import Question, Choice
+from polls.models import Question, Choice, PollJob
 
 
 @tag('manual')  # tag can be used to include/exclude test from the command line
@@ -74,6 +74,7 @@ class DetailViewTest(TestCase):  # detail view test suite
 
 
 @tag('manual')  # tag can be used to include/exclude test from the command line
+@override_settings(POLLS_JOBS_EAGER=True)  # polls are created within the request, not in the background
 class CreateViewTest(TestCase):  # create view test suite
     user = User  # user model to be used in all test cases
 
@@ -115,7 +116,8 @@ class CreateViewTest(TestCase):  # create view test suite
         new_question = Question.objects.last()  # retrieves most recent question after posting
         new_number_of_choices = Choice.objects.count()  # retrieves amount of choices after posting
 
-        if response.status_code == 302:  # expects 302 redirection after successful creation
+        self.assertEqual(response.status_code, 302)  # expects 302 redirection to the poll-creation job
+        if PollJob.objects.last().question is not None:  # if the job created a poll
             self.assertNotEqual(new_question, last_question)  # expects there to be a new question
             self.assertEqual(new_question.text, f'What is the best {genre} album of {year}?')  # expects a standard text
             self.assertGreater(new_number_of_choices, last_number_of_choices)  # expects there to be more choices
@@ -0,0 +1,166 @@
+"""
+This file defines all the tests for the cache of rendered pages and fragments of the internal app polls.
+Each test is a function that requests pages, changes the polls they show and evaluates what is
+served against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+"""
+
+import re
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache import caches as django_caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from polls.models import Choice, Question
+from polls.pagecache import PageCache, get_page_cache, poll_version
+from polls.votes import record_vote
+
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')  # hidden field of the forms
+
+
+@override_settings(POLLS_VOTE_BUFFER=False, POLLS_VOTE_SHARDS=0)
+class PageCacheTest(TestCase):  # cached_page, the fragment tag and the receivers bumping versions test suite
+    def setUp(self):  # creates a mock poll with two choices
+        cache.clear()  # pages cached by other tests must not leak in
+        self.question = Question.objects.create(genre='Grunge', year=1991,
+                                                text='What is the best Grunge album of 1991?')
+        self.first, self.second = [Choice.objects.create(question=self.question, title=title, votes=votes)
+                                   for title, votes in (('Nevermind', 4), ('Ten', 2))]
+
+    def get(self, name, *args, client=None):  # sends GET request to view
+        return (client or self.client).get(reverse(name, args=args), SERVER_NAME='localhost', secure=True)
+
+    def test_anonymous_pages_are_cached(self):  # the same page should not be rendered twice
+        first = self.get('polls:results', self.question.pk)
+        with self.assertNumQueries(0):  # expects the page without touching the database
+            second = self.get('polls:results', self.question.pk)
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('miss', 'hit'))
+        self.assertEqual(first.content, second.content)  # expects the very same page
+
+    def test_changes_bump_versions(self):  # new polls, changed albums and votes should show right away
+        self.get('polls:index'), self.get('polls:results', self.question.pk)
+        Question.objects.create(genre='Grunge', year=1992, text='What is the best Grunge album of 1992?')
+        self.assertContains(self.get('polls:index'), '1992')  # expects the new poll listed
+        self.second.title = 'Badmotorfinger'
+        self.second.save()
+        self.assertContains(self.get('polls:results', self.question.pk), 'Badmotorfinger')  # expects the new album
+        record_vote(self.second.pk, self.question.pk)
+        response = self.get('polls:results', self.question.pk)
+        self.assertContains(response, 'data-votes="3"')  # expects the vote counted
+        self.assertEqual(response['X-Cache'], 'miss')
+
+    def test_other_polls_stay_cached(self):  # a vote should only drop the pages of its own poll
+        other = Question.objects.create(genre='Grunge', year=1992, text='What is the best Grunge album of 1992?')
+        self.get('polls:results', other.pk)
+        record_vote(self.first.pk, self.question.pk)
+        self.assertEqual(self.get('polls:results', other.pk)['X-Cache'], 'hit')
+
+    def test_unknown_polls_leave_no_version(self):  # requests for polls that do not exist should store nothing
+        for _ in range(2):
+            self.assertEqual(self.get('polls:activity', 0).status_code, 404)
+        self.assertIsNone(get_page_cache().versions_cache.get(poll_version(0)))  # expects no version set for it
+        question_id = self.question.pk
+        self.question.delete()
+        self.assertIsNone(get_page_cache().versions_cache.get(poll_version(question_id)))  # expects it dropped too
+
+    def test_versions_are_shared_between_processes(self):  # a vote handled by another process should show here too
+        caches = {**settings.CACHES, 'other': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                               'LOCATION': 'other'}}
+        self.assertNotIsInstance(django_caches[settings.POLLS_VERSION_CACHE], LocMemCache)  # expects no process' own
+        with override_settings(CACHES=caches):
+            other = PageCache('other', settings.POLLS_VERSION_CACHE, 60)  # page cache of another process
+            key = other.page_key(RequestFactory().get('/'), self.question.pk)
+            record_vote(self.first.pk, self.question.pk)  # handled by this process
+            self.assertNotEqual(other.page_key(RequestFactory().get('/'), self.question.pk), key)  # expects a miss
+
+    def test_csrf_tokens_are_not_shared(self):  # pages with a form should only have their fragments cached
+        before = get_page_cache().stats()['fragment']['hits']
+        responses = [self.get('polls:detail', self.question.pk, client=self.client_class()) for _ in range(2)]
+        self.assertEqual([response['X-Cache'] for response in responses], ['miss', 'miss'])  # expects no page cached
+        tokens = [CSRF_TOKEN.search(response.content.decode()).group(1) for response in responses]
+        self.assertNotEqual(*tokens)  # expects each browser to get its own token
+        self.assertEqual(get_page_cache().stats()['fragment']['hits'], before + 1)  # expects the albums cached
+
+    def test_logged_in_users_get_their_own_pages(self):  # the navigation bar shows links of the logged-in user
+        self.get('polls:results', self.question.pk)  # cached for anonymous users
+        user = User.objects.create_user(username='username')
+        self.client.force_login(user)
+        response = self.get('polls:results', self.question.pk)
+        self.assertNotIn('X-Cache', response)  # expects the page rendered for this user
+        self.assertContains(response, reverse('accounts:detail', args=(user.pk,)))
+
+    def test_fragments_with_csrf_tokens_are_not_cached(self):  # even if the template asks for it
+        template = Template('{% load fragments %}{% fragment "form" %}{% csrf_token %}{% endfragment %}')
+        for token in ('first', 'second'):
+            self.assertIn(token, template.render(Context({'csrf_token': token})))  # expects each token rendered
+
+
+@override_settings(POLLS_VOTE_BUFFER=False, POLLS_VOTE_SHARDS=0)
+class ConditionalPageTest(TestCase):  # conditional_page, ETag and Last-Modified of detail and results test suite
+    def setUp(self):  # creates a mock poll with one choice, last changed a minute ago
+        cache.clear()  # versions set by other tests must not leak in
+        self.question = Question.objects.create(genre='Grunge', year=1991,
+                                                text='What is the best Grunge album of 1991?')
+        self.choice = Choice.objects.create(question=self.question, title='Nevermind')
+        get_page_cache().versions_cache.set(poll_version(self.question.pk), time.time_ns() - 60 * 10 ** 9, None)
+
+    def get(self, name, **headers):  # sends GET request to the view of the mock poll
+        return self.client.get(reverse(name, args=(self.question.pk,)), SERVER_NAME='localhost', secure=True,
+                               **headers)
+
+    def test_etag(self):  # clients with the current page should get a 304, without any query
+        self.get('polls:detail')  # sets the CSRF cookie, which is part of the ETag
+        for name in ('polls:detail', 'polls:results'):
+            etag = self.get(name)['ETag']
+            with self.subTest(name), self.assertNumQueries(0):  # expects neither the poll nor its albums read
+                response = self.get(name, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_last_modified(self):  # clients only sending the date of their page should get a 304 too
+        last_modified = self.get('polls:results')['Last-Modified']
+        with self.assertNumQueries(0):  # expects neither the poll nor its albums read
+            response = self.get('polls:results', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        record_vote(self.choice.pk, self.question.pk)
+        response = self.get('polls:results', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)  # expects the page with the vote
+        self.assertNotIn('Last-Modified', response)  # expects no date until the second of the vote is over
+
+    def test_votes_change_etags(self):  # a vote should show up straight away
+        self.get('polls:detail')  # sets the CSRF cookie, which is part of the ETag
+        etags = {name: self.get(name)['ETag'] for name in ('polls:detail', 'polls:results')}
+        record_vote(self.choice.pk, self.question.pk)
+        for name, etag in etags.items():
+            response = self.get(name, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)  # expects the page rendered again
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_validators_are_shared_between_processes(self):  # any process should honour the pages of the others
+        caches = {**settings.CACHES, 'other': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                               'LOCATION': 'other'}}
+        response = self.get('polls:results')
+        headers = {'HTTP_IF_NONE_MATCH': response['ETag'], 'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}
+        with override_settings(CACHES=caches, POLLS_PAGE_CACHE='other'):  # another process, with its own pages
+            self.assertEqual(self.get('polls:results', **headers).status_code, 304)
+            record_vote(self.choice.pk, self.question.pk)  # handled by the other process
+        self.assertEqual(self.get('polls:results', **headers).status_code, 200)  # expects the page with the vote
+
+    def test_unknown_polls_are_not_tagged(self):  # a poll that does not exist should neither be tagged nor stored
+        response = self.client.get(reverse('polls:detail', args=(0,)), SERVER_NAME='localhost', secure=True,
+                                   HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)  # expects no 304, whatever the client sends
+        self.assertNotIn('ETag', response)
+        self.assertIsNone(get_page_cache().versions_cache.get(poll_version(0)))  # expects no version set for it
+
+    def test_logging_in_changes_etags(self):  # the page of a logged-in user shows their own links
+        etag = self.get('polls:results')['ETag']
+        self.client.force_login(User.objects.create_user(username='username'))
+        response = self.get('polls:results', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)  # expects the page rendered for this user
+        self.assertIn('Cookie', response['Vary'])  # expects caches in between to tell users apart
@@ -0,0 +1,70 @@
+"""
+This file defines all the tests for the management command prebuild_polls of the internal app polls.
+Each test is a function that runs the command and evaluates its outcome
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+Polls are built from the offline Discogs stand-in, so that no requests leave the machine.
+"""
+
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from polls.models import PollJob, Question
+
+
+@override_settings(DISCOGS_CLIENT='polls.fake_discogs.SyntheticClient', DISCOGS_CLIENT_OPTIONS={'size': 60},
+                   DISCOGS_CACHE_DIR=None)
+class PrebuildPollsCommandTest(TransactionTestCase):  # prebuild_polls management command test suite
+    def setUp(self):  # each test case gets its own checkpoint file
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.directory.name, 'checkpoint.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def prebuild(self, **options):  # runs the command on a 2 x 2 grid and returns its output
+        out = io.StringIO()
+        # a single worker, as SQLite's in-memory test database rejects concurrent writers instead of queueing them
+        call_command('prebuild_polls', genres=['Grunge', 'Punk'], years=[1991, 1992], workers=1, rate=6000,
+                     checkpoint=self.checkpoint, stdout=out, **options)
+        return out.getvalue()
+
+    def test_builds_every_combination(self):  # one pre-built poll for each genre and year
+        self.prebuild()
+        self.assertEqual(Question.objects.filter(prebuilt=True).count(), 4)  # expects 2 genres x 2 years
+        with open(self.checkpoint) as file:  # expects every combination to be checkpointed
+            self.assertEqual(len(json.load(file)['finished']), 4)
+
+    def test_resumes_from_checkpoint(self):  # finished combinations should be skipped on the next run
+        self.prebuild()
+        output = self.prebuild()
+        self.assertIn('4 already finished, 0 to go', output)  # expects nothing left to do
+        self.assertEqual(Question.objects.count(), 4)  # expects no duplicate polls
+
+    def test_restart_skips_existing_polls(self):  # ignoring the checkpoint should still not duplicate polls
+        self.prebuild()
+        output = self.prebuild(restart=True)
+        self.assertIn('0 created, 4 existing', output)  # expects every poll to be found
+        self.assertEqual(Question.objects.count(), 4)  # expects no duplicate polls
+
+    def test_rejects_unknown_genres(self):  # only genres offered by the creation form can be built
+        with self.assertRaises(CommandError):
+            call_command('prebuild_polls', genres=['Not A Genre'], checkpoint=self.checkpoint)
+
+
+class CreateViewPrebuiltTest(TestCase):  # create view with pre-built polls test suite
+    def test_prebuilt_poll_is_returned_instantly(self):  # no job should be needed for a pre-built combination
+        question = Question.objects.create(genre='Grunge', year=1991, text='What is the best Grunge album of 1991?',
+                                           prebuilt=True)
+        self.client.force_login(User.objects.create_user(username='username'))  # logs-in in mock user
+        response = self.client.post(reverse('polls:create_selected'), data={'genre': 'Grunge', 'year': 1991},
+                                    SERVER_NAME='localhost', secure=True)
+        self.assertRedirects(response, reverse('polls:detail', args=[question.pk]), fetch_redirect_response=False)
+        self.assertFalse(PollJob.objects.exists())  # expects no job to be enqueued
@@ -0,0 +1,59 @@
+"""
+This file defines all the tests for the ranking module of the internal app polls.
+Each test is a function that ranks a set of albums and evaluates the result
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+"""
+
+from django.test import SimpleTestCase
+
+from polls.benchmarks import legacy_top_albums, synthetic_albums
+from polls.ranking import popularity, top_albums
+
+
+def album(album_id, artist, have, want=0):  # builds a minimal album dictionary
+    return {'id': album_id, 'artist': artist, 'have': have, 'want': want}
+
+
+class TopAlbumsTest(SimpleTestCase):  # top_albums function test suite
+    def test_keeps_most_popular_album_per_artist(self):  # only one album per artist should be ranked
+        albums = [album(1, 'A', 5), album(2, 'A', 9), album(3, 'B', 7), album(4, 'A', 6)]
+        self.assertEqual([a['id'] for a in top_albums(albums)], [3, 2])  # expects B's album, then A's best
+
+    def test_returns_at_most_k_albums_least_popular_first(self):  # result should be capped and ascending
+        albums = [album(i, f'Artist {i}', i) for i in range(25)]
+        self.assertEqual([a['id'] for a in top_albums(albums, k=10)], list(range(15, 25)))
+
+    def test_ties_go_to_latest_album(self):  # equally popular albums are ordered by arrival
+        albums = [album(1, 'A', 5), album(2, 'B', 5), album(3, 'C', 5)]
+        self.assertEqual([a['id'] for a in top_albums(albums, k=2)], [2, 3])
+
+    def test_consumes_generators(self):  # ranking should work on a stream that can only be read once
+        self.assertEqual(len(top_albums(synthetic_albums(500, 50))), 10)
+
+    def test_matches_legacy_loop(self):  # ranking should pick exactly what the previous loop picked
+        for size, artists in ((100, 5), (1000, 80), (2000, 2000)):
+            self.assertEqual(top_albums(synthetic_albums(size, artists, seed=size)),
+                             legacy_top_albums(synthetic_albums(size, artists, seed=size)))
+
+
+class SortedTopAlbumsTest(SimpleTestCase):  # top_albums on albums sorted by popularity test suite
+    albums = sorted(synthetic_albums(2000, 300), key=popularity, reverse=True)  # mock sorted search results
+
+    def test_sorted_ranking_matches_full_scan(self):  # stopping early should not change the top 10
+        self.assertEqual([popularity(a) for a in top_albums(iter(self.albums), sorted_by_popularity=True)],
+                         [popularity(a) for a in top_albums(self.albums)])
+
+    def test_stops_once_top_k_is_settled(self):  # albums that cannot make it should never be read
+        stream = iter(self.albums)
+        top_albums(stream, sorted_by_popularity=True)
+        self.assertGreater(len(list(stream)), 1500)  # expects most of the stream to be left unread
+
+    def test_artist_repeats_do_not_settle_early(self):  # the k best must be k different artists
+        albums = [album(i, 'A', 100 - i) for i in range(5)] + [album(9, 'B', 50)]
+        self.assertEqual([a['id'] for a in top_albums(albums, k=2, sorted_by_popularity=True)], [9, 0])
+
+    def test_ties_with_k_th_album_are_still_read(self):  # a later album tied with the k-th one wins the tie
+        albums = [album(1, 'A', 9), album(2, 'B', 5), album(3, 'C', 5), album(4, 'D', 1)]
+        self.assertEqual([a['id'] for a in top_albums(albums, k=2, sorted_by_popularity=True)],
+                         [a['id'] for a in top_albums(albums, k=2)])  # expects the same pick as a full scan
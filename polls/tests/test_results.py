@@ -0,0 +1,93 @@
+"""
+This file defines all the tests for the result rankings of the internal app polls.
+Each test is a function that casts votes, reads the ranked choices and evaluates them
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+"""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from polls.models import Choice, Question, VoteShard
+from polls.pagecache import get_page_cache
+from polls.results import ordinal, rank_choices, ranked_choices
+from polls.services import refresh_poll
+from polls.votes import VoteBuffer, record_vote
+
+
+class OrdinalTest(SimpleTestCase):  # ordinal function test suite
+    def test_suffixes(self):  # ranks should read as English ordinal numbers
+        self.assertEqual([ordinal(n) for n in (1, 2, 3, 4, 11, 12, 13, 21, 22, 101, 111)],
+                         ['1st', '2nd', '3rd', '4th', '11th', '12th', '13th', '21st', '22nd', '101st', '111th'])
+
+
+class RankedChoicesTest(TestCase):  # rank_choices and ranked_choices test suite
+    def setUp(self):  # creates a mock poll with three choices
+        cache.clear()  # rankings cached by other tests must not leak in
+        self.question = Question.objects.create(genre='Grunge', year=1991,
+                                                text='What is the best Grunge album of 1991?')
+        self.choices = [Choice.objects.create(question=self.question, title=title, votes=votes)
+                        for title, votes in (('Nevermind', 5), ('Ten', 9), ('Badmotorfinger', 5))]
+
+    def ranking(self):  # [(title, votes, ordinal)] as shown by the results page
+        return [(choice.title, choice.votes, choice.ordinal) for choice in ranked_choices(self.question)]
+
+    def test_choices_are_ranked_by_votes(self):  # most voted first, ties sharing their rank
+        self.assertEqual(self.ranking(), [('Ten', 9, '1st'), ('Nevermind', 5, '2nd'), ('Badmotorfinger', 5, '2nd')])
+
+    def test_shard_votes_are_counted(self):  # votes not rolled up yet should count towards the rank
+        VoteShard.objects.create(choice=self.choices[2], shard=0, votes=10)
+        self.assertEqual([rank.title for rank in rank_choices(self.question)], ['Badmotorfinger', 'Ten', 'Nevermind'])
+
+    def test_ranking_without_window_functions(self):  # backends without them should rank the same way
+        with mock.patch.object(connection.features, 'supports_over_clause', False):
+            ranks = [(choice.title, choice.rank) for choice in rank_choices(self.question)]
+        self.assertEqual(ranks, [('Ten', 1), ('Nevermind', 2), ('Badmotorfinger', 2)])
+
+    def test_snapshot_is_cached(self):  # reading the results again should not query the database
+        self.ranking()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ranking()[0], ('Ten', 9, '1st'))
+
+    def test_vote_drops_snapshot(self):  # a vote should show on the next read
+        self.ranking()
+        record_vote(self.choices[0].pk, self.question.pk)
+        self.assertEqual(self.ranking()[:2], [('Ten', 9, '1st'), ('Nevermind', 6, '2nd')])
+
+    def test_buffered_votes_drop_snapshot_once_written(self):  # buffered votes should show once flushed
+        self.ranking()
+        buffer = VoteBuffer(flush_size=10, flush_interval=None)
+        for _ in range(5):
+            buffer.add(self.choices[2].pk, question_id=self.question.pk)
+        self.assertEqual(self.ranking()[0][0], 'Ten')  # expects the snapshot kept until the votes are written
+        buffer.flush()
+        self.assertEqual(self.ranking()[0], ('Badmotorfinger', 10, '1st'))
+
+    def test_vote_in_another_process_drops_snapshot(self):  # the snapshot cached here should not outlive its votes
+        self.ranking()
+        Choice.objects.filter(pk=self.choices[0].pk).update(votes=10)  # a vote cast through another process,
+        get_page_cache().bump(self.question.pk)  # which only reaches this one through the shared version
+        self.assertEqual(self.ranking()[0], ('Nevermind', 10, '1st'))
+
+    @override_settings(POLLS_VOTE_SHARDS=4)
+    def test_sharded_votes_keep_snapshot(self):  # hot polls should not be ranked again on every vote
+        self.ranking()
+        record_vote(self.choices[0].pk, self.question.pk)
+        self.assertEqual(self.ranking()[1], ('Nevermind', 5, '2nd'))  # expects the snapshot until it expires
+
+    def test_refresh_drops_snapshot(self):  # crawling the poll again should show its new albums
+        self.ranking()
+        album = dict.fromkeys(['country', 'image', 'artist', 'year', 'genres', 'url'], None)
+        refresh_poll(self.question, [{**album, 'title': 'Ten'}])  # the other albums are gone from Discogs
+        self.assertEqual([title for title, _, _ in self.ranking()], ['Ten'])
+
+    def test_results_page_shows_ranks(self):  # the results page should render the ranking as it is
+        response = self.client.get(reverse('polls:results', args=(self.question.pk,)), SERVER_NAME='localhost',
+                                   secure=True)
+        self.assertEqual([choice.title for choice in response.context['choices']], ['Ten', 'Nevermind',
+                                                                                     'Badmotorfinger'])
+        self.assertContains(response, '2nd', count=2)  # expects the tie to share its rank
@@ -0,0 +1,105 @@
+"""
+This file defines all the tests for the full-text search of the internal app polls.
+Each test is a function that creates or changes polls, searches them and evaluates the matches
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+Changes reach the index once their transaction commits, which the tests run explicitly.
+"""
+
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from polls import search
+from polls.models import Choice, Question
+from polls.search import rebuild_search_index, search_questions
+from polls.services import refresh_poll
+
+
+class SearchTest(TestCase):  # search_questions and the signal receivers test suite
+    def setUp(self):  # creates two mock polls with their albums, and indexes them
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grunge = Question.objects.create(genre='Grunge', year=1991,
+                                                  text='What is the best Grunge album of 1991?')
+            self.jazz = Question.objects.create(genre='Jazz', year=1959, text='What is the best Jazz album of 1959?')
+            Choice.objects.create(question=self.grunge, title='Nevermind', artist='Nirvana')
+            Choice.objects.create(question=self.grunge, title='Ten', artist='Pearl Jam')
+            Choice.objects.create(question=self.jazz, title='Kind of Blue', artist='Miles Davis')
+
+    def found(self, query):  # texts of the polls matching a query
+        return [question.text for question in search_questions(query)[0]]
+
+    def test_polls_are_found_by_their_albums(self):  # by album title, artist and genre
+        self.assertEqual(self.found('nevermind'), [self.grunge.text])  # expects a match on the album title
+        self.assertEqual(self.found('miles'), [self.jazz.text])  # expects a match on the artist
+        self.assertEqual(self.found('JAZZ'), [self.jazz.text])  # expects a case insensitive match on the genre
+        self.assertEqual(self.found('pear'), [self.grunge.text])  # expects words to match their beginning
+
+    def test_every_term_must_match(self):  # more terms should narrow the search down
+        self.assertEqual(len(self.found('best album')), 2)  # expects both polls
+        self.assertEqual(self.found('best album davis'), [self.jazz.text])  # expects the only one with them all
+        self.assertEqual(self.found('nirvana davis'), [])  # expects no poll having both
+
+    def test_operators_are_plain_words(self):  # user input should never be read as query syntax
+        self.assertEqual(self.found('"ten" OR NEAR(blue*'), [])  # expects no error, and no poll with "near"
+        self.assertEqual(self.found('?!'), [])  # expects no error for a query without words
+
+    def test_index_follows_changes(self):  # saved, refreshed and deleted polls should be searched as they are
+        album = dict.fromkeys(['country', 'image', 'year', 'genres', 'url'], None)
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_poll(self.jazz, [{**album, 'title': 'Blue Train', 'artist': 'John Coltrane'}])
+        self.assertEqual(self.found('coltrane'), [self.jazz.text])  # expects the new album indexed
+        self.assertEqual(self.found('miles'), [])  # expects the old album gone
+        with self.captureOnCommitCallbacks(execute=True):
+            Choice.objects.filter(question=self.grunge, title='Ten').get().delete()
+            self.grunge.text = 'Which grunge record do you prefer?'
+            self.grunge.save()
+        self.assertEqual(self.found('pearl'), [])  # expects the deleted album gone
+        self.assertEqual(self.found('record'), [self.grunge.text])  # expects the new text indexed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jazz.delete()
+        self.assertEqual(self.found('jazz'), [])  # expects the deleted poll gone
+
+    def test_rolled_back_changes_are_not_indexed(self):  # the index should only see committed data
+        with self.captureOnCommitCallbacks(execute=False):
+            Choice.objects.create(question=self.jazz, title='Giant Steps', artist='John Coltrane')
+        self.assertEqual(self.found('coltrane'), [])  # expects nothing indexed before the commit
+
+    def test_results_are_paginated(self):  # pages should not overlap and tell whether there is another one
+        with self.captureOnCommitCallbacks(execute=True):
+            for year in range(2000, 2005):
+                Question.objects.create(genre='Rock', year=year, text=f'What is the best Rock album of {year}?')
+        pages = [search_questions('rock', page, size=2) for page in (1, 2, 3)]
+        self.assertEqual([has_next for _, has_next in pages], [True, True, False])  # expects 2 + 2 + 1 polls
+        self.assertEqual(len({question.pk for questions, _ in pages for question in questions}), 5)
+
+    def test_without_search_table(self):  # other backends should still find the same polls
+        with mock.patch.object(search, 'search_backend', return_value=None):
+            self.assertEqual(self.found('best nirv'), [self.grunge.text])  # expects a LIKE query on every field
+
+    def test_rebuild(self):  # the index should be rebuilt from the polls as they are
+        Question.objects.filter(pk=self.jazz.pk).update(text='Which jazz record do you prefer?')  # not signalled
+        self.assertEqual(self.found('record'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('2 poll(s) indexed.', out.getvalue())
+        self.assertEqual(self.found('record'), ['Which jazz record do you prefer?'])  # expects the update indexed
+        self.assertEqual(rebuild_search_index(batch_size=1), 2)  # expects any batch size to index them all
+        self.assertEqual(len(self.found('best')), 1)
+
+    def test_search_view(self):  # the search page should list the matches and link to the next page
+        with self.captureOnCommitCallbacks(execute=True):
+            for year in range(2000, 2025):
+                Question.objects.create(genre='Grunge', year=year, text=f'What is the best Grunge album of {year}?')
+        url = reverse('polls:search')
+        response = self.client.get(url, {'q': 'grunge'}, SERVER_NAME='localhost', secure=True)
+        self.assertEqual(len(response.context['question_list']), 20)  # expects a full page
+        self.assertContains(response, '?q=grunge&amp;page=2')  # expects a link to the next page
+        response = self.client.get(url, {'q': 'grunge', 'page': 2}, SERVER_NAME='localhost', secure=True)
+        self.assertEqual(len(response.context['question_list']), 6)  # expects the rest
+        self.assertIsNone(response.context['next_page'])
+        response = self.client.get(url, {'q': 'grunge', 'page': 'x'}, SERVER_NAME='localhost', secure=True)
+        self.assertEqual(response.status_code, 400)  # expects invalid pages rejected
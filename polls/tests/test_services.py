@@ -0,0 +1,124 @@
+"""
+This file defines all the tests for the services of the internal app polls.
+Each test is a function that calls a certain service and evaluates its outcome
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+Query counts are asserted as well, so that regressions in the number of round trips are caught.
+"""
+
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from polls.benchmarks import synthetic_albums
+from polls.models import Choice, Question, VoteEvent, VoteRollup
+from polls.services import create_poll, materialize_poll, refresh_poll
+
+
+class MaterializePollTest(TestCase):  # materialize_poll service test suite
+    albums = list(synthetic_albums(10, 10))  # mock top 10
+
+    def test_poll_is_written_with_two_queries(self):  # one insert for the question, one for all choices
+        with self.assertNumQueries(2 + 2):  # plus the savepoint and its release inside the test's transaction
+            question = materialize_poll('Grunge', 1991, self.albums)
+        self.assertEqual(question.text, 'What is the best Grunge album of 1991?')  # expects a standard text
+        # expects one choice per album, in the same order
+        self.assertEqual(list(question.choice_set.order_by('id').values_list('title', flat=True)),
+                         [album['title'] for album in self.albums])
+
+    def test_failure_leaves_no_partial_poll(self):  # a crash while writing choices should roll everything back
+        with mock.patch.object(Choice.objects, 'bulk_create', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                materialize_poll('Grunge', 1991, self.albums)
+        self.assertFalse(Question.objects.exists())  # expects no question left behind
+
+
+@override_settings(DISCOGS_CLIENT='polls.fake_discogs.SyntheticClient', DISCOGS_CLIENT_OPTIONS={'size': 100},
+                   DISCOGS_CACHE_DIR=None)
+class CreatePollTest(TestCase):  # create_poll service test suite
+    def test_existing_poll_is_reused(self):  # a second creation should not query Discogs again
+        question = create_poll('Grunge', 1991)
+        with mock.patch('polls.services.search_albums') as search:
+            self.assertEqual(create_poll('Grunge', 1991), question)  # expects the same poll back
+        search.assert_not_called()  # expects no crawl
+        self.assertEqual(Question.objects.count(), 1)  # expects no duplicate
+
+    def test_refresh_keeps_votes(self):  # refreshing a poll should not lose the votes of albums still in it
+        question = create_poll('Grunge', 1991)
+        question.choice_set.update(votes=3)
+        create_poll('Grunge', 1991, refresh=True)
+        self.assertEqual(Question.objects.count(), 1)  # expects the poll to be updated in place
+        self.assertEqual([choice.votes for choice in question.choice_set.all()], [3] * 10)  # expects votes kept
+
+    def test_poll_beyond_budget_is_partial(self):  # a poll built from part of the results should say so
+        with override_settings(DISCOGS_CLIENT_OPTIONS={'size': 200, 'latency': 0.05}, DISCOGS_FETCH_CONCURRENCY=1,
+                               DISCOGS_SORTED_CRAWL=False), self.assertLogs('polls.discogs', level='WARNING'):
+            question = create_poll('Grunge', 1991, budget=0.01)
+        self.assertTrue(question.partial)  # expects the poll to be marked partial
+        self.assertEqual(question.choice_set.count(), 10)  # expects a full top 10 from the first page
+
+    def test_refresh_completes_partial_poll(self):  # topping up should clear the mark
+        materialize_poll('Grunge', 1991, list(synthetic_albums(10, 10)), partial=True)
+        self.assertFalse(create_poll('Grunge', 1991, refresh=True).partial)  # expects a complete poll
+
+    def test_refresh_replaces_albums_no_longer_in_top_10(self):  # stale albums should make way for new ones
+        question = materialize_poll('Grunge', 1991, list(synthetic_albums(10, 10)))
+        stale = question.choice_set.first()
+        albums = list(synthetic_albums(10, 10))[1:] + list(synthetic_albums(11, 11))[10:]  # one album swapped
+        refresh_poll(question, albums)
+        self.assertEqual(question.choice_set.count(), 10)  # expects a full top 10
+        self.assertFalse(question.choice_set.filter(pk=stale.pk).exists())  # expects the stale album removed
+
+
+class MergeDuplicatePollsCommandTest(TransactionTestCase):  # merge_duplicate_polls management command test suite
+    constraint = Question._meta.constraints[0]  # databases migrated before the constraint may hold duplicates
+
+    def setUp(self):  # SQLite rebuilds the table from the model, so the model must not declare the constraint either
+        with mock.patch.object(Question._meta, 'constraints', []), connection.schema_editor() as editor:
+            editor.remove_constraint(Question, self.constraint)
+
+    def tearDown(self):  # duplicates left behind would stop the constraint from coming back
+        Question.objects.all().delete()
+        with connection.schema_editor() as editor:
+            editor.add_constraint(Question, self.constraint)
+
+    def create_duplicates(self):  # two polls for the same genre and year, sharing one album
+        first, second = [Question.objects.create(genre='Grunge', year=1991,
+                                                 text='What is the best Grunge album of 1991?') for _ in range(2)]
+        Choice.objects.create(question=first, artist='Nirvana', title='Nevermind', votes=2)
+        Choice.objects.create(question=second, artist='Nirvana', title='Nevermind', votes=5)
+        Choice.objects.create(question=second, artist='Pearl Jam', title='Ten', votes=1)
+        return first, second
+
+    def test_duplicates_are_merged_adding_votes(self):  # votes should survive the merge
+        first, second = self.create_duplicates()
+        call_command('merge_duplicate_polls', stdout=mock.MagicMock())
+        self.assertEqual(list(Question.objects.values_list('pk', flat=True)), [first.pk])  # expects the oldest kept
+        # expects the shared album's votes added up and the other album moved over
+        self.assertEqual(dict(first.choice_set.values_list('title', 'votes')), {'Nevermind': 7, 'Ten': 1})
+
+    def test_vote_history_survives_the_merge(self):  # the vote log and its rollups should follow the albums
+        first, second = self.create_duplicates()
+        shared, moved = second.choice_set.order_by('pk')
+        kept = first.choice_set.get()
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        VoteEvent.objects.bulk_create([VoteEvent(question=second, choice=choice) for choice in (shared, moved)])
+        VoteRollup.objects.bulk_create([
+            VoteRollup(question=first, choice=kept, period=VoteRollup.HOUR, start=start, votes=2),
+            VoteRollup(question=second, choice=shared, period=VoteRollup.HOUR, start=start, votes=5),
+            VoteRollup(question=second, choice=moved, period=VoteRollup.HOUR, start=start, votes=1),
+        ])
+        call_command('merge_duplicate_polls', stdout=mock.MagicMock())
+        # expects every vote kept, on the album it was cast for, in the poll kept
+        self.assertEqual(sorted(VoteEvent.objects.values_list('question', 'choice')),
+                         [(first.pk, kept.pk), (first.pk, moved.pk)])
+        self.assertEqual(sorted(VoteRollup.objects.values_list('question', 'choice', 'votes')),
+                         [(first.pk, kept.pk, 7), (first.pk, moved.pk, 1)])  # expects the shared hour added up
+
+    def test_dry_run_changes_nothing(self):  # a dry run should only report
+        self.create_duplicates()
+        call_command('merge_duplicate_polls', dry_run=True, stdout=mock.MagicMock())
+        self.assertEqual(Question.objects.count(), 2)  # expects both polls left in place
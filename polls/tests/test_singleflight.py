@@ -0,0 +1,108 @@
+"""
+This file defines all the tests for the single-flight locks of the internal app polls.
+Each test is a function that holds or waits for a lock and evaluates the outcome
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+"""
+
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from polls.jobs import enqueue
+from polls.models import PollJob, Question
+from polls.services import create_poll
+from polls.singleflight import SingleFlight, fcntl, get_single_flight
+
+
+class SingleFlightTest(SimpleTestCase):  # SingleFlight test suite
+    def hold(self, flights, key, seconds):  # holds the lock of "key" from another thread for a while
+        held = threading.Event()
+
+        def holder():
+            with flights.flight(key):
+                held.set()
+                time.sleep(seconds)
+
+        thread = threading.Thread(target=holder)
+        thread.start()
+        held.wait()
+        return thread
+
+    def test_free_key_does_not_wait(self):  # the first caller should go straight in
+        with SingleFlight().flight('Grunge|1991') as waited:
+            self.assertFalse(waited)  # expects no wait
+
+    def test_caller_waits_for_holder(self):  # a second caller should wait until the first is done
+        flights = SingleFlight()
+        thread = self.hold(flights, 'Grunge|1991', 0.2)
+        start = time.perf_counter()
+        with flights.flight('Grunge|1991') as waited:
+            self.assertTrue(waited)  # expects to be told about the wait
+            self.assertGreater(time.perf_counter() - start, 0.1)  # expects to have actually waited
+        thread.join()
+
+    def test_different_keys_do_not_wait(self):  # unrelated creations should not hold each other up
+        flights = SingleFlight()
+        thread = self.hold(flights, 'Grunge|1991', 0.2)
+        with flights.flight('Punk|1977') as waited:
+            self.assertFalse(waited)  # expects no wait
+        thread.join()
+
+    def test_timeout_lets_caller_in(self):  # a stuck holder should not block everyone else forever
+        flights = SingleFlight(timeout=0.05)
+        thread = self.hold(flights, 'Grunge|1991', 0.3)
+        with self.assertLogs('polls.singleflight', level='WARNING'), flights.flight('Grunge|1991') as waited:
+            self.assertTrue(waited)  # expects to be let in after the timeout
+        thread.join()
+
+    def test_lock_file_is_shared_between_instances(self):  # each process has its own instance, sharing the files
+        if fcntl is None:
+            self.skipTest('advisory file locks are not available on this platform')
+        with tempfile.TemporaryDirectory() as directory:
+            thread = self.hold(SingleFlight(directory), 'Grunge|1991', 0.2)
+            with SingleFlight(directory).flight('Grunge|1991') as waited:
+                self.assertTrue(waited)  # expects the other "process" to be waited for
+            thread.join()
+
+
+@override_settings(DISCOGS_CLIENT='polls.fake_discogs.SyntheticClient', DISCOGS_CLIENT_OPTIONS={'size': 100},
+                   DISCOGS_CACHE_DIR=None, POLLS_LOCK_DIR=None)
+class CreatePollCoalescingTest(TransactionTestCase):  # create_poll with concurrent identical creations test suite
+    @staticmethod
+    def create_in_thread(genre, year):  # runs create_poll as another request would
+        try:
+            return create_poll(genre, year)
+        finally:
+            connection.close()  # worker threads must not keep database connections open
+
+    def test_waiting_creation_reuses_poll(self):  # whoever waited should get the poll made meanwhile
+        flights = get_single_flight()
+        before = flights.stats()
+        with mock.patch('polls.services.search_albums') as search, ThreadPoolExecutor(max_workers=1) as executor:
+            with flights.flight('Grunge|1991'):  # stands in for another request crawling the same poll
+                future = executor.submit(self.create_in_thread, 'Grunge', 1991)
+                time.sleep(0.2)  # lets the other thread reach the lock
+                question = Question.objects.create(genre='Grunge', year=1991,
+                                                   text='What is the best Grunge album of 1991?')
+            self.assertEqual(future.result(), question)  # expects the same poll
+        search.assert_not_called()  # expects no crawl of its own
+        self.assertEqual(flights.stats()['saved'], before['saved'] + 1)  # expects the saved crawl to be counted
+
+
+@override_settings(POLLS_JOB_WORKERS=0)  # jobs stay queued until run explicitly
+class EnqueueCoalescingTest(TestCase):  # enqueue with identical jobs in flight test suite
+    def test_identical_job_in_flight_is_reused(self):  # one job should serve everyone asking for the same poll
+        first = enqueue('Hard Bop', 1959)
+        self.assertEqual(enqueue('Hard Bop', 1959, refresh=True), first)  # expects the queued job back
+        self.assertEqual(PollJob.objects.count(), 1)  # expects no second job
+
+    def test_finished_job_is_not_reused(self):  # only jobs still in flight should be shared
+        first = enqueue('Hard Bop', 1959)
+        PollJob.objects.filter(pk=first.pk).update(status=PollJob.DONE)
+        self.assertNotEqual(enqueue('Hard Bop', 1959, refresh=True), first)  # expects a new job
@@ -0,0 +1,150 @@
+"""
+This file defines all the tests for the live results streams of the internal app polls.
+Each test is a function that subscribes to the results of a poll, casts votes and evaluates
+the events received against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+Subscribers are served by the ASGI application directly, without a server or sockets in between.
+"""
+
+import asyncio
+import collections
+import json
+import tracemalloc
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from polls.models import Choice, Question
+from polls.results import invalidate_rankings
+from polls.streams import get_broadcaster, with_results_streams
+from polls.votes import record_vote
+
+
+class Subscribers:  # stand-in for the browsers of many subscribers, sharing as little as possible
+    def __init__(self):
+        self.left = asyncio.get_running_loop().create_future()  # resolved when every subscriber goes away
+        self.events = []  # (subscriber number, event name, data) of every event received
+        self.statuses = []  # status code answered to each subscriber
+
+    def connect(self, application, path, number):  # starts one subscriber and returns its task
+        async def receive():
+            await self.left
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                self.statuses.append(message['status'])
+            elif message.get('body', b'').startswith(b'event: '):
+                name, data = message['body'].decode().splitlines()[:2]
+                self.events.append((number, name[len('event: '):], json.loads(data[len('data: '):])))
+
+        scope = {'type': 'http', 'path': path, 'method': 'GET', 'headers': []}
+        return asyncio.ensure_future(application(scope, receive, send))
+
+    def received(self, name):  # events of the given name, by subscriber
+        return {number: data for number, event, data in self.events if event == name}
+
+
+async def django_stand_in(scope, receive, send):  # answers every request the streams leave to Django
+    await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+@override_settings(POLLS_STREAM_INTERVAL=0.05, POLLS_STREAM_RESYNC=60, POLLS_VOTE_BUFFER=False, POLLS_VOTE_SHARDS=0)
+class ResultsStreamTest(TestCase):  # stream_results and ResultsBroadcaster test suite
+    application = staticmethod(with_results_streams(django_stand_in))
+
+    def setUp(self):  # creates a mock poll with two choices
+        cache.clear()  # rankings cached by other tests must not leak in
+        self.question = Question.objects.create(genre='Grunge', year=1991,
+                                                text='What is the best Grunge album of 1991?')
+        self.first, self.second = [Choice.objects.create(question=self.question, title=title, votes=votes)
+                                   for title, votes in (('Nevermind', 4), ('Ten', 2))]
+        self.path = f'/polls/{self.question.pk}/stream/'
+
+    async def subscribe(self, count):  # connects "count" subscribers and waits for their snapshots
+        subscribers = Subscribers()
+        tasks = [subscribers.connect(self.application, self.path, number) for number in range(count)]
+        while len(subscribers.received('snapshot')) < count:
+            await asyncio.sleep(0.01)
+        return subscribers, tasks
+
+    async def test_votes_are_pushed_as_coalesced_deltas(self):  # subscribers should get one push for many votes
+        subscribers, tasks = await self.subscribe(3)
+        self.assertEqual(subscribers.received('snapshot')[0], {str(self.first.pk): 4, str(self.second.pk): 2})
+        for choice in (self.first, self.second, self.first):
+            await sync_to_async(record_vote)(choice.pk, self.question.pk)
+        await asyncio.sleep(0.2)  # a few intervals
+        # expects every subscriber to get the three votes in a single event
+        self.assertEqual(subscribers.received('votes'), {n: {str(self.first.pk): 2, str(self.second.pk): 1}
+                                                         for n in range(3)})
+        self.assertEqual(len(subscribers.events), 3 + 3)  # expects nothing else than the snapshots and deltas
+        subscribers.left.set_result(None)
+        await asyncio.gather(*tasks)
+        self.assertNotIn(self.question.pk, get_broadcaster().channels)  # expects the poll forgotten
+
+    async def test_votes_published_while_subscribing_count_once(self):  # the counts sent may show them already
+        subscribers, tasks = await self.subscribe(1)
+        await sync_to_async(Choice.objects.filter(pk=self.first.pk).update)(votes=F('votes') + 1)  # a vote stored,
+        await sync_to_async(invalidate_rankings)(self.question.pk, vote=True)  # but not published yet
+        broadcaster = get_broadcaster()
+        subscribe = broadcaster.subscribe
+
+        def subscribe_then_publish(question_id):  # the vote is published between subscribing and reading the counts
+            channel = subscribe(question_id)
+            broadcaster.publish(question_id, self.first.pk, counted=True)
+            return channel
+
+        with mock.patch.object(broadcaster, 'subscribe', subscribe_then_publish):
+            tasks.append(subscribers.connect(self.application, self.path, 1))
+            while len(subscribers.received('snapshot')) < 2:
+                await asyncio.sleep(0.01)
+        await sync_to_async(record_vote)(self.first.pk, self.question.pk)
+        await asyncio.sleep(0.2)  # a few intervals
+        self.assertEqual(subscribers.received('snapshot')[1][str(self.first.pk)], 5)  # expects the vote in the counts
+        votes = collections.Counter()  # votes pushed to each subscriber, in one event or more
+        for number, event, data in subscribers.events:
+            votes[number] += data.get(str(self.first.pk), 0) if event == 'votes' else 0
+        self.assertEqual(votes, {0: 2, 1: 1})  # expects the new subscriber to be pushed the second vote only
+        subscribers.left.set_result(None)
+        await asyncio.gather(*tasks)
+
+    # idle connections should be cheap, and all get the votes, see the benchmark "stream" for the actual figures
+    async def test_thousands_of_idle_subscribers(self):
+        count = 2000
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            subscribers, tasks = await self.subscribe(count)
+            per_connection = (tracemalloc.get_traced_memory()[0] - before) / count
+        finally:
+            tracemalloc.stop()
+        self.assertLess(per_connection, 16 * 1024)  # expects a coroutine's worth of memory, not a thread's
+        get_broadcaster().publish(self.question.pk, self.first.pk)
+        await asyncio.sleep(0.2)
+        self.assertEqual(len(subscribers.received('votes')), count)  # expects the vote fanned out to everyone
+        subscribers.left.set_result(None)
+        await asyncio.gather(*tasks)
+
+    async def test_missing_poll_is_not_found(self):  # unknown polls should not be subscribed to
+        subscribers = Subscribers()
+        await subscribers.connect(self.application, '/polls/0/stream/', 0)
+        self.assertEqual(subscribers.statuses, [404])
+
+    def test_wsgi_view_answers_snapshot(self):  # without ASGI, browsers should get the counts and poll again
+        response = self.client.get(reverse('polls:stream', args=(self.question.pk,)), SERVER_NAME='localhost',
+                                   secure=True)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response.content.decode().splitlines()[:2], ['retry: 5000', 'event: snapshot'])
+
+
+class RouterTest(SimpleTestCase):  # with_results_streams test suite
+    async def test_other_requests_go_to_django(self):  # only the streams should be served ahead of Django
+        subscribers = Subscribers()
+        for path in ('/polls/1/results/', '/polls/latest/stream/'):
+            await subscribers.connect(with_results_streams(django_stand_in), path, 0)
+        self.assertEqual(subscribers.statuses, [204, 204])
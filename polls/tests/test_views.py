@@ -10,13 +10,16 @@ together into classes. Each class represents a suite of tests for a particular v
 """
 
 import random
+from datetime import timedelta
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 import polls.views
-from polls.models import Question, Choice
+from polls.models import Question, Choice, PollJob
 
 
 class IndexViewTest(TestCase):  # index view test suite
@@ -28,10 +31,13 @@ class IndexViewTest(TestCase):  # index view test suite
         for question_number in range(cls.number_of_questions):
             Question.objects.create(
                 genre='Progressive Metal',
-                year='1992',
-                text='What is the best Progressive Metal album of 1992?'
+                year=1992 - question_number,  # there is only one poll per genre and year
+                text=f'What is the best Progressive Metal album of {1992 - question_number}?'
             )
 
+    def setUp(self):  # pages cached by other tests would be answered without being rendered
+        cache.clear()
+
     def test_view_http_request_is_redirected_to_https(self):  # view should be accessed through HTTPS requests only
         response = self.client.get('/polls/')  # sends GET request to view
         self.assertEqual(response.status_code, 301)  # expects response status code to be 301 due to redirection
@@ -63,6 +69,57 @@ class IndexViewTest(TestCase):  # index view test suite
                          sorted(response.context['question_list'], key=lambda x: x.pub_date, reverse=True))
 
 
+@override_settings(POLLS_PAGE_SIZE=4)
+class IndexPaginationTest(TestCase):  # index view pages and index_page view test suite
+    @classmethod
+    def setUpTestData(cls):  # prepares parameters that will be shared by the test cases
+        # creates 10 mock questions, some of them published at the same time, so that only their ids tell them apart
+        pub_date = timezone.now()
+        cls.questions = [Question.objects.create(genre='Grunge', year=1990 + number, text=f'Grunge {1990 + number}',
+                                                 pub_date=pub_date - timedelta(hours=number // 3))
+                         for number in range(10)]
+
+    def setUp(self):  # pages cached by other tests would be answered without being rendered
+        cache.clear()
+
+    def get(self, name, **params):  # sends GET request to view with the given query string
+        return self.client.get(reverse(name), params, SERVER_NAME='localhost', secure=True)
+
+    def test_pages_cover_every_question_once(self):  # following the cursors should list each poll exactly once
+        listed, cursor = [], None
+        for _ in range(3):
+            response = self.get('polls:index', **({'after': cursor} if cursor else {}))
+            listed += list(response.context['question_list'])
+            cursor = response.context['next_cursor']
+        self.assertIsNone(cursor)  # expects the third page to be the last
+        # expects newest first, and the most recent id first among polls published at the same time
+        self.assertEqual(listed, sorted(self.questions, key=lambda q: (q.pub_date, q.pk), reverse=True))
+
+    def test_page_costs_one_query(self):  # a deep page should not read the pages before it
+        cursor = self.get('polls:index').context['next_cursor']
+        with self.assertNumQueries(1):  # expects a single query for the questions and the next cursor
+            response = self.get('polls:index_page', after=cursor)
+        self.assertEqual(len(response.context['question_list']), 4)
+
+    def test_fragment_points_to_next_page(self):  # the fragment should only hold list items and where to go next
+        response = self.get('polls:index_page')
+        self.assertTemplateUsed(response, 'polls/index_page.html')
+        self.assertTemplateNotUsed(response, 'base.html')  # expects no page around the items
+        self.assertEqual(response.content.decode().count('<li'), 4)
+        self.assertEqual(response['X-Next-Cursor'], response.context['next_cursor'])
+
+    def test_load_more_only_with_next_page(self):  # the last page should not offer more
+        first = self.get('polls:index')
+        self.assertContains(first, 'Load more')
+        cursor = self.get('polls:index_page', after=first.context['next_cursor'])['X-Next-Cursor']
+        response = self.get('polls:index', after=cursor)
+        self.assertNotContains(response, 'Load more')
+        self.assertEqual(self.get('polls:index_page', after=cursor)['X-Next-Cursor'], '')
+
+    def test_invalid_cursor_is_rejected(self):  # tampered cursors should answer 400 rather than fail
+        self.assertEqual(self.get('polls:index', after='nonsense').status_code, 400)
+
+
 class DetailViewTest(TestCase):  # detail view test suite
     question = Question  # question model to be available to all test cases
     choice = Choice  # choice model to be available to all test cases
@@ -133,6 +190,9 @@ class ResultsViewTest(TestCase):  # results view test suite
         cls.question = Question.objects.create(genre='Progressive Metal', year='1992',
                                                text='What is the best Progressive Metal album of 1992?')
 
+    def setUp(self):  # pages cached by other tests would be answered without being rendered
+        cache.clear()
+
     def test_view_http_request_is_redirected_to_https(self):  # view should be accessed through HTTPS requests only
         response = self.client.get(f'/polls/{self.question.id}/results/',
                                    SERVER_NAME='localhost')  # sends GET request to view
@@ -154,6 +214,8 @@ class ResultsViewTest(TestCase):  # results view test suite
         self.assertTemplateUsed(response, 'polls/results.html')  # expects response to return adequate template
 
 
+# polls are created within the request, not in the background, from the offline Discogs stand-in
+@override_settings(POLLS_JOBS_EAGER=True, DISCOGS_CLIENT='polls.fake_discogs.SyntheticClient', DISCOGS_CACHE_DIR=None)
 class CreateViewTest(TestCase):  # create view test suite
     user = User  # user model to be available to all test cases
 
@@ -210,7 +272,8 @@ class CreateViewTest(TestCase):  # create view test suite
         new_question = Question.objects.last()  # retrieves most recent question after posting
         new_number_of_choices = Choice.objects.count()  # retrieves amount of choices after posting
 
-        if response.status_code == 302:  # expects 302 redirection after successful creation
+        self.assertEqual(response.status_code, 302)  # expects 302 redirection to the poll-creation job
+        if PollJob.objects.last().question is not None:  # if the job created a poll
             self.assertNotEqual(new_question, last_question)  # expects there to be a new question
             self.assertEqual(new_question.text, f'What is the best {genre} album of {year}?')  # expects a standard text
             self.assertGreater(new_number_of_choices, last_number_of_choices)  # expects there to be more choices
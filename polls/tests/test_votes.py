@@ -0,0 +1,121 @@
+"""
+This file defines all the tests for the vote counting of the internal app polls.
+Each test is a function that casts votes and evaluates the stored counts
+against a pre-defined assertion. If the assertion is correct, the test has passed.
+If the assertion is incorrect, the test has failed.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from polls.models import Choice, Question, VoteShard
+from polls.results import ranked_choices
+from polls.votes import VoteBuffer, get_vote_buffer, record_vote
+
+
+class VoteTestMixin:  # creates a mock poll with two choices
+    def create_choices(self):
+        question = Question.objects.create(genre='Grunge', year=1991, text='What is the best Grunge album of 1991?')
+        return [Choice.objects.create(question=question, title=title) for title in ('Nevermind', 'Ten')]
+
+
+class RecordVoteTest(VoteTestMixin, TestCase):  # record_vote function test suite
+    def test_vote_is_not_lost_to_stale_instance(self):  # a vote cast meanwhile should not be overwritten
+        choice, _ = self.create_choices()
+        Choice.objects.filter(pk=choice.pk).update(votes=5)  # another voter got there first
+        record_vote(choice.pk)
+        choice.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertEqual(choice.votes, 6)  # expects both votes counted
+
+    def test_vote_writes_only_votes_column(self):  # the vote should be a single UPDATE of the counter
+        choice, _ = self.create_choices()
+        with self.assertNumQueries(1) as queries:
+            record_vote(choice.pk)
+        sql = queries.captured_queries[0]['sql']
+        self.assertIn('+ 1', sql)  # expects the increment done by the database
+        self.assertNotIn('title', sql)  # expects no other column written
+
+
+class VoteBufferTest(VoteTestMixin, TestCase):  # VoteBuffer test suite
+    def test_concurrent_votes_are_all_counted(self):  # no vote should be lost, whatever the concurrency
+        first, second = self.create_choices()
+        buffer = VoteBuffer(flush_size=10 ** 6, flush_interval=None)  # only flushed explicitly
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: buffer.add(first.pk if i % 3 else second.pk), range(3000)))
+        with self.assertNumQueries(2 + 2):  # one UPDATE per distinct increment, plus the savepoint and its release
+            self.assertEqual(buffer.flush(), 3000)  # expects every vote written
+        first.refresh_from_db()  # refreshes object's state to reflect database
+        second.refresh_from_db()
+        self.assertEqual((first.votes, second.votes), (2000, 1000))
+
+    def test_full_buffer_is_flushed(self):  # reaching the size threshold should write the votes
+        choice, _ = self.create_choices()
+        buffer = VoteBuffer(flush_size=3, flush_interval=None)
+        for _ in range(3):
+            buffer.add(choice.pk)
+        choice.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertEqual((choice.votes, buffer.stats()['pending']), (3, 0))  # expects the votes written
+
+    def test_failed_flush_keeps_votes(self):  # votes should survive a database error
+        choice, _ = self.create_choices()
+        buffer = VoteBuffer(flush_size=100, flush_interval=None)
+        buffer.add(choice.pk)
+        with mock.patch.object(Choice.objects, 'filter', side_effect=RuntimeError('database is down')):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+        self.assertEqual(buffer.flush(), 1)  # expects the vote to be written by the next flush
+
+
+@override_settings(POLLS_VOTE_BUFFER=True, POLLS_VOTE_FLUSH_SIZE=100, POLLS_VOTE_FLUSH_INTERVAL=0.05)
+class VoteBufferIntervalTest(VoteTestMixin, TransactionTestCase):  # write-behind vote path test suite
+    def test_votes_are_written_after_interval(self):  # buffered votes should reach the database on their own
+        choice, _ = self.create_choices()
+        user = User.objects.create_user(username='username')  # creates mock user
+        self.client.force_login(user)  # logs-in in mock user ignoring credentials
+        response = self.client.post(reverse('polls:vote', args=[choice.question_id]), data={'choice': choice.pk},
+                                    SERVER_NAME='localhost', secure=True)
+        self.assertRedirects(response, reverse('polls:results', args=[choice.question_id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(get_vote_buffer().stats()['pending'], 1)  # expects the vote to be buffered at first
+        time.sleep(0.3)  # lets the interval pass
+        choice.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertEqual(choice.votes, 1)  # expects the vote written by then
+
+
+@override_settings(POLLS_VOTE_SHARDS=4)
+class VoteShardTest(VoteTestMixin, TestCase):  # sharded vote counters test suite
+    def setUp(self):
+        cache.clear()  # totals cached by other tests must not leak in
+
+    def test_votes_are_spread_across_shards(self):  # a hot choice's votes should not all hit one row
+        choice, _ = self.create_choices()
+        for _ in range(200):
+            record_vote(choice.pk)
+        self.assertEqual(VoteShard.objects.filter(choice=choice).count(), 4)  # expects every shard used
+        self.assertEqual(choice.total_votes(), 200)  # expects no vote lost
+
+    def test_results_show_totals(self):  # votes still in shards should count on the results page
+        choice, other = self.create_choices()
+        Choice.objects.filter(pk=choice.pk).update(votes=3)  # votes already rolled up
+        for _ in range(5):
+            record_vote(choice.pk)
+        self.assertEqual({c.pk: c.votes for c in ranked_choices(choice.question)}, {choice.pk: 8, other.pk: 0})
+        response = self.client.get(reverse('polls:results', args=[choice.question_id]), SERVER_NAME='localhost',
+                                   secure=True)
+        self.assertContains(response, 'Votes: 8')  # expects the total to be displayed
+
+    def test_rollup_folds_shards_into_choice(self):  # rolling up should keep the total and empty the shards
+        choice, _ = self.create_choices()
+        for _ in range(7):
+            record_vote(choice.pk)
+        call_command('rollup_vote_shards', stdout=mock.MagicMock())
+        choice.refresh_from_db()  # refreshes object's state to reflect database
+        self.assertEqual((choice.votes, choice.total_votes()), (7, 7))  # expects every vote on the choice itself
+        self.assertFalse(VoteShard.objects.exists())  # expects the shards cleared
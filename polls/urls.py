@@ -6,14 +6,22 @@ This file defines the accessible endpoints within the app polls.
 
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'polls'
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),  # app's home view
+    path('page/', views.IndexPageView.as_view(), name='index_page'),  # further page of the home view's list
+    path('search/', views.SearchView.as_view(), name='search'),  # polls matching a search
     path('<int:pk>/', views.DetailView.as_view(), name='detail'),  # details view of specific poll
     path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),  # results view of specific poll
+    path('<int:pk>/stream/', views.stream, name='stream'),  # live vote counts of specific poll
+    path('<int:pk>/activity/', views.ActivityView.as_view(), name='activity'),  # voting activity of specific poll
     path('<int:question_id>/vote/', views.vote, name='vote'),  # submit vote to specific poll
     path('create', views.CreateView.as_view(), name='create'),  # create new poll view
     path('create', views.CreateView.post, name='create_selected'),  # submit newly created poll
+    path('jobs/<int:pk>/', views.JobView.as_view(), name='job'),  # status view of specific poll-creation job
+    path('api/', api.index, name='api_index'),  # page of polls, as JSON
+    path('api/<int:pk>/', api.detail, name='api_detail'),  # specific poll and its albums, as JSON
+    path('api/<int:pk>/results/', api.results, name='api_results'),  # results of specific poll, as JSON
 ]
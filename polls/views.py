@@ -9,17 +9,28 @@ They invoke the templates that will be rendered in return (if applicable) and ha
 that may arise during the handling of the requests.
 """
 
-import os
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect
+from django.core.exceptions import BadRequest
+from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views import generic
 
-from .models import Choice, Question
+from .analytics import vote_activity
+from .availability import empty_years, is_empty
+from .jobs import enqueue
+from .models import Choice, PollJob, Question, VoteRollup
+from .pagecache import cached_page, conditional_page
+from .pagination import keyset_page
+from .results import ranked_choices
+from .search import search_questions
+from .streams import HEADERS, encode_event, vote_counts
+from .votes import record_vote
 
 
 # get parameters used to create new poll
@@ -61,23 +72,84 @@ def get_parameters():
     return genres, years  # return parameters
 
 
+@method_decorator(cached_page, name='dispatch')  # anonymous users get the same pages, see polls/pagecache.py
 class IndexView(generic.ListView):  # poll's app home view
     template_name = 'polls/index.html'  # template to be rendered
     context_object_name = 'question_list'  # object that can be accessed from the template.
 
-    def get_queryset(self):  # returns list of published questions
-        return Question.objects.order_by('-pub_date')  # list ordered, most recent first
+    def get_queryset(self):  # returns one page of published questions, the one after the "after" cursor if given
+        # most recent first, each page starting where the previous one ended instead of counting its way there
+        questions, self.next_cursor = keyset_page(Question.objects.all(), self.request.GET.get('after'),
+                                                  settings.POLLS_PAGE_SIZE)
+        return questions
 
+    def get_context_data(self, **kwargs):  # adds the cursor of the next page, None if this is the last one
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        return context
 
+
+class IndexPageView(IndexView):  # further pages of the poll's app home view, as fragments to append to its list
+    template_name = 'polls/index_page.html'  # template to be rendered
+
+    def render_to_response(self, context, **response_kwargs):  # tells the page where the next fragment is, if any
+        response = super().render_to_response(context, **response_kwargs)
+        response['X-Next-Cursor'] = self.next_cursor or ''
+        return response
+
+
+class SearchView(generic.ListView):  # polls matching a search, by their text, genre or albums
+    template_name = 'polls/search.html'  # template to be rendered
+    context_object_name = 'question_list'  # object that can be accessed from the template.
+
+    def get_queryset(self):  # returns one page of the polls matching the "q" parameter, best match first
+        self.query = self.request.GET.get('q', '')  # terms typed by the user
+        page = self.request.GET.get('page', '1')  # number of the page, starting from 1
+        if not page.isdigit() or int(page) < 1:
+            raise BadRequest(f'Invalid page: {page!r}')
+        self.page = int(page)
+        questions, self.has_next = search_questions(self.query, self.page, settings.POLLS_PAGE_SIZE)
+        return questions
+
+    def get_context_data(self, **kwargs):  # adds the search terms and where the previous and next pages are
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.query
+        context['previous_page'] = self.page - 1 if self.page > 1 else None
+        context['next_page'] = self.page + 1 if self.has_next else None
+        return context
+
+
+@method_decorator(conditional_page, name='dispatch')  # 304 if the poll has not changed since the last visit
+@method_decorator(cached_page, name='dispatch')  # anonymous users get the same pages, see polls/pagecache.py
 class DetailView(generic.DetailView):  # details view of specific poll
     model = Question  # Question instance from models
     template_name = 'polls/detail.html'  # template to be rendered
 
 
+@method_decorator(conditional_page, name='dispatch')  # 304 if the poll has not changed since the last visit
+@method_decorator(cached_page, name='dispatch')  # anonymous users get the same pages, see polls/pagecache.py
 class ResultsView(generic.DetailView):  # results view of specific poll
     model = Question  # Question instance from models
     template_name = 'polls/results.html'  # template to be rendered
 
+    def get_context_data(self, **kwargs):  # adds the choices, ranked by the database and cached until the next vote
+        context = super().get_context_data(**kwargs)
+        context['choices'] = ranked_choices(self.object)
+        return context
+
+
+@method_decorator(cached_page, name='dispatch')  # anonymous users get the same pages, see polls/pagecache.py
+class ActivityView(generic.DetailView):  # voting activity view of specific poll
+    model = Question  # Question instance from models
+    template_name = 'polls/activity.html'  # template to be rendered
+
+    def get_context_data(self, **kwargs):  # adds the hourly and daily totals, never the individual votes
+        context = super().get_context_data(**kwargs)
+        now = timezone.now()
+        context['hourly'] = vote_activity(self.object, VoteRollup.HOUR, now - timedelta(days=2))  # last 48 hours
+        context['daily'] = vote_activity(self.object, VoteRollup.DAY, now - timedelta(days=30))  # last 30 days
+        return context
+
 
 @method_decorator(login_required, name='get')  # only logged-in users can access this view
 class CreateView(generic.CreateView):  # create new poll view
@@ -88,88 +160,52 @@ class CreateView(generic.CreateView):  # create new poll view
 
     def get(self, request, *args, **kwargs):  # handles GET requests
         context = {'genres': self.genres, 'years': self.years}  # sends lists of genres and years to template
+        context['empty_years'] = empty_years  # years without albums, only read if the form's options are rendered
         return render(request, self.template_name, context)  # renders the template
 
     def post(self, request, **kwargs):  # handles POST requests
         genre = request.POST['genre']  # genre selected by user in the creation form
         year = request.POST['year']  # year selected by user in the creation form
 
-        # Discogs API for Python, for more information access:
-        # https://www.discogs.com/developers and https://github.com/joalla/discogs_client
-        import discogs_client
+        # only genres and years offered by the creation form can be used
+        if genre not in self.genres or not year.isnumeric() or int(year) not in self.years:
+            # render no_matches template
+            return render(request, 'polls/no_matches.html', context={'genre': genre, 'year': year})
 
-        # authenticated queries to Discogs API require a personal user token.
-        # here, the token is retrieved from a git-ignored file at the root of the project.
-        # even without authentication, it is still possible to query their database,
-        # but some pieces of information may be missing from the results.
-        d = discogs_client.Client('dorsetMusicCollection/0.1',
-                                  user_token=os.getenv('DISCOGS_USER_TOKEN'))
+        refresh = bool(request.POST.get('refresh'))  # whether an existing poll should be crawled again
 
-        # query Discogs' database with provided genre and year
-        results = d.search(type='master', style=genre, year=year)
+        # there is only one poll per genre and year, if it already exists there is no need to query Discogs
+        question = Question.objects.filter(genre=genre, year=year).first()
+        if question is not None and not refresh:
+            # renders template for details view of the existing poll
+            return HttpResponseRedirect(reverse('polls:detail', kwargs={'pk': question.pk}))
 
-        if len(results) == 0:  # if query returned empty
+        # Discogs is known to have no albums for this combination, see polls/availability.py, no need to query it
+        if question is None and is_empty(genre, int(year)):
             # render no_matches template
             return render(request, 'polls/no_matches.html', context={'genre': genre, 'year': year})
-        else:  # if query is not empty
-            self.model = Question.objects.create()  # create an entry in the database for this new poll
-            self.model.genre = genre  # set its genre
-            self.model.year = year  # set its year
-            self.model.text = f'What is the best {genre} album of {year}?'  # set its text
-            self.model.save()  # save it to database
-
-            # combines all results' pages into one list
-            all_pages = [(results.page(i)) for i in range(results.pages)]
-            # only master release records from each page in new list
-            all_pages_flattened = [master for page in all_pages for master in page]
-
-            masters = {}
-            for master in all_pages_flattened:
-
-                artist = master.title.split(' - ')[0]  # set artist from master
-                artists = [v[4] for k, v in masters.items()]  # list of artists being handled
-
-                if artist in artists:  # checks if the current artist is already in the list
-                    artist_index = artists.index(artist)
-
-                    # if current artist is already in the list, keep only their most popular release
-                    if master.data['community']['have'] + master.data['community']['want'] > \
-                            [v[0] for k, v in masters.items()][artist_index]:
-                        artists.pop(artist_index)
-                        masters.pop([master_id for master_id in masters][artist_index])
-
-                # if current artist is not yet in the list, add the release
-                if artist not in artists:
-                    masters[master.id] = [
-                        master.data['community']['have'] + master.data['community']['want'],  # album's popularity
-                        master.data['country'],  # album's release country
-                        master.data['cover_image'],  # album's cover image
-                        master.title.split(' - ')[1],  # album's title
-                        artist,  # album's artist
-                        master.year,  # album's release year
-                        "/".join(master.data['style']),  # album's list of genres
-                        "https://www.discogs.com" + master.data['uri'],  # album's url on Discogs website
-                    ]
-            masters = sorted(masters.items(), key=lambda x: x[1][0])  # sort all albums by popularity
-
-            top_10 = masters[len(masters) - 10:]  # only the 10 most popular
-
-            # creates one database entry for each album in the top 10
-            for release in top_10:
-                choice = Choice(
-                    country=release[1][1],
-                    image=release[1][2],
-                    title=release[1][3],
-                    artist=release[1][4],
-                    year=release[1][5],
-                    genres=release[1][6],
-                    url=release[1][7],
-                    question_id=self.model.pk,
-                )
-                choice.save()  # saves to database
 
+        # the poll is created in the background, so that slow Discogs queries do not hold up this request
+        job = enqueue(genre, int(year), refresh=refresh)
+
+        # renders template for status view of the poll-creation job
+        return HttpResponseRedirect(reverse('polls:job', kwargs={'pk': job.pk}))
+
+
+class JobView(generic.DetailView):  # status view of specific poll-creation job
+    model = PollJob  # PollJob instance from models
+    template_name = 'polls/job.html'  # template to be rendered
+
+    def get(self, request, *args, **kwargs):  # handles GET requests
+        job = self.get_object()  # if job cannot be found renders 404 page
+        if job.status == PollJob.DONE:
+            if job.question_id is None:  # if query returned empty
+                # render no_matches template
+                return render(request, 'polls/no_matches.html', context={'genre': job.genre, 'year': job.year})
             # renders template for details view of the newly created poll
-            return HttpResponseRedirect(reverse('polls:detail', kwargs={'pk': self.model.pk}))
+            return HttpResponseRedirect(reverse('polls:detail', kwargs={'pk': job.question_id}))
+        # queued, running or failed, renders the job's status
+        return render(request, self.template_name, context={'job': job})
 
 
 @login_required  # only logged-in users can access this function
@@ -183,7 +219,17 @@ def vote(request, question_id):  # handles vote submission
             'error_message': "You didn't select a choice.",  # error message to be added
         })
     else:  # once accepted
-        selected_choice.votes += 1  # increases number of votes by one
-        selected_choice.save()  # saves to database
+        record_vote(selected_choice.pk, question.pk)  # increases number of votes by one, and logs the vote
         # renders template for results view of the current poll
         return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+
+
+# answers the live results stream of a poll with its current vote counts only, then lets the browser reconnect
+# under ASGI the stream itself is served ahead of Django, see polls/streams.py, so this only runs under WSGI
+def stream(request, pk):
+    question = get_object_or_404(Question, pk=pk)  # if question cannot be found renders 404 page
+    body = encode_event('snapshot', vote_counts(question), retry=5000)  # browsers poll every 5 seconds
+    response = HttpResponse(body)
+    for name, value in HEADERS:
+        response[name.decode()] = value.decode()
+    return response
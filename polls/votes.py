@@ -0,0 +1,189 @@
+"""
+This file defines how votes are counted by the app polls.
+By default every vote is a single UPDATE that increments the counter inside the database, so
+concurrent votes never overwrite each other and each one is stored before the voter gets an answer.
+
+For choices so hot that every voter queues for the lock on their row, votes can be spread across
+POLLS_VOTE_SHARDS counter rows picked at random, which are added up when read and folded back
+into the choice by the management command "rollup_vote_shards".
+
+For very busy polls, votes can also be buffered instead: each process adds them up in memory and
+writes them in batches, one UPDATE per distinct increment, once enough have piled up or a given
+interval has passed. This trades durability for throughput: if the process dies, at most
+POLLS_VOTE_FLUSH_SIZE votes, or POLLS_VOTE_FLUSH_INTERVAL seconds' worth of them, are lost.
+
+Whichever way they are counted, votes are also appended to the vote log (see polls/analytics.py)
+while POLLS_VOTE_EVENTS is on, in the same transaction as their increment. Once stored, they drop
+the cached ranking of their poll (see polls/results.py).
+"""
+
+import atexit
+import collections
+import contextlib
+import logging
+import random
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Choice, VoteEvent, VoteShard
+from .results import invalidate_rankings
+from .streams import get_broadcaster
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:  # per-process buffer of votes, written to the database in batches
+    def __init__(self, flush_size=100, flush_interval=1.0):
+        self.flush_size = flush_size  # number of buffered votes that triggers a flush
+        self.flush_interval = flush_interval  # seconds after the first buffered vote that trigger a flush
+        self.pending = collections.Counter()  # choice id -> votes not written yet
+        self.size = 0  # total of the pending votes
+        self.events = []  # vote events not written yet, logged along with the pending votes
+        self.questions = set()  # ids of the questions of the pending votes, whose rankings are dropped once written
+        self.flushes = 0  # number of batches written by this process
+        self.flushed = 0  # number of votes written by this process
+        self._timer = None  # pending interval flush, if any
+        self._lock = threading.Lock()  # protects the pending votes and the counters
+
+    # buffers votes for a choice, flushing if the buffer is full
+    # if the question is given and POLLS_VOTE_EVENTS is on, the votes are logged too once written
+    def add(self, choice_id, votes=1, question_id=None):
+        now = timezone.now()
+        with self._lock:
+            self.pending[choice_id] += votes
+            self.size += votes
+            if question_id is not None:
+                self.questions.add(question_id)
+            if question_id is not None and settings.POLLS_VOTE_EVENTS:
+                self.events.extend(VoteEvent(question_id=question_id, choice_id=choice_id, created=now)
+                                   for _ in range(votes))
+            full = self.size >= self.flush_size
+            if not full and self._timer is None and self.flush_interval is not None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+                self._timer.daemon = True  # must not keep the process alive, it is flushed at exit anyway
+                self._timer.start()
+        if full:
+            self.flush()
+
+    # writes every pending vote to the database in a single transaction, returns the number of votes written
+    # if writing fails, the votes are put back in the buffer for the next flush
+    def flush(self):
+        with self._lock:
+            pending, self.pending, self.size = self.pending, collections.Counter(), 0
+            events, self.events = self.events, []
+            questions, self.questions = self.questions, set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        by_increment = collections.defaultdict(list)  # increment -> ids of the choices that receive it
+        for choice_id, votes in pending.items():
+            by_increment[votes].append(choice_id)
+        try:
+            with transaction.atomic():
+                for votes, choice_ids in by_increment.items():
+                    Choice.objects.filter(pk__in=choice_ids).update(votes=F('votes') + votes)
+                VoteEvent.objects.bulk_create(events)
+        except Exception:
+            with self._lock:
+                self.pending.update(pending)
+                self.size += sum(pending.values())
+                self.events[:0] = events
+                self.questions.update(questions)
+            raise
+        invalidate_rankings(*questions, vote=True)
+
+        written = sum(pending.values())
+        with self._lock:
+            self.flushes += 1
+            self.flushed += written
+        logger.debug('Flushed %d votes for %d choices', written, len(pending))
+        return written
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:  # the votes stay buffered and are written by the next flush
+            logger.exception('Could not flush buffered votes')
+        finally:
+            connection.close()  # the timer's thread must not keep a database connection open
+
+    def stats(self):  # counters of this process
+        return {'pending': self.size, 'flushes': self.flushes, 'flushed': self.flushed}
+
+
+_buffers = {}  # one buffer per configuration, so that tests overriding the settings get their own
+_buffers_lock = threading.Lock()
+
+
+# returns the vote buffer configured in the settings, or None if votes are written straight away
+def get_vote_buffer():
+    if not settings.POLLS_VOTE_BUFFER:
+        return None
+    key = (settings.POLLS_VOTE_FLUSH_SIZE, settings.POLLS_VOTE_FLUSH_INTERVAL)
+    with _buffers_lock:
+        if key not in _buffers:
+            _buffers[key] = VoteBuffer(*key)
+            atexit.register(_buffers[key].flush)  # votes still buffered when the process exits are not lost
+        return _buffers[key]
+
+
+# counts one vote for a choice, either as an atomic increment in the database or through the vote buffer
+# if POLLS_VOTE_SHARDS is above 1, the increment goes to one of the choice's shards instead
+# if the question is given, its cached ranking is dropped and the vote is pushed to its live results,
+# and if POLLS_VOTE_EVENTS is on the vote is logged too
+def record_vote(choice_id, question_id=None):
+    buffer = get_vote_buffer()
+    if buffer is not None:
+        buffer.add(choice_id, question_id=question_id)
+        if question_id is not None:
+            get_broadcaster().publish(question_id, choice_id)  # pushed live, even if written a bit later
+        return
+    logged = question_id is not None and settings.POLLS_VOTE_EVENTS
+    # the vote is either both counted and logged or neither, a vote that is only counted needs no transaction
+    with transaction.atomic() if logged else contextlib.nullcontext():
+        if settings.POLLS_VOTE_SHARDS > 1:
+            add_to_shard(choice_id, random.randrange(settings.POLLS_VOTE_SHARDS))
+        else:
+            # the increment happens inside the database, so concurrent votes cannot overwrite each other,
+            # and only the votes column is written
+            Choice.objects.filter(pk=choice_id).update(votes=F('votes') + 1)
+        if logged:
+            VoteEvent.objects.create(question_id=question_id, choice_id=choice_id)
+    if question_id is not None:
+        invalidate_rankings(question_id, vote=True)  # only once the vote is stored, so it cannot be cached away
+        # pushed to the live results of the poll, sharded votes only show in its counts once its ranking expires
+        get_broadcaster().publish(question_id, choice_id, counted=settings.POLLS_VOTE_SHARDS <= 1)
+
+
+# adds one vote to the given shard of a choice, creating the shard the first time it is used
+def add_to_shard(choice_id, shard):
+    if VoteShard.objects.filter(choice_id=choice_id, shard=shard).update(votes=F('votes') + 1) == 0:
+        try:
+            with transaction.atomic():
+                VoteShard.objects.create(choice_id=choice_id, shard=shard, votes=1)
+        except IntegrityError:  # created by a concurrent vote meanwhile
+            VoteShard.objects.filter(choice_id=choice_id, shard=shard).update(votes=F('votes') + 1)
+
+
+# moves the votes counted by shards into their choices, in a single transaction, and returns how many
+# shards are locked while they are read, so no vote can slip in between reading and clearing them
+def rollup_vote_shards():
+    with transaction.atomic():
+        shards = list(VoteShard.objects.select_for_update().filter(votes__gt=0))
+        per_choice = collections.Counter()
+        for shard in shards:
+            per_choice[shard.choice_id] += shard.votes
+        by_increment = collections.defaultdict(list)  # increment -> ids of the choices that receive it
+        for choice_id, votes in per_choice.items():
+            by_increment[votes].append(choice_id)
+        for votes, choice_ids in by_increment.items():
+            Choice.objects.filter(pk__in=choice_ids).update(votes=F('votes') + votes)
+        VoteShard.objects.filter(pk__in=[shard.pk for shard in shards]).delete()
+    return sum(per_choice.values())